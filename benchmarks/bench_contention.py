@@ -0,0 +1,67 @@
+"""
+Lock contention: throughput of a mixed read/write workload across thread counts.
+
+    python -m benchmarks.bench_contention --threads 1 2 4 8 --ops 2000 --writes 0.3
+"""
+import argparse
+import random
+import threading
+import time
+
+from service.file_system_manager_imp import FileSystemManagerImpl
+
+SUBTREES = 16
+
+
+def build_tree(locking: str, files_per_subtree: int) -> FileSystemManagerImpl:
+    manager = FileSystemManagerImpl("root", trigram_index=True, locking=locking)
+    for subtree in range(SUBTREES):
+        manager.add("/", "team{}".format(subtree), True)
+        for i in range(files_per_subtree):
+            manager.add("/team{}".format(subtree), "report{}_{}.txt".format(subtree, i), False)
+    return manager
+
+
+def run(manager: FileSystemManagerImpl, threads: int, ops: int, write_ratio: float) -> float:
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        # each thread mostly stays in its own subtree, which is where subtree locking pays off
+        home = "/team{}".format(seed % SUBTREES)
+        barrier.wait()
+        for step in range(ops):
+            if rng.random() < write_ratio:
+                manager.add(home, "new{}_{}.txt".format(seed, step), False)
+            elif rng.random() < 0.5:
+                manager.list_contents(home, limit=50)
+            else:
+                manager.search_file_like_match(home, "report")
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return threads * ops / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=2000, help="operations per thread")
+    parser.add_argument("--writes", type=float, default=0.3, help="fraction of operations that write")
+    parser.add_argument("--files", type=int, default=200, help="files per subtree")
+    args = parser.parse_args()
+
+    print("{:>8} {:>14} {:>14}".format("threads", "global ops/s", "subtree ops/s"))
+    for threads in args.threads:
+        results = [run(build_tree(locking, args.files), threads, args.ops, args.writes)
+                   for locking in ("global", "subtree")]
+        print("{:>8} {:>14.0f} {:>14.0f}".format(threads, *results))
+
+
+if __name__ == "__main__":
+    main()
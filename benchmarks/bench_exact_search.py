@@ -0,0 +1,62 @@
+"""
+Exact search: name index + interval labels vs the breadth-first scan.
+
+    python -m benchmarks.bench_exact_search --nodes 100000 --queries 200
+"""
+import argparse
+import random
+import time
+
+from service.file_system_manager_imp import FileSystemManagerImpl
+from service.traversal import find_exact_file
+
+
+def build_tree(nodes: int, seed: int) -> tuple:
+    rng = random.Random(seed)
+    manager = FileSystemManagerImpl("root")
+    folders = ["root"]
+    files = []
+    for i in range(nodes):
+        parent = rng.choice(folders)
+        if rng.random() < 0.1:
+            name = "folder{}".format(i)
+            manager.add_file_or_folder(parent, name, True)
+            folders.append(name)
+        else:
+            name = "file{}.txt".format(i)
+            manager.add_file_or_folder(parent, name, False)
+            files.append(name)
+    return manager, folders, files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    manager, folders, files = build_tree(args.nodes, args.seed)
+    rng = random.Random(args.seed)
+    queries = [(rng.choice(folders), rng.choice(files)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    indexed = [manager.search_file_exact_match(folder, name) for folder, name in queries]
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scanned = []
+    for folder, name in queries:
+        item = find_exact_file(manager._find_folder(folder), name)
+        scanned.append(item.get_name if item else None)
+    scan_time = time.perf_counter() - start
+
+    assert indexed == scanned, "indexed search disagrees with the scan"
+    print("nodes={} queries={}".format(args.nodes, args.queries))
+    print("  indexed: {:10.3f} us/query".format(indexed_time / args.queries * 1e6))
+    print("  bfs:     {:10.3f} us/query".format(scan_time / args.queries * 1e6))
+    print("  speedup: {:10.1f}x".format(scan_time / indexed_time if indexed_time else float("inf")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Write latency and throughput with the journal under each fsync policy.
+
+    python -m benchmarks.bench_journal --threads 1 4 16 --ops 500
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+from service.file_system_manager_imp import FileSystemManagerImpl
+from storage.journal import SYNC_ALWAYS, SYNC_GROUP, SYNC_OS, Journal
+
+
+def run(sync: str, threads: int, ops: int, group_commit_ms: float) -> tuple:
+    with tempfile.TemporaryDirectory() as directory, \
+            Journal(directory, sync=sync, group_commit_ms=group_commit_ms) as journal:
+        manager = FileSystemManagerImpl("root", journal=journal)
+        for seed in range(threads):
+            manager.add("/", "writer{}".format(seed), True)
+        barrier = threading.Barrier(threads + 1)
+        latencies = [[] for _ in range(threads)]
+
+        def worker(seed: int) -> None:
+            home = "/writer{}".format(seed)
+            barrier.wait()
+            for step in range(ops):
+                started = time.perf_counter()
+                manager.add(home, "file{}.txt".format(step), False)
+                latencies[seed].append(time.perf_counter() - started)
+
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    merged = sorted(latency for per_thread in latencies for latency in per_thread)
+    p50 = merged[len(merged) // 2]
+    p99 = merged[min(len(merged) - 1, len(merged) * 99 // 100)]
+    return threads * ops / elapsed, p50 * 1000, p99 * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--ops", type=int, default=500, help="adds per thread")
+    parser.add_argument("--group-ms", type=float, default=5.0, help="group commit interval")
+    args = parser.parse_args()
+
+    print("{:>7} {:>8} {:>10} {:>9} {:>9}".format("sync", "threads", "ops/s", "p50 ms", "p99 ms"))
+    for sync in (SYNC_ALWAYS, SYNC_GROUP, SYNC_OS):
+        for threads in args.threads:
+            print("{:>7} {:>8} {:>10.0f} {:>9.3f} {:>9.3f}".format(
+                sync, threads, *run(sync, threads, args.ops, args.group_ms)))
+
+
+if __name__ == "__main__":
+    main()
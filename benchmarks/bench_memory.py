@@ -0,0 +1,81 @@
+"""
+Memory per node: object model, full manager (with its indexes), columnar store.
+
+    python -m benchmarks.bench_memory --nodes 1000000 --fanout 20
+"""
+import argparse
+import gc
+import tracemalloc
+
+from models.columnar import ColumnarTree
+from models.file import File
+from models.folder import Folder
+from service.file_system_manager_imp import FileSystemManagerImpl
+
+
+def build_objects(nodes: int, fanout: int) -> Folder:
+    root = Folder("root")
+    folders = [root]
+    created = 1
+    cursor = 0
+    while created < nodes:
+        parent = folders[cursor // fanout]
+        if cursor % 5 == 0:
+            child = Folder("dir{}".format(created))
+            folders.append(child)
+        else:
+            # repeated file names across folders, as in real trees
+            child = File("file{}.txt".format(created % 1000))
+        parent.add_item(child)
+        created += 1
+        cursor += 1
+    return root
+
+
+def build_manager(nodes: int, fanout: int) -> FileSystemManagerImpl:
+    manager = FileSystemManagerImpl("root")
+    folders = ["root"]
+    created = 1
+    cursor = 0
+    while created < nodes:
+        parent = folders[cursor // fanout]
+        if cursor % 5 == 0:
+            name = "dir{}".format(created)
+            manager.add_file_or_folder(parent, name, True)
+            folders.append(name)
+        else:
+            manager.add_file_or_folder(parent, "file{}.txt".format(created % 1000), False)
+        created += 1
+        cursor += 1
+    return manager
+
+
+def measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, used
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=200000)
+    parser.add_argument("--fanout", type=int, default=20)
+    args = parser.parse_args()
+
+    root, objects = measure(lambda: build_objects(args.nodes, args.fanout))
+    _, columnar = measure(lambda: ColumnarTree.from_tree(root))
+    del root
+    _, manager = measure(lambda: build_manager(args.nodes, args.fanout))
+
+    print("nodes={}".format(args.nodes))
+    print("  objects:  {:8.1f} bytes/node".format(objects / args.nodes))
+    print("  manager:  {:8.1f} bytes/node (objects + name index + labels)".format(manager / args.nodes))
+    print("  columnar: {:8.1f} bytes/node".format(columnar / args.nodes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Latency percentiles, throughput and nodes visited for every manager operation, on synthetic trees.
+
+    python -m benchmarks.bench_operations --shape skewed --nodes 1000000
+    python -m benchmarks.bench_operations --shape all --nodes 200000 --json results.json
+
+Shapes: "balanced" (every folder has --fanout children), "wide" (a handful of
+huge folders), "deep" (chains of --depth nested folders) and "skewed" (most
+of the tree under a few folders, as in real file systems). The samples come
+from the manager's own instrumentation, so "visited" is what a regression in
+lookup or search cost shows up in.
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from service.batch import AddOperation, MoveOperation
+from service.file_system_manager_imp import INSTRUMENTED_OPERATIONS, FileSystemManagerImpl
+from service.metrics import InMemoryMetrics
+
+SHAPES = ("balanced", "wide", "deep", "skewed")
+# items per add_many call while building
+BUILD_BATCH = 10000
+# items per call for the bulk operations
+BULK_SIZE = 100
+
+
+def generate(shape: str, nodes: int, fanout: int, depth: int, seed: int) -> Iterator[Tuple[str, str, bool]]:
+    """Yields (parent, name, is_folder) in an order where parents come first."""
+    rng = random.Random(seed)
+    folders = ["root"]
+    for created in range(1, nodes):
+        if shape == "balanced":
+            parent = folders[(created - 1) // fanout]
+            is_folder = created % 5 == 0
+        elif shape == "wide":
+            parent = folders[0] if len(folders) <= 10 else rng.choice(folders)
+            is_folder = len(folders) <= 10
+        elif shape == "deep":
+            # a new chain from the root every depth folders, four files per level
+            is_folder = created % 5 == 0
+            parent = folders[-1]
+            if is_folder and (len(folders) - 1) % depth == 0:
+                parent = "root"
+        elif shape == "skewed":
+            parent = folders[int(len(folders) * rng.random() ** 4)]
+            is_folder = rng.random() < 0.1
+        else:
+            raise ValueError("shape must be one of {}".format(", ".join(SHAPES)))
+        if is_folder:
+            name = "dir{}".format(created)
+            folders.append(name)
+        else:
+            # repeated file names across folders, as in real trees
+            name = "file{}.txt".format(created % 1000)
+        yield parent, name, is_folder
+
+
+def build(shape: str, nodes: int, fanout: int, depth: int, seed: int) -> Tuple[FileSystemManagerImpl, InMemoryMetrics]:
+    metrics = InMemoryMetrics()
+    manager = FileSystemManagerImpl("root", completion_index=True, metrics=metrics)
+    items = generate(shape, nodes, fanout, depth, seed)
+    while True:
+        batch = list(islice(items, BUILD_BATCH))
+        if not batch:
+            break
+        manager.add_many(batch)
+    return manager, metrics
+
+
+def folders_of(manager: FileSystemManagerImpl) -> List[str]:
+    return [name for name, nodes in manager._name_index.items()
+            if name.startswith("dir") and any(node.get_parent is not None for node in nodes)]
+
+
+def workload(manager: FileSystemManagerImpl, rng: random.Random, repeat: int,
+             heavy_repeat: int) -> List[Tuple[str, Callable[[], object]]]:
+    """One closure per call, every operation included, in a shuffled order."""
+    folders = folders_of(manager) or ["root"]
+    counter = iter(range(10 ** 9))
+
+    def folder() -> str:
+        return rng.choice(folders)
+
+    def path(name: str) -> str:
+        return manager._path_of(manager._find_folder(name))
+
+    def fresh(parent: str) -> str:
+        # setup for the measured call, through the class so it is not sampled itself
+        name = "bench{}.dat".format(next(counter))
+        FileSystemManagerImpl.add_file_or_folder(manager, parent, name, False)
+        return name
+
+    def batch(size: int) -> list:
+        return [(folder(), "bench{}.dat".format(next(counter)), False) for _ in range(size)]
+
+    def substring() -> str:
+        return "file{}".format(rng.randrange(100))
+
+    calls = {
+        "add_file_or_folder": lambda: manager.add_file_or_folder(folder(), "bench{}.dat".format(next(counter)), False),
+        "add": lambda: manager.add(path(folder()), "bench{}.dat".format(next(counter)), False),
+        "add_many": lambda: manager.add_many(batch(BULK_SIZE)),
+        "move_file_or_folder": lambda: manager.move_file_or_folder(fresh(folder()), folder()),
+        "move": lambda: manager.move(manager._path_of(manager._lookup(fresh(folder()), False)), path(folder())),
+        "move_many": lambda: manager.move_many([(fresh(folder()), folder()) for _ in range(BULK_SIZE)]),
+        "apply_batch": lambda: manager.apply_batch(
+            [AddOperation(*item) for item in batch(BULK_SIZE // 2)]
+            + [MoveOperation(fresh(folder()), folder()) for _ in range(BULK_SIZE // 2)]),
+        "rename_item": lambda: manager.rename_item(fresh(folder()), "bench{}.dat".format(next(counter))),
+        "delete_item": lambda: manager.delete_item(fresh(folder())),
+        "set_file_content": lambda: manager.set_file_content(fresh(folder()), "x" * 4096),
+        "write_file": lambda: manager.write_file(fresh(folder()), 0, b"x" * 4096),
+        "list_contents": lambda: manager.list_contents(folder(), limit=100),
+        "iter_contents": lambda: list(islice(manager.iter_contents(folder()), 100)),
+        "search_file_exact_match": lambda: manager.search_file_exact_match(folder(), "file{}.txt".format(
+            rng.randrange(1000))),
+        "search_file_like_match": lambda: manager.search_file_like_match(folder(), substring()),
+        "search_file_like_match_many": lambda: manager.search_file_like_match_many(
+            folder(), [substring() for _ in range(4)]),
+        "search_files": lambda: list(manager.search_files(folder(), "file1*.txt", limit=50)),
+        "list_matching_files": lambda: manager.list_matching_files(folder(), "file1*.txt", limit=50),
+        "complete": lambda: manager.complete("file{}".format(rng.randrange(10)), folder()),
+        "get_stats": lambda: manager.get_stats(folder()),
+        "list_directory_structure": lambda: manager.list_directory_structure(),
+        "iter_directory_structure": lambda: sum(1 for _ in manager.iter_directory_structure()),
+    }
+    missing = set(INSTRUMENTED_OPERATIONS) - set(calls)
+    assert not missing, "no workload for {}".format(", ".join(sorted(missing)))
+    heavy = ("list_directory_structure", "iter_directory_structure")
+    plan = [(name, call) for name, call in calls.items() for _ in range(heavy_repeat if name in heavy else repeat)]
+    rng.shuffle(plan)
+    return plan
+
+
+def measure_memory(shape: str, args) -> float:
+    gc.collect()
+    tracemalloc.start()
+    manager, _ = build(shape, args.nodes, args.fanout, args.depth, args.seed)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del manager
+    return used / args.nodes
+
+
+def run(shape: str, args) -> Dict[str, object]:
+    result: Dict[str, object] = {"shape": shape, "nodes": args.nodes}
+    if args.memory:
+        result["bytes_per_node"] = measure_memory(shape, args)
+    start = time.perf_counter()
+    manager, metrics = build(shape, args.nodes, args.fanout, args.depth, args.seed)
+    result["build_seconds"] = time.perf_counter() - start
+    metrics.clear()
+    for _, call in workload(manager, random.Random(args.seed), args.repeat, args.heavy_repeat):
+        call()
+    result["operations"] = {name: dict(stats._asdict(), throughput=stats.throughput)
+                            for name, stats in metrics.summary().items()}
+    return result
+
+
+def report(result: Dict[str, object]) -> None:
+    print("shape={} nodes={}".format(result["shape"], result["nodes"]))
+    print("  build:  {:10.2f} s ({:.0f} nodes/s)".format(
+        result["build_seconds"], result["nodes"] / result["build_seconds"]))
+    if "bytes_per_node" in result:
+        print("  memory: {:10.1f} bytes/node".format(result["bytes_per_node"]))
+    print("  {:<28} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "operation", "calls", "p50 us", "p90 us", "p99 us", "max us", "ops/s", "visited"))
+    for name, stats in result["operations"].items():
+        print("  {:<28} {:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.0f} {:>10.1f}".format(
+            name, stats["count"], stats["p50"] * 1e6, stats["p90"] * 1e6, stats["p99"] * 1e6,
+            stats["max"] * 1e6, stats["throughput"], stats["mean_visited"]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shape", choices=SHAPES + ("all",), default="all")
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--heavy-repeat", type=int, default=3,
+                        help="calls of the operations that render the whole tree")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the traced build that measures memory per node")
+    parser.add_argument("--json", help="also write the results to this file, for comparing runs")
+    args = parser.parse_args()
+
+    results = []
+    for shape in SHAPES if args.shape == "all" else (args.shape,):
+        result = run(shape, args)
+        report(result)
+        results.append(result)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
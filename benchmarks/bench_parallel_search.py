@@ -0,0 +1,65 @@
+"""
+Like-match search: serial tree scan vs the process pool, across worker counts.
+
+    python -m benchmarks.bench_parallel_search --files 1000000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import random
+import time
+
+from service.batch import AddOperation
+from service.file_system_manager_imp import FileSystemManagerImpl
+from service.parallel_search import ParallelSearch
+from service.traversal import find_match_files
+
+
+def build_tree(files: int, seed: int) -> FileSystemManagerImpl:
+    rng = random.Random(seed)
+    manager = FileSystemManagerImpl("root")
+    folders = ["/"]
+    operations = []
+    for i in range(files + files // 10):
+        parent = rng.choice(folders)
+        if i % 11 == 0:
+            name = "folder{}".format(i)
+            folders.append(parent.rstrip("/") + "/" + name)
+            operations.append(AddOperation(parent, name, True))
+        else:
+            operations.append(AddOperation(parent, "report_{}_{}.txt".format(rng.randrange(1000), i), False))
+    manager.apply_batch(operations)
+    return manager
+
+
+def timed(search, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        search()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--pattern", default="_42")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    manager = build_tree(args.files, args.seed)
+    serial = timed(lambda: find_match_files(manager.root, args.pattern), args.repeat)
+    print("files={} cores={}".format(args.files, os.cpu_count()))
+    print("  serial:     {:8.3f} s".format(serial))
+    for workers in args.workers:
+        with ParallelSearch(workers=workers, threshold=0) as parallel_search:
+            manager._parallel_search = parallel_search
+            # flattening the tree and starting the pool happen off the query path
+            parallel_search.rebuild(manager.root, manager._version)
+            assert manager.search_file_like_match("/", args.pattern) == find_match_files(manager.root, args.pattern)
+            elapsed = timed(lambda: manager.search_file_like_match("/", args.pattern), args.repeat)
+        print("  {:2d} workers: {:8.3f} s ({:.2f}x)".format(workers, elapsed, serial / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Startup cost: loading a binary snapshot versus replaying one add per node.
+
+    python -m benchmarks.bench_snapshot --nodes 1000000 --fanout 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_memory import build_manager
+from service.file_system_manager_imp import FileSystemManagerImpl
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1_000_000)
+    parser.add_argument("--fanout", type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    manager = build_manager(args.nodes, args.fanout)
+    replay = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.snap")
+        started = time.perf_counter()
+        manager.save_snapshot(path)
+        save = time.perf_counter() - started
+        size = os.path.getsize(path)
+
+        loaded = FileSystemManagerImpl("root")
+        started = time.perf_counter()
+        loaded.load_snapshot(path)
+        load = time.perf_counter() - started
+
+    print("nodes={}".format(args.nodes))
+    print("  replay: {:8.2f} s".format(replay))
+    print("  save:   {:8.2f} s ({:.1f} bytes/node on disk)".format(save, size / args.nodes))
+    print("  load:   {:8.2f} s ({:.1f}x faster than replay)".format(load, replay / load))
+
+
+if __name__ == "__main__":
+    main()
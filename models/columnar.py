@@ -0,0 +1,216 @@
+import sys
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from models.file import File
+from models.file_system_item import FileSystemItem
+from models.folder import Folder, FolderStats
+
+NO_PARENT = -1
+KIND_FILE = 0
+KIND_FOLDER = 1
+
+
+class ColumnarTree:
+    """
+    Read-only tree stored column by column in flat arrays instead of one
+    Python object per node.
+
+    Node ids are assigned breadth-first, so the children of every folder
+    occupy one contiguous id range [first_child, first_child + child_count).
+    Names live once in a string table; each node stores a 4-byte id into it.
+    Nodes are reached through lightweight handles (ColumnarFolder and
+    ColumnarFile) that are created on demand and expose the same
+    get_name / get_items / get_item / get_parent API as the object model, so
+    tree walks and FileSystemSnapshot work on either representation.
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self.name_ids = array("I")
+        self.parents = array("i")
+        self.kinds = bytearray()
+        self.first_child = array("I")
+        self.child_counts = array("I")
+
+    def __len__(self) -> int:
+        return len(self.name_ids)
+
+    def intern(self, name: str) -> int:
+        string_id = self._string_ids.get(name)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(sys.intern(name))
+            self._string_ids[name] = string_id
+        return string_id
+
+    def append(self, name: str, parent: int, is_folder: bool) -> int:
+        """
+        Appends a node and returns its id. Nodes must arrive breadth-first,
+        which keeps every folder's children contiguous.
+        """
+        node_id = len(self.name_ids)
+        self.name_ids.append(self.intern(name))
+        self.parents.append(parent)
+        self.kinds.append(KIND_FOLDER if is_folder else KIND_FILE)
+        self.first_child.append(0)
+        self.child_counts.append(0)
+        if parent != NO_PARENT:
+            if not self.child_counts[parent]:
+                self.first_child[parent] = node_id
+            self.child_counts[parent] += 1
+        return node_id
+
+    @classmethod
+    def from_tree(cls, root: Folder) -> "ColumnarTree":
+        tree = cls()
+        pending: Deque[Tuple[FileSystemItem, int]] = deque([(root, NO_PARENT)])
+        while pending:
+            item, parent = pending.popleft()
+            node_id = tree.append(item.get_name, parent, isinstance(item, Folder))
+            if isinstance(item, Folder):
+                pending.extend((child, node_id) for child in item.get_items)
+        return tree
+
+    def root(self) -> "ColumnarFolder":
+        if not self.name_ids:
+            raise ValueError("empty tree")
+        return ColumnarFolder(self, 0)
+
+    def node(self, node_id: int) -> FileSystemItem:
+        if self.kinds[node_id] == KIND_FOLDER:
+            return ColumnarFolder(self, node_id)
+        return ColumnarFile(self, node_id)
+
+    def children(self, node_id: int) -> range:
+        first = self.first_child[node_id]
+        return range(first, first + self.child_counts[node_id])
+
+    def find_child(self, node_id: int, name: str) -> Optional[int]:
+        string_id = self._string_ids.get(name)
+        count = self.child_counts[node_id]
+        if string_id is None or not count:
+            return None
+        first = self.first_child[node_id]
+        try:
+            # array.index scans the id range in C
+            return self.name_ids.index(string_id, first, first + count)
+        except ValueError:
+            return None
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the columns and the string table."""
+        columns = (self.name_ids, self.parents, self.first_child, self.child_counts)
+        total = sum(column.itemsize * len(column) for column in columns) + len(self.kinds)
+        total += sum(sys.getsizeof(name) for name in self.strings)
+        return total + sys.getsizeof(self._string_ids) + sys.getsizeof(self.strings)
+
+
+class _ColumnarChildren:
+    """Lazy view over a folder's child handles, like dict.values()."""
+
+    __slots__ = ("_tree", "_ids")
+
+    def __init__(self, tree: ColumnarTree, ids: range):
+        self._tree = tree
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[FileSystemItem]:
+        node = self._tree.node
+        return (node(node_id) for node_id in self._ids)
+
+
+class _ColumnarHandle:
+    """Shared behaviour of the handle classes; mixed in ahead of File/Folder."""
+
+    __slots__ = ()
+
+    @property
+    def get_name(self) -> str:
+        return self._tree.strings[self._tree.name_ids[self._id]]
+
+    @property
+    def get_parent(self) -> Optional["ColumnarFolder"]:
+        parent = self._tree.parents[self._id]
+        return None if parent == NO_PARENT else ColumnarFolder(self._tree, parent)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _ColumnarHandle) and other._tree is self._tree and other._id == self._id
+
+    def __hash__(self) -> int:
+        return hash((id(self._tree), self._id))
+
+    def __repr__(self) -> str:
+        return "{}({!r}, id={})".format(type(self).__name__, self.get_name, self._id)
+
+
+class ColumnarFolder(_ColumnarHandle, Folder):
+    __slots__ = ("_tree", "_id")
+
+    def __init__(self, tree: ColumnarTree, node_id: int):
+        self._tree = tree
+        self._id = node_id
+
+    @property
+    def get_items(self) -> _ColumnarChildren:
+        return _ColumnarChildren(self._tree, self._tree.children(self._id))
+
+    @property
+    def get_stats(self) -> FolderStats:
+        # not aggregated in the columns: counted from the kinds column, files carry no content
+        files = folders = 0
+        pending = [self._id]
+        while pending:
+            for child in self._tree.children(pending.pop()):
+                if self._tree.kinds[child] == KIND_FOLDER:
+                    folders += 1
+                    pending.append(child)
+                else:
+                    files += 1
+        return FolderStats(files, folders, 0)
+
+    def get_item(self, name: str) -> Optional[FileSystemItem]:
+        node_id = self._tree.find_child(self._id, name)
+        return None if node_id is None else self._tree.node(node_id)
+
+    def add_item(self, item: FileSystemItem) -> bool:
+        raise TypeError("columnar trees are read-only")
+
+    def insert_item(self, item: FileSystemItem, index: int) -> bool:
+        raise TypeError("columnar trees are read-only")
+
+    def remove_item(self, item: FileSystemItem) -> None:
+        raise TypeError("columnar trees are read-only")
+
+    def rename_item(self, item: FileSystemItem, name: str) -> bool:
+        raise TypeError("columnar trees are read-only")
+
+
+class ColumnarFile(_ColumnarHandle, File):
+    __slots__ = ("_tree", "_id")
+
+    def __init__(self, tree: ColumnarTree, node_id: int):
+        self._tree = tree
+        self._id = node_id
+
+    def get_content(self):
+        return ""
+
+    def set_content(self, content):
+        raise TypeError("columnar trees are read-only")
+
+    def size(self) -> int:
+        return 0
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> List[memoryview]:
+        return []
+
+    def write(self, offset: int, data: bytes) -> None:
+        raise TypeError("columnar trees are read-only")
+
+    def append(self, data: bytes) -> None:
+        raise TypeError("columnar trees are read-only")
@@ -1,12 +1,84 @@
+from typing import List, Optional, Union
 from models.file_system_item import FileSystemItem
+from storage.chunk_store import ChunkStore, ChunkedContent
+
+ENCODING = "utf-8"
 
 class File(FileSystemItem):
-    def __init__(self, name):
+    __slots__ = ("_content", "_encoded_size")
+
+    def __init__(self, name, store: Optional[ChunkStore] = None):
         super().__init__(name)
-        self.content = ""
+        # an in-memory str, or chunks in a memory-mapped blob when a store is given
+        self._content: Union[str, ChunkedContent] = "" if store is None else ChunkedContent(store)
+        # utf-8 length of an in-memory str, kept with it so size() never re-encodes
+        self._encoded_size = 0
+
+    @property
+    def content(self):
+        return self.get_content()
+
+    @content.setter
+    def content(self, content):
+        self.set_content(content)
 
     def get_content(self):
-        return self.content
+        if isinstance(self._content, ChunkedContent):
+            return self._content.getvalue().decode(ENCODING)
+        return self._content
 
     def set_content(self, content):
-        self.content = content
+        before = self.size()
+        if isinstance(self._content, ChunkedContent):
+            self._content.replace(content.encode(ENCODING))
+        else:
+            self._content = content
+            self._encoded_size = len(content.encode(ENCODING))
+        self._resized(before)
+
+    def _resized(self, before: int) -> None:
+        """Passes a size change on to the totals of the enclosing folders."""
+        if self._parent is not None:
+            delta = self.size() - before
+            if delta:
+                self._parent._adjust_stats(0, 0, delta)
+
+    def size(self) -> int:
+        """Content size in bytes."""
+        if isinstance(self._content, ChunkedContent):
+            return len(self._content)
+        return self._encoded_size
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> List[memoryview]:
+        """
+        Reads a byte range. Chunk-backed files return views straight into the
+        mapping without copying; in-memory files return a view of an encoded copy.
+        """
+        if isinstance(self._content, ChunkedContent):
+            return self._content.read(offset, length)
+        data = memoryview(self._content.encode(ENCODING))
+        return [data[offset:] if length is None else data[offset:offset + length]]
+
+    def write(self, offset: int, data: bytes) -> None:
+        """Overwrites bytes from offset on, growing the file if it runs past the end."""
+        before = self.size()
+        if isinstance(self._content, ChunkedContent):
+            self._content.write(offset, data)
+        else:
+            encoded = bytearray(self._content.encode(ENCODING))
+            if not 0 <= offset <= len(encoded):
+                raise ValueError("offset must be within the content (0..{})".format(len(encoded)))
+            encoded[offset:offset + len(data)] = data
+            self._content = encoded.decode(ENCODING)
+            self._encoded_size = len(encoded)
+        self._resized(before)
+
+    def append(self, data: bytes) -> None:
+        before = self.size()
+        if isinstance(self._content, ChunkedContent):
+            self._content.append(data)
+        else:
+            data = bytes(data)
+            self._content += data.decode(ENCODING)
+            self._encoded_size += len(data)
+        self._resized(before)
@@ -1,9 +1,32 @@
+import sys
 from abc import abstractmethod
+from typing import Optional
 
 class FileSystemItem:
+    # no per-instance __dict__: at millions of nodes it dominates memory
+    __slots__ = ("__name", "_parent", "_seq", "_enter", "_exit", "_frozen", "__weakref__")
+
     def __init__(self, name):
-        self.__name = name
+        # interned, so the many repeated names ("index.html", "__init__.py") share one string
+        self.__name = sys.intern(name)
+        self._parent: Optional["FileSystemItem"] = None
+        # position key in the parent's listing order, handed out by Folder
+        self._seq = 0
+        # Euler-tour interval tokens, maintained by the manager's order list;
+        # files only carry an enter token (_exit is the same token)
+        self._enter = None
+        self._exit = None
+        # latest immutable copy of this node, kept when the manager runs in mvcc mode
+        self._frozen = None
 
     @property
     def get_name(self):
         return self.__name
+
+    def _rename(self, name: str) -> None:
+        # only for Folder.rename_item, which keeps the parent's child map in step
+        self.__name = sys.intern(name)
+
+    @property
+    def get_parent(self) -> Optional["FileSystemItem"]:
+        return self._parent
@@ -1,25 +1,160 @@
+from itertools import count
 from models.file_system_item import FileSystemItem
-from typing import Optional, List
+from models.persistent_map import PersistentMap
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, ValuesView
+
+# listing positions, increasing in the order children are added; next() on a
+# count is atomic, so writers under different subtree locks can share it
+_SEQUENCE = count(1)
+
+
+class FolderStats(NamedTuple):
+    file_count: int
+    folder_count: int
+    total_size: int
+
 
 class Folder(FileSystemItem):
+    __slots__ = ("__items", "__order", "_rendered", "_file_count", "_folder_count", "_total_size")
+
     def __init__(self, name):
         super().__init__(name)
-        self.__items = []
+        self.__items: Dict[str, FileSystemItem] = {}
+        # the listing order, keyed by _seq rather than by name so that a
+        # rename re-keys __items only and the child keeps its place
+        self.__order: Dict[int, FileSystemItem] = {}
+        # rendered fragment of this subtree when the manager's render cache is on
+        self._rendered = None
+        # totals over the whole subtree, kept up to date along the ancestor chain
+        self._file_count = 0
+        self._folder_count = 0
+        self._total_size = 0
+
+    @classmethod
+    def frozen(cls, name: str, items: PersistentMap, order: PersistentMap) -> "Folder":
+        """
+        Wraps already built child maps, by name and by seq, in a snapshot
+        folder. The children are not re-parented: snapshot nodes are shared
+        between versions, so they never carry parent pointers.
+        """
+        folder = cls(name)
+        folder.__items = items
+        folder.__order = order
+        return folder
+
+    def freeze(self) -> "Folder":
+        """A snapshot copy of this live folder, over its children's current _frozen copies."""
+        children = self.__order.values()
+        return Folder.frozen(self.get_name,
+                             PersistentMap.from_sorted(sorted((item.get_name, item._frozen) for item in children)),
+                             PersistentMap.from_sorted((item._seq, item._frozen) for item in children))
+
+    def refrozen(self, name: str, removed: Iterable[Tuple[str, int]],
+                 placed: Iterable[FileSystemItem]) -> "Folder":
+        """
+        A new version of this snapshot folder: the (name, seq) entries in
+        removed are dropped, then every live item in placed is written under
+        its current name and seq. Only the paths to those entries are copied.
+        """
+        items, order = self.__items, self.__order
+        for old_name, seq in removed:
+            items = items.remove(old_name)
+            order = order.remove(seq)
+        for item in placed:
+            items = items.set(item.get_name, item._frozen)
+            order = order.set(item._seq, item._frozen)
+        return Folder.frozen(name, items, order)
+
+    @property
+    def get_stats(self) -> FolderStats:
+        """Files, folders and content bytes below this folder, in O(1)."""
+        return FolderStats(self._file_count, self._folder_count, self._total_size)
+
+    def _adjust_stats(self, files: int, folders: int, size: int) -> None:
+        """Adds to the totals of this folder and every ancestor; O(depth)."""
+        folder: Optional[Folder] = self
+        while folder is not None:
+            folder._file_count += files
+            folder._folder_count += folders
+            folder._total_size += size
+            folder = folder._parent
+
+    @staticmethod
+    def _stats_of(item: FileSystemItem) -> Tuple[int, int, int]:
+        if isinstance(item, Folder):
+            return item._file_count, item._folder_count + 1, item._total_size
+        return 1, 0, item.size()
 
     @property
-    def get_items(self) -> List[FileSystemItem]:
-        return self.__items
+    def get_items(self) -> ValuesView[FileSystemItem]:
+        return self.__order.values()
+
+    def add_item(self, item: FileSystemItem) -> bool:
+        if item.get_name in self.__items:
+            return False
+        self._attach(item)
+        self._adjust_stats(*self._stats_of(item))
+        return True
+
+    def _attach(self, item: FileSystemItem) -> None:
+        """Adds a new child without updating the totals; bulk loaders sum those up in one pass."""
+        item._seq = next(_SEQUENCE)
+        self.__items[item.get_name] = item
+        self.__order[item._seq] = item
+        item._parent = self
 
-    def add_item(self, item: FileSystemItem) -> None:
-        if self.get_item(item.get_name) is not None:
-            return
-        self.__items.append(item)
+    def insert_item(self, item: FileSystemItem, seq: int) -> bool:
+        """
+        Puts item back at the place in the listing that its former seq gave it.
+        Only the children added after it are re-added, so restoring a recent
+        child is cheap.
+        """
+        if item.get_name in self.__items:
+            return False
+        tail = []
+        while self.__order:
+            later, child = self.__order.popitem()
+            if later < seq:
+                self.__order[later] = child
+                break
+            tail.append(child)
+        item._seq = seq
+        self.__items[item.get_name] = item
+        self.__order[seq] = item
+        for child in reversed(tail):
+            self.__order[child._seq] = child
+        item._parent = self
+        self._adjust_stats(*self._stats_of(item))
+        return True
+
+    def item_before(self, item: FileSystemItem) -> Optional[FileSystemItem]:
+        """The child listed right before item, found from the end of the listing."""
+        found = False
+        for seq in reversed(self.__order):
+            if found:
+                return self.__order[seq]
+            found = seq == item._seq
+        return None
 
     def remove_item(self, item: FileSystemItem) -> None:
-        self.__items.remove(item)
+        if self.__items.get(item.get_name) is not item:
+            raise ValueError("item is not a child of this folder")
+        del self.__items[item.get_name]
+        del self.__order[item._seq]
+        item._parent = None
+        files, folders, size = self._stats_of(item)
+        self._adjust_stats(-files, -folders, -size)
+
+    def rename_item(self, item: FileSystemItem, name: str) -> bool:
+        """Renames a child in O(1), keeping its place in the listing order."""
+        if self.__items.get(item.get_name) is not item:
+            raise ValueError("item is not a child of this folder")
+        if name in self.__items:
+            return False
+        del self.__items[item.get_name]
+        item._rename(name)
+        self.__items[name] = item
+        return True
 
     def get_item(self, name: str) -> Optional[FileSystemItem]:
-        for item in self.__items:
-            if item.get_name == name:
-                return item
-        return None
+        return self.__items.get(name)
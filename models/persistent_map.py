@@ -0,0 +1,181 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# entries per leaf and children per branch before a node splits
+NODE_SIZE = 64
+
+
+class _Leaf:
+    __slots__ = ("keys", "values")
+
+    def __init__(self, keys: list, values: list):
+        self.keys = keys
+        self.values = values
+
+
+class _Branch:
+    __slots__ = ("keys", "children")
+
+    def __init__(self, keys: list, children: list):
+        # keys[i] is the smallest key below children[i]
+        self.keys = keys
+        self.children = children
+
+
+class _Values:
+    """Read-only, re-iterable view of a map's values in key order."""
+
+    __slots__ = ("_map",)
+
+    def __init__(self, persistent_map: "PersistentMap"):
+        self._map = persistent_map
+
+    def __iter__(self) -> Iterator:
+        root = self._map._root
+        return _iter_values(root) if root is not None else iter(())
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+
+class PersistentMap:
+    """
+    Immutable sorted map, a B+-tree whose updates copy only the nodes on the
+    path to the changed key: O(NODE_SIZE * log n) per set or remove, with
+    every other node shared between the old and the new map.
+
+    Nodes left underfull by removals are not merged, only dropped when they
+    empty out, so the height never exceeds what the largest size needed.
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, root=None, size: int = 0):
+        self._root = root
+        self._size = size
+
+    @classmethod
+    def from_sorted(cls, entries: Iterable[Tuple[Any, Any]]) -> "PersistentMap":
+        """Builds a map bottom-up from entries already sorted by key, in O(n)."""
+        level: List[Any] = []
+        keys: list = []
+        values: list = []
+        size = 0
+        for key, value in entries:
+            keys.append(key)
+            values.append(value)
+            size += 1
+            if len(keys) == NODE_SIZE:
+                level.append(_Leaf(keys, values))
+                keys, values = [], []
+        if keys:
+            level.append(_Leaf(keys, values))
+        while len(level) > 1:
+            level = [_Branch([child.keys[0] for child in level[start:start + NODE_SIZE]],
+                             level[start:start + NODE_SIZE])
+                     for start in range(0, len(level), NODE_SIZE)]
+        return cls(level[0] if level else None, size)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        node = self._root
+        if node is None:
+            return default
+        while isinstance(node, _Branch):
+            index = bisect_right(node.keys, key) - 1
+            if index < 0:
+                return default
+            node = node.children[index]
+        index = bisect_left(node.keys, key)
+        if index < len(node.keys) and node.keys[index] == key:
+            return node.values[index]
+        return default
+
+    def values(self) -> _Values:
+        return _Values(self)
+
+    def set(self, key: Any, value: Any) -> "PersistentMap":
+        """A map with key bound to value, replacing any earlier binding."""
+        if self._root is None:
+            return PersistentMap(_Leaf([key], [value]), 1)
+        node, split, grew = _set(self._root, key, value)
+        if split is not None:
+            node = _Branch([node.keys[0], split.keys[0]], [node, split])
+        return PersistentMap(node, self._size + grew)
+
+    def remove(self, key: Any) -> "PersistentMap":
+        """A map without key; this map itself when key is missing."""
+        if self._root is None:
+            return self
+        node, removed = _remove(self._root, key)
+        if not removed:
+            return self
+        while isinstance(node, _Branch) and len(node.children) == 1:
+            node = node.children[0]
+        return PersistentMap(node, self._size - 1)
+
+
+def _iter_values(node) -> Iterator:
+    if isinstance(node, _Leaf):
+        yield from node.values
+    else:
+        for child in node.children:
+            yield from _iter_values(child)
+
+
+def _set(node, key, value) -> Tuple[Any, Any, bool]:
+    """Returns (updated node, new right sibling or None, whether the size grew)."""
+    if isinstance(node, _Leaf):
+        keys, values = node.keys[:], node.values[:]
+        index = bisect_left(keys, key)
+        grew = not (index < len(keys) and keys[index] == key)
+        if grew:
+            keys.insert(index, key)
+            values.insert(index, value)
+        else:
+            values[index] = value
+        if len(keys) <= NODE_SIZE:
+            return _Leaf(keys, values), None, grew
+        half = len(keys) // 2
+        return _Leaf(keys[:half], values[:half]), _Leaf(keys[half:], values[half:]), grew
+    index = max(bisect_right(node.keys, key) - 1, 0)
+    child, split, grew = _set(node.children[index], key, value)
+    keys, children = node.keys[:], node.children[:]
+    keys[index] = child.keys[0]
+    children[index] = child
+    if split is not None:
+        keys.insert(index + 1, split.keys[0])
+        children.insert(index + 1, split)
+    if len(children) <= NODE_SIZE:
+        return _Branch(keys, children), None, grew
+    half = len(children) // 2
+    return _Branch(keys[:half], children[:half]), _Branch(keys[half:], children[half:]), grew
+
+
+def _remove(node, key) -> Tuple[Any, bool]:
+    """Returns (updated node, or None once empty, and whether key was there)."""
+    if isinstance(node, _Leaf):
+        index = bisect_left(node.keys, key)
+        if index == len(node.keys) or node.keys[index] != key:
+            return node, False
+        if len(node.keys) == 1:
+            return None, True
+        return _Leaf(node.keys[:index] + node.keys[index + 1:], node.values[:index] + node.values[index + 1:]), True
+    index = bisect_right(node.keys, key) - 1
+    if index < 0:
+        return node, False
+    child, removed = _remove(node.children[index], key)
+    if not removed:
+        return node, False
+    keys, children = node.keys[:], node.children[:]
+    if child is None:
+        del keys[index]
+        del children[index]
+        if not children:
+            return None, True
+    else:
+        keys[index] = child.keys[0]
+        children[index] = child
+    return _Branch(keys, children), True
@@ -0,0 +1,224 @@
+import asyncio
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+from models.folder import FolderStats
+from service.batch import AddOperation, MoveOperation, Operation
+from service.file_system_manager import FileSystemManager
+
+T = TypeVar("T")
+# items handed out by the async iterators between two yields to the event loop
+DEFAULT_PAGE_SIZE = 256
+# operations per apply_batch call when streaming bulk input
+DEFAULT_BATCH_SIZE = 1024
+# single writes queued for the writer thread before callers have to wait
+DEFAULT_MAX_PENDING_WRITES = 64
+
+
+class AsyncFileSystemManager:
+    """
+    asyncio front-end mirroring FileSystemManager.
+
+    Every call that takes the manager's lock runs off the event loop, since
+    an inline call would stall the loop whenever an offloaded search or
+    batch holds the lock. Writes go to one dedicated writer thread, in the
+    order they were made, at most max_pending_writes queued at a time.
+    Bounded-cost reads (exact search through the name index, stats) go
+    straight to the executor. Listings, pattern searches and bulk batches
+    take one of max_concurrency slots first; callers beyond that wait their
+    turn, which is the backpressure. Listings and searches are also offered
+    as async iterators that hand back control to the loop every page.
+    """
+
+    def __init__(self, manager: FileSystemManager, executor: Optional[Executor] = None, max_concurrency: int = 8,
+                 page_size: int = DEFAULT_PAGE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_pending_writes: int = DEFAULT_MAX_PENDING_WRITES):
+        """
+        :param manager: the synchronous manager doing the work
+        :param executor: where reads run, the loop's default executor if None
+        :param max_concurrency: listings, searches and batches allowed to run at the same time
+        :param page_size: items per page of the async iterators
+        :param batch_size: operations per batch when bulk input is streamed
+        :param max_pending_writes: single writes allowed to wait for the writer thread
+        """
+        if max_concurrency < 1 or max_pending_writes < 1:
+            raise ValueError("max_concurrency and max_pending_writes must be >= 1")
+        self.manager = manager
+        self._executor = executor
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-system-writer")
+        self._max_concurrency = max_concurrency
+        self._max_pending_writes = max_pending_writes
+        # created lazily so the semaphores belong to the loop that uses them
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._write_slots: Optional[asyncio.Semaphore] = None
+        self.page_size = page_size
+        self.batch_size = batch_size
+
+    async def __aenter__(self) -> "AsyncFileSystemManager":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def close(self) -> None:
+        """Stops the writer thread once the writes already queued are done; blocks until then."""
+        self._writer.shutdown()
+
+    async def aclose(self) -> None:
+        """Like close, but waits for the queued writes off the event loop."""
+        await self._run(self._executor, self._writer.shutdown)
+
+    async def _run(self, executor: Optional[Executor], function: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(function, *args))
+
+    async def _read(self, function: Callable[..., T], *args) -> T:
+        return await self._run(self._executor, function, *args)
+
+    async def _offload(self, function: Callable[..., T], *args) -> T:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_concurrency)
+        async with self._slots:
+            return await self._run(self._executor, function, *args)
+
+    async def _write(self, function: Callable[..., T], *args) -> T:
+        if self._write_slots is None:
+            self._write_slots = asyncio.Semaphore(self._max_pending_writes)
+        async with self._write_slots:
+            return await self._run(self._writer, function, *args)
+
+    async def _write_batch(self, batch: List[Operation], atomic: bool, user: Optional[str]) -> List[bool]:
+        # a batch holds the write lock for long, so it also counts against max_concurrency
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_concurrency)
+        async with self._slots:
+            return await self._write(self.manager.apply_batch, batch, atomic, user)
+
+    async def _paced(self, items: Iterable[T]) -> AsyncIterator[T]:
+        """Yields items, handing control back to the event loop every page."""
+        for count, item in enumerate(items, 1):
+            yield item
+            if count % self.page_size == 0:
+                await asyncio.sleep(0)
+
+    # writes, on the writer thread
+
+    async def add_file_or_folder(self, parent_folder_name: str, name: str, is_folder: bool,
+                                 user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.add_file_or_folder, parent_folder_name, name, is_folder, user)
+
+    async def move_file_or_folder(self, source_name: str, destination_folder: str, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.move_file_or_folder, source_name, destination_folder, user)
+
+    async def add(self, path: str, name: str, is_folder: bool, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.add, path, name, is_folder, user)
+
+    async def move(self, source_path: str, destination_path: str, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.move, source_path, destination_path, user)
+
+    async def rename_item(self, item_name: str, new_name: str, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.rename_item, item_name, new_name, user)
+
+    async def delete_item(self, item_name: str, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.delete_item, item_name, user)
+
+    async def set_file_content(self, file_name: str, content: str, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.set_file_content, file_name, content, user)
+
+    async def write_file(self, file_name: str, offset: int, data: bytes, user: Optional[str] = None) -> bool:
+        return await self._write(self.manager.write_file, file_name, offset, data, user)
+
+    # bounded-cost reads
+
+    async def search_file_exact_match(self, folder_name: str, file_name: str,
+                                      user: Optional[str] = None) -> Optional[str]:
+        return await self._read(self.manager.search_file_exact_match, folder_name, file_name, user)
+
+    async def get_stats(self, folder_name: str, user: Optional[str] = None) -> Optional[FolderStats]:
+        return await self._read(self.manager.get_stats, folder_name, user)
+
+    # traversals, offloaded
+
+    async def list_contents(self, folder_name: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                            user: Optional[str] = None) -> list:
+        return await self._offload(self.manager.list_contents, folder_name, cursor, limit, user)
+
+    async def list_directory_structure(self, user: Optional[str] = None) -> list:
+        return await self._offload(self.manager.list_directory_structure, user)
+
+    async def search_file_like_match(self, folder_name: str, pattern: str, user: Optional[str] = None) -> list:
+        return await self._offload(self.manager.search_file_like_match, folder_name, pattern, user)
+
+    async def search_file_like_match_many(self, folder_name: str, patterns: Iterable[str],
+                                          user: Optional[str] = None) -> Dict[str, list]:
+        return await self._offload(self.manager.search_file_like_match_many, folder_name, list(patterns), user)
+
+    # async iterators
+
+    async def iter_contents(self, folder_name: str, cursor: Optional[str] = None,
+                            user: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Pages through a folder with list_contents, one executor call per page,
+        so the manager's lock is only held while a page is read.
+        """
+        while True:
+            page = await self.list_contents(folder_name, cursor, self.page_size, user)
+            for name in page:
+                yield name
+            if len(page) < self.page_size:
+                return
+            cursor = page[-1]
+
+    async def iter_directory_structure(self, user: Optional[str] = None) -> AsyncIterator[str]:
+        async for line in self._paced(await self.list_directory_structure(user)):
+            yield line
+
+    async def search_files(self, folder_name: str, query: str, syntax: str = "glob", limit: Optional[int] = None,
+                           ignore_case: bool = False, user: Optional[str] = None) -> AsyncIterator[str]:
+        matches = await self._offload(self.manager.list_matching_files, folder_name, query, syntax, limit,
+                                      ignore_case, user)
+        async for name in self._paced(matches):
+            yield name
+
+    # bulk calls
+
+    async def apply_batch(self, operations: Union[Iterable[Operation], AsyncIterable[Operation]],
+                          atomic: bool = False, user: Optional[str] = None) -> List[bool]:
+        """
+        Applies operations in order. Streamed input is consumed batch_size
+        operations at a time, each batch applied before the next is read, so
+        a fast producer cannot run ahead of the manager. Atomic batches are
+        collected first and applied in one call.
+        """
+        results: List[bool] = []
+        batch: List[Operation] = []
+        async for operation in _aiter(operations):
+            batch.append(operation)
+            if len(batch) == self.batch_size and not atomic:
+                results.extend(await self._write_batch(batch, False, user))
+                batch = []
+        if batch:
+            results.extend(await self._write_batch(batch, atomic, user))
+        return results
+
+    async def add_many(self, items: Union[Iterable[Tuple[str, str, bool]], AsyncIterable[Tuple[str, str, bool]]],
+                       atomic: bool = False, user: Optional[str] = None) -> List[bool]:
+        return await self.apply_batch(_amap(AddOperation, items), atomic, user)
+
+    async def move_many(self, moves: Union[Iterable[Tuple[str, str]], AsyncIterable[Tuple[str, str]]],
+                        atomic: bool = False, user: Optional[str] = None) -> List[bool]:
+        return await self.apply_batch(_amap(MoveOperation, moves), atomic, user)
+
+
+async def _aiter(items: Union[Iterable[T], AsyncIterable[T]]) -> AsyncIterator[T]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _amap(make: Callable[..., T], items) -> AsyncIterator[T]:
+    async for item in _aiter(items):
+        yield make(*item)
@@ -0,0 +1,15 @@
+from typing import NamedTuple, Union
+
+
+class AddOperation(NamedTuple):
+    parent_folder_name: str
+    name: str
+    is_folder: bool
+
+
+class MoveOperation(NamedTuple):
+    source_name: str
+    destination_folder: str
+
+
+Operation = Union[AddOperation, MoveOperation]
@@ -0,0 +1,69 @@
+from bisect import bisect_left, insort
+from typing import Callable, Iterator, List, Optional, Tuple
+
+
+class CompletionIndex:
+    """
+    Distinct names kept in sorted arrays, for prefix completion.
+
+    A prefix query bisects to the first candidate and walks forward, so it
+    costs O(log n + prefix length * k) regardless of tree size. Inserting a
+    new name shifts the array (a memmove), which is cheap next to the node
+    allocation that comes with it. A second array sorted by case-folded name
+    serves case-insensitive queries.
+    """
+
+    def __init__(self):
+        self._names: List[str] = []
+        self._folded: List[Tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @classmethod
+    def from_names(cls, names) -> "CompletionIndex":
+        index = cls()
+        index._names = sorted(names)
+        index._folded = sorted((name.casefold(), name) for name in index._names)
+        return index
+
+    def add(self, name: str) -> None:
+        insort(self._names, name)
+        insort(self._folded, (name.casefold(), name))
+
+    def remove(self, name: str) -> None:
+        position = bisect_left(self._names, name)
+        if position < len(self._names) and self._names[position] == name:
+            del self._names[position]
+            entry = (name.casefold(), name)
+            del self._folded[bisect_left(self._folded, entry)]
+
+    def iter_prefixed(self, prefix: str, ignore_case: bool = False) -> Iterator[str]:
+        """Every name starting with prefix, in sorted order."""
+        if ignore_case:
+            prefix = prefix.casefold()
+            position = bisect_left(self._folded, (prefix,))
+            while position < len(self._folded) and self._folded[position][0].startswith(prefix):
+                yield self._folded[position][1]
+                position += 1
+        else:
+            position = bisect_left(self._names, prefix)
+            while position < len(self._names) and self._names[position].startswith(prefix):
+                yield self._names[position]
+                position += 1
+
+    def complete(self, prefix: str, limit: int, ignore_case: bool = False,
+                 accept: Optional[Callable[[str], bool]] = None) -> List[str]:
+        """
+        :param accept: further filter on the names, e.g. "exists under this folder"
+        :return: up to limit names starting with prefix, in sorted order
+        """
+        completions: List[str] = []
+        if limit <= 0:
+            return completions
+        for name in self.iter_prefixed(prefix, ignore_case):
+            if accept is None or accept(name):
+                completions.append(name)
+                if len(completions) == limit:
+                    break
+        return completions
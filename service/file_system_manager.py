@@ -1,68 +1,280 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from models.folder import FolderStats
+from service.batch import Operation
 
 class FileSystemManager(ABC):
+    """
+    Folders can be addressed either by bare name or by absolute path.
+    A reference starting with "/" is a path relative to the root folder,
+    e.g. "/a/b" is folder "b" inside "a" inside the root, and "/" is the root.
+    """
 
     @abstractmethod
-    def add_file_or_folder(self, parent_folder_name: str, name: str, is_folder: bool) -> bool:
+    def add_file_or_folder(self, parent_folder_name: str, name: str, is_folder: bool,
+                           user: Optional[str] = None) -> bool:
         """
         Adds a file or folder to the system.
 
         :param parent_folder_name: the name of the parent folder
-        :param name: the name of the file or folder to add
+        :param name: the name of the file or folder to add, non-empty and without "/"
         :param is_folder: whether the new item is a folder
+        :param user: check this user's permissions, None to skip the checks
         :return: True if added successfully, otherwise False
         """
         pass
 
     @abstractmethod
-    def move_file_or_folder(self, source_name: str, destination_folder: str) -> bool:
+    def move_file_or_folder(self, source_name: str, destination_folder: str, user: Optional[str] = None) -> bool:
         """
         Moves a file or folder to a new location.
 
         :param source_name: the name of the file or folder to move
         :param destination_folder: the name of the destination folder
+        :param user: check this user's permissions, None to skip the checks
         :return: True if moved successfully, otherwise False
         """
         pass
 
     @abstractmethod
-    def list_contents(self, folder_name: str) -> list:
+    def set_file_content(self, file_name: str, content: str, user: Optional[str] = None) -> bool:
+        """
+        Replaces the content of a file.
+
+        :param file_name: the name or absolute path of the file
+        :param content: the new content
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if the file exists, otherwise False
+        """
+        pass
+
+    @abstractmethod
+    def write_file(self, file_name: str, offset: int, data: bytes, user: Optional[str] = None) -> bool:
+        """
+        Overwrites part of a file's content, growing it when the write runs past the end.
+
+        :param file_name: the name or absolute path of the file
+        :param offset: the byte offset to write at, at most the current size
+        :param data: the bytes to write
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if the file exists, otherwise False
+        """
+        pass
+
+    @abstractmethod
+    def rename_item(self, item_name: str, new_name: str, user: Optional[str] = None) -> bool:
+        """
+        Renames a file or folder.
+
+        :param item_name: the name or absolute path of the file or folder
+        :param new_name: the new name, non-empty and without "/"
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if renamed, False if the item does not exist or a sibling already has the new name
+        """
+        pass
+
+    @abstractmethod
+    def delete_item(self, item_name: str, user: Optional[str] = None) -> bool:
+        """
+        Deletes a file, or a folder together with everything below it.
+
+        :param item_name: the name or absolute path of the file or folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if deleted, otherwise False
+        """
+        pass
+
+    @abstractmethod
+    def list_contents(self, folder_name: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                      user: Optional[str] = None) -> list:
         """
         Lists the contents of a specific folder.
 
         :param folder_name: the name of the folder
+        :param cursor: the last name of the previous page; listing resumes right after it
+        :param limit: the maximum number of names to return, None for all of them
+        :param user: check this user's permissions, None to skip the checks
         :return: a list of names of files and folders within the specified folder
         """
         pass
 
     @abstractmethod
-    def list_directory_structure(self) -> list:
+    def iter_contents(self, folder_name: str, cursor: Optional[str] = None,
+                      user: Optional[str] = None) -> Iterator[str]:
+        """
+        Lazily yields the contents of a specific folder.
+
+        :param folder_name: the name of the folder
+        :param cursor: the name to resume after, None to start from the beginning
+        :param user: check this user's permissions, None to skip the checks
+        :return: an iterator over the names of files and folders within the folder
+        """
+        pass
+
+    @abstractmethod
+    def list_directory_structure(self, user: Optional[str] = None) -> list:
         """
         Returns the directory structure of each file and folder in the file system.
 
+        :param user: leave out the contents of folders this user cannot read, None to skip the checks
         :return: a list representing the directory structure
         """
         pass
 
     @abstractmethod
-    def search_file_exact_match(self, folder_name: str, file_name: str) -> Optional[str]:
+    def iter_directory_structure(self, user: Optional[str] = None) -> Iterator[str]:
+        """
+        Lazily yields the directory structure, line by line, in the same format
+        as list_directory_structure.
+
+        :param user: leave out the contents of folders this user cannot read, None to skip the checks
+        :return: an iterator over the lines of the directory structure
+        """
+        pass
+
+    @abstractmethod
+    def search_file_exact_match(self, folder_name: str, file_name: str, user: Optional[str] = None) -> Optional[str]:
         """
         Searches for an exact file match within a specific folder.
 
         :param folder_name: the name of the folder to search within
         :param file_name: the exact name of the file to search for
+        :param user: check this user's permissions, None to skip the checks
         :return: the name of the file if found, None otherwise
         """
         pass
 
     @abstractmethod
-    def search_file_like_match(self, folder_name: str, pattern: str) -> list:
+    def search_file_like_match(self, folder_name: str, pattern: str, user: Optional[str] = None) -> list:
         """
         Searches for files by pattern within a specific folder.
 
         :param folder_name: the name of the folder to search within
         :param pattern: the pattern that must be part of the file name.
+        :param user: check this user's permissions, None to skip the checks
         :return: a list of file names that match the pattern
         """
         pass
+
+    @abstractmethod
+    def search_files(self, folder_name: str, query: str, syntax: str = "glob", limit: Optional[int] = None,
+                     ignore_case: bool = False,
+                     user: Optional[str] = None) -> Iterator[str]:
+        """
+        Lazily searches for files by glob, regular expression or prefix within a specific folder.
+
+        :param folder_name: the name of the folder to search within
+        :param query: e.g. "*.log" for "glob", "^report[0-9]+" for "regex", "rep" for "prefix"
+        :param syntax: "glob", "regex" or "prefix"
+        :param limit: stop after this many matches, None for all of them
+        :param ignore_case: whether to match regardless of case
+        :param user: check this user's permissions, None to skip the checks
+        :return: an iterator over the names of the matching files, breadth-first
+        """
+        pass
+
+    @abstractmethod
+    def list_matching_files(self, folder_name: str, query: str, syntax: str = "glob", limit: Optional[int] = None,
+                            ignore_case: bool = False, user: Optional[str] = None) -> List[str]:
+        """
+        Same search as search_files, collected while the folder is locked, so
+        the tree may change as soon as it returns.
+
+        :param folder_name: the name of the folder to search within
+        :param query: e.g. "*.log" for "glob", "^report[0-9]+" for "regex", "rep" for "prefix"
+        :param syntax: "glob", "regex" or "prefix"
+        :param limit: stop after this many matches, None for all of them
+        :param ignore_case: whether to match regardless of case
+        :param user: check this user's permissions, None to skip the checks
+        :return: the names of the matching files, breadth-first
+        """
+        pass
+
+    @abstractmethod
+    def search_file_like_match_many(self, folder_name: str, patterns: Iterable[str],
+                                    user: Optional[str] = None) -> Dict[str, list]:
+        """
+        Runs several like-match searches in one pass over the folder.
+
+        :param folder_name: the name of the folder to search within
+        :param patterns: the patterns, each must be part of the file name
+        :param user: check this user's permissions, None to skip the checks
+        :return: for every pattern, the names of the files that match it
+        """
+        pass
+
+    @abstractmethod
+    def get_stats(self, folder_name: str, user: Optional[str] = None) -> Optional[FolderStats]:
+        """
+        Returns the number of files, the number of folders and the total content size below a folder.
+
+        :param folder_name: the name of the folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: (file_count, folder_count, total_size in bytes), None if the folder does not exist
+        """
+        pass
+
+    @abstractmethod
+    def add(self, path: str, name: str, is_folder: bool, user: Optional[str] = None) -> bool:
+        """
+        Adds a file or folder under the folder at the given path.
+
+        :param path: the absolute path of the parent folder, e.g. "/a/b"
+        :param name: the name of the file or folder to add, non-empty and without "/"
+        :param is_folder: whether the new item is a folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if added successfully, otherwise False
+        """
+        pass
+
+    @abstractmethod
+    def move(self, source_path: str, destination_path: str, user: Optional[str] = None) -> bool:
+        """
+        Moves the file or folder at source_path into the folder at destination_path.
+
+        :param source_path: the absolute path of the item to move, e.g. "/a/b/c"
+        :param destination_path: the absolute path of the destination folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if moved successfully, otherwise False
+        """
+        pass
+
+    @abstractmethod
+    def add_many(self, items: Iterable[Tuple[str, str, bool]], atomic: bool = False,
+                 user: Optional[str] = None) -> List[bool]:
+        """
+        Adds many files or folders in one batch.
+
+        :param items: (parent_folder_name, name, is_folder) tuples, applied in order
+        :param atomic: if True, either every item is added or none is
+        :param user: check this user's permissions, None to skip the checks
+        :return: one result per item, as add_file_or_folder would return it
+        """
+        pass
+
+    @abstractmethod
+    def move_many(self, moves: Iterable[Tuple[str, str]], atomic: bool = False,
+                  user: Optional[str] = None) -> List[bool]:
+        """
+        Moves many files or folders in one batch.
+
+        :param moves: (source_name, destination_folder) tuples, applied in order
+        :param atomic: if True, either every move happens or none does
+        :param user: check this user's permissions, None to skip the checks
+        :return: one result per move, as move_file_or_folder would return it
+        """
+        pass
+
+    @abstractmethod
+    def apply_batch(self, operations: Iterable[Operation], atomic: bool = False,
+                    user: Optional[str] = None) -> List[bool]:
+        """
+        Applies a mixed sequence of AddOperation and MoveOperation in one batch.
+
+        :param operations: the operations, applied in order
+        :param atomic: if True, a failing operation rolls the whole batch back
+            and every result is False
+        :param user: check this user's permissions, None to skip the checks
+        :return: one result per operation
+        """
+        pass
@@ -1,170 +1,1266 @@
-from typing import Deque, Optional
+import os
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from models.file_system_item import FileSystemItem
 from service.file_system_manager import FileSystemManager
-from models.folder import Folder
+from service.path_cache import PathCache, is_path, is_valid_name, split_path
+from service.trigram_index import TrigramIndex
+from service.completion import CompletionIndex
+from service.permissions import READ, WRITE, AccessControl
+from service.order_maintenance import OrderList
+from service.locking import GlobalLocking, SubtreeLocking
+from service.traversal import find_match_files, iter_children, iter_directory, iter_files, iter_rendered, iter_subtree
+from service.query import GLOB, compile_patterns, compile_query
+from service.snapshot import FileSystemSnapshot
+from service.parallel_search import ParallelSearch
+from service.batch import AddOperation, MoveOperation, Operation
+from service.metrics import Instrumentation, MetricsSink
+from models.folder import Folder, FolderStats
 from models.file import File
-from collections import deque
+from storage.chunk_store import ChunkStore, ChunkedContent
+from storage.snapshot_format import CONTENT_CHUNKED, SnapshotData, read_snapshot, write_snapshot
+from storage.journal import (OP_ADD, OP_DELETE, OP_MOVE, OP_RENAME, OP_SET_CONTENT, OP_WRITE, Journal, Record,
+                             read_frames)
+from itertools import chain, islice
+
+
+# index entries of deleted nodes dropped per mutation, so a huge delete is paid off in small steps
+RECLAIM_BATCH = 1024
+# public methods timed when the manager is given a metrics sink
+INSTRUMENTED_OPERATIONS = tuple(sorted(FileSystemManager.__abstractmethods__ | {"complete"}))
+
+
+class _Changes:
+    """
+    What one operation or batch did, so the derived state (trigram index,
+    rendered fragments, frozen versions) is brought up to date once at the end.
+    """
+
+    def __init__(self, atomic: bool = False):
+        self.touched: Dict[Folder, None] = {}
+        self.created: Dict[FileSystemItem, None] = {}
+        # mvcc only: (parent, name, seq) entries to drop from the parents' frozen
+        # copies, and items that (re)entered a folder or changed name
+        self.displaced: List[Tuple[Folder, str, int]] = []
+        self.placed: Dict[FileSystemItem, None] = {}
+        # undo steps, newest last; only recorded for atomic batches
+        self.undo: Optional[List[Callable[[], None]]] = [] if atomic else None
+        # journal records of what actually happened, and the frame they went into
+        self.records: List[Record] = []
+        self.lsn = 0
+
 
 class FileSystemManagerImpl(FileSystemManager):
-    def __init__(self, root_name):
+    def __init__(self, root_name, path_cache_size: int = 1024, trigram_index: bool = False,
+                 render_cache: bool = False, locking: str = "global", mvcc: bool = False,
+                 content_store: Optional[ChunkStore] = None, journal: Optional[Journal] = None,
+                 parallel_search: Optional[ParallelSearch] = None, completion_index: bool = False,
+                 metrics: Optional[MetricsSink] = None):
+        """
+        :param locking: "global" for one readers-writer lock over the whole tree,
+            "subtree" for per-folder intention locks so that writes to disjoint
+            subtrees do not serialize
+        :param mvcc: keep an immutable copy of the tree, path-copied on every
+            mutation, so that snapshot() readers need no locks
+        :param content_store: keep new files' content in chunks of this
+            memory-mapped blob instead of in-memory strings
+        :param journal: log every mutation to this write-ahead journal; call
+            recover() first to restore the state it holds
+        :param parallel_search: scan large subtrees for like matches in this
+            process pool when there is no trigram index
+        :param completion_index: keep the distinct names sorted, so complete()
+            costs O(log n + k) instead of a walk over the tree
+        :param metrics: time every public operation and count the nodes it
+            visits, reporting to this sink; None leaves the methods unwrapped
+        """
+        if locking not in ("global", "subtree"):
+            raise ValueError("locking must be 'global' or 'subtree'")
+        if parallel_search is not None and locking != "global":
+            # the flattened copy walks the whole tree, which disjoint subtree writers may be changing
+            raise ValueError("parallel_search needs locking='global'")
+        self._locks = GlobalLocking() if locking == "global" else SubtreeLocking()
+        self._instrumentation: Optional[Instrumentation] = None
         self.root = Folder(root_name)
+        self.path_cache = PathCache(path_cache_size)
+        self._trigram_index: Optional[TrigramIndex] = TrigramIndex() if trigram_index else None
+        self._completion_index: Optional[CompletionIndex] = CompletionIndex() if completion_index else None
+        self._render_cache = render_cache
+        self._content_store = content_store
+        self._journal = journal
+        self._checkpoint_lock = threading.Lock()
+        self._parallel_search = parallel_search
+        # background refresh of the parallel search's flattened copy, if one is running
+        self._parallel_rebuild: Optional[threading.Thread] = None
+        # bumped whenever names or shape change, so flattened copies know they are stale
+        self._version = 0
+        self._mvcc = mvcc
+        self._publish_lock = threading.Lock()
+        self._published: Optional[Folder] = None
+        if mvcc:
+            self._freeze(self.root)
+            self._published = self.root._frozen
+        # name -> every node carrying that name, in creation order (dict as ordered set)
+        self._name_index: Dict[str, Dict[FileSystemItem, None]] = {}
+        # Euler tour of the tree: a folder's descendants are exactly the nodes
+        # whose enter label falls between its own enter and exit labels
+        self._labels = OrderList()
+        self.root._enter = self._labels.insert_after(self._labels.head)
+        self.root._exit = self._labels.insert_after(self.root._enter)
+        self._index_item(self.root)
+        self._access = AccessControl()
+        # roots of deleted subtrees whose index entries are not reclaimed yet
+        self._garbage: List[FileSystemItem] = []
+        if metrics is not None:
+            self._instrumentation = Instrumentation(metrics)
+            for operation in INSTRUMENTED_OPERATIONS:
+                setattr(self, operation, self._instrumentation.wrap(operation, getattr(self, operation)))
+
+    def _label_item(self, item: FileSystemItem) -> None:
+        """Gives a freshly attached leaf its place at the end of its parent's interval."""
+        item._enter = self._labels.insert_after(item.get_parent._exit.prev)
+        item._exit = self._labels.insert_after(item._enter) if isinstance(item, Folder) else item._enter
+
+    def _contains(self, folder: FileSystemItem, item: FileSystemItem) -> bool:
+        """True when item is folder itself or lies anywhere below it, in O(1)."""
+        return folder._enter.label <= item._enter.label <= folder._exit.label
+
+    def _index_item(self, item: FileSystemItem) -> None:
+        # the trigram index is filled in _commit, once per operation or batch
+        nodes = self._name_index.get(item.get_name)
+        if nodes is None:
+            nodes = self._name_index[item.get_name] = {}
+            if self._completion_index is not None:
+                self._completion_index.add(item.get_name)
+        nodes[item] = None
+
+    def _unindex_item(self, item: FileSystemItem) -> None:
+        nodes = self._name_index.get(item.get_name)
+        if nodes is None:
+            return
+        nodes.pop(item, None)
+        if not nodes:
+            del self._name_index[item.get_name]
+            if self._completion_index is not None:
+                self._completion_index.remove(item.get_name)
+        if self._trigram_index is not None and isinstance(item, File):
+            self._trigram_index.remove(item)
+
+    def _path_of(self, item: FileSystemItem) -> str:
+        names = []
+        while item.get_parent is not None:
+            names.append(item.get_name)
+            item = item.get_parent
+        return "/" + "/".join(reversed(names))
+
+    def _alive(self, item: FileSystemItem) -> bool:
+        """False for nodes of a deleted subtree that the indexes still mention."""
+        if not self._garbage:
+            return True
+        while item.get_parent is not None:
+            item = item.get_parent
+        return item is self.root
+
+    def _allowed(self, user: Optional[str], item: FileSystemItem, mode: int) -> bool:
+        return user is None or self._access.effective(user, item) & mode == mode
+
+    def _visible(self, user: Optional[str], item: FileSystemItem) -> bool:
+        """Whether user can see item, i.e. list the folder holding it."""
+        return user is None or self._allowed(user, item.get_parent or item, READ)
+
+    def _descend(self, user: Optional[str], start: Folder):
+        """
+        Traversal callback that skips the folders user cannot read, and counts
+        the nodes the walk from start visits when instrumented.
+        """
+        descend = None if user is None else (lambda folder: self._allowed(user, folder, READ))
+        if self._instrumentation is not None:
+            return self._instrumentation.counting(start, descend)
+        return descend
+
+    def _visited(self, count: int) -> None:
+        if self._instrumentation is not None:
+            self._instrumentation.visit(count)
+
+    def _depth(self, item: FileSystemItem) -> int:
+        depth = 0
+        parent = item.get_parent
+        while parent is not None:
+            depth += 1
+            parent = parent.get_parent
+        return depth
+
+    def _bfs_key(self, item: FileSystemItem) -> Tuple[int, int]:
+        """Nodes sorted by this key come out in breadth-first order."""
+        return (self._depth(item), item._enter.label)
+
+    def _lookup(self, name: str, folders_only: bool, include_root: bool = True) -> Optional[FileSystemItem]:
+        """
+        Resolves a bare name through the name index.
+
+        When the same name exists at several levels the shallowest node wins,
+        ties go to the node that comes first in the tree, as in a breadth-first
+        scan (and in snapshots).
+        """
+        nodes = self._name_index.get(name)
+        if not nodes:
+            return None
+        self._visited(len(nodes))
+        best: Optional[FileSystemItem] = None
+        best_key: Tuple[int, int] = (-1, -1)
+        for node in nodes:
+            if folders_only and not isinstance(node, Folder):
+                continue
+            if not include_root and node is self.root:
+                continue
+            if not self._alive(node):
+                continue
+            if len(nodes) == 1:
+                return node
+            key = self._bfs_key(node)
+            if best is None or key < best_key:
+                best, best_key = node, key
+        return best
 
     def _find_folder(self, folder_name: str) -> Optional[Folder]:
         if self.root.get_name == folder_name:
             return self.root
-        return self._find_folder_recursively(self.root, folder_name)
-
-    def _find_folder_recursively(self, current_folder: Folder, folder_name: str) -> Optional[Folder]:
-        found_item = current_folder.get_item(folder_name)
-        if found_item and isinstance(found_item, Folder):
-            return found_item
-
-        for item in current_folder.get_items:
-            if isinstance(item, Folder):
-                found_folder = self._find_folder_recursively(item, folder_name)
-                if found_folder:
-                    return found_folder
-        return None
+        folder = self._lookup(folder_name, folders_only=True)
+        return folder if isinstance(folder, Folder) else None
 
-    def _find_match_file_recursively(self, current_folder: Folder, pattern: str) -> list[str]:
-        folders: Deque[Folder] = deque()
-        folders.append(current_folder)
-        matched_items: list[str] = []
-        while folders:
-            folder = folders.popleft()
-            for item in folder.get_items:
-                if not isinstance(item, Folder) and pattern.lower() in item.get_name.lower():
-                    matched_items.append(item.get_name)
-                if isinstance(item, Folder):
-                    folders.append(item)
-
-        return matched_items
-
-    def _find_exact_file_recursively(self, current_folder: Folder, searched_file: str) -> Optional[FileSystemItem]:
-        folders: Deque[Folder] = deque()
-        folders.append(current_folder)
-        while folders:
-            folder = folders.popleft()
-            for item in folder.get_items:
-                if not isinstance(item, Folder) and searched_file == item.get_name:
-                    return item
-                if isinstance(item, Folder):
-                    folders.append(item)
-        return None
+    def _resolve_path(self, path: str) -> Optional[FileSystemItem]:
+        segments = split_path(path)
+        if not segments:
+            return self.root
+        key = "/" + "/".join(segments)
+        cached = self.path_cache.get(key)
+        if cached is not None:
+            return cached
+        chain: List[FileSystemItem] = []
+        node: Optional[FileSystemItem] = self.root
+        self._visited(len(segments))
+        for segment in segments:
+            if not isinstance(node, Folder):
+                return None
+            node = node.get_item(segment)
+            if node is None:
+                return None
+            chain.append(node)
+        self.path_cache.put(key, chain)
+        return node
 
-    def _find_parent_folder_and_file_item_recursively(self, current_folder: Folder, name: str) -> tuple[Optional[Folder], Optional[FileSystemItem]]:
-        folders: Deque[Folder] = deque()
-        folders.append(current_folder)
-        while folders:
-            folder = folders.popleft()
-            for item in folder.get_items:
-                if item.get_name == name:
-                    return (folder, item)
-                if isinstance(item, Folder):
-                    folders.append(item)
-        return (None, None)
+    def _resolve_folder(self, reference: str) -> Optional[Folder]:
+        if is_path(reference):
+            folder = self._resolve_path(reference)
+            return folder if isinstance(folder, Folder) else None
+        return self._find_folder(reference)
 
-    def _list_directory(self, folder: Folder, level: int) -> list:
-        result = []
-        if level == 0:
-            result.append("+ " + folder.get_name)
-        else:
-            indent = ' '*level
-            result.append(indent + "+ " + folder.get_name)
+    def _resolve_item(self, reference: str) -> Optional[FileSystemItem]:
+        if is_path(reference):
+            item = self._resolve_path(reference)
+            return item if item is not self.root else None
+        return self._lookup(reference, folders_only=False, include_root=False)
+
+    def _find_match_file_indexed(self, current_folder: Folder, pattern: str, user: Optional[str] = None) -> list[str]:
+        candidates = self._trigram_index.search(pattern)
+        self._visited(len(candidates))
+        matched = [item for item in candidates
+                   if self._contains(current_folder, item) and self._alive(item) and self._visible(user, item)]
+        matched.sort(key=self._bfs_key)
+        return [item.get_name for item in matched]
+
+    def _find_exact_file_indexed(self, current_folder: Folder, searched_file: str,
+                                 user: Optional[str] = None) -> Optional[FileSystemItem]:
+        candidates = self._name_index.get(searched_file, {})
+        self._visited(len(candidates))
+        matched = [item for item in candidates
+                   if isinstance(item, File) and self._contains(current_folder, item) and self._alive(item)
+                   and self._visible(user, item)]
+        return min(matched, key=self._bfs_key) if matched else None
 
-        for item in folder.get_items:
-            if isinstance(item, Folder):
-                result.extend(self._list_directory(item, level + 2))
+    def _render(self, folder: Folder) -> list:
+        """
+        Returns the rendered fragment of folder's subtree, reusing the cached
+        fragments of clean subfolders by reference, so only the folders on
+        dirty paths are rebuilt. Fragments are never modified once built, so
+        one handed out stays a consistent snapshot; iter_rendered turns it
+        into lines.
+        """
+        if folder._rendered is not None:
+            return folder._rendered
+        stack = [(folder, ["+ " + folder.get_name], iter(folder.get_items))]
+        while stack:
+            node, parts, items = stack[-1]
+            for item in items:
+                if isinstance(item, Folder):
+                    if item._rendered is not None:
+                        parts.append(item._rendered)
+                        continue
+                    stack.append((item, ["+ " + item.get_name], iter(item.get_items)))
+                    break
+                parts.append("- " + item.get_name)
             else:
-                file_indent = " "*(level +2)
-                result.append(file_indent + "- " + item.get_name)
-        return result
+                stack.pop()
+                node._rendered = parts
+                if stack:
+                    stack[-1][1].append(parts)
+        return folder._rendered
 
-    def add_file_or_folder(self, parent_folder_name: str, name: str, is_folder: bool) -> bool:
+    def _common_ancestor(self, first: FileSystemItem, second: FileSystemItem) -> FileSystemItem:
+        ancestors = set()
+        node: Optional[FileSystemItem] = first
+        while node is not None:
+            ancestors.add(node)
+            node = node.get_parent
+        node = second
+        while node not in ancestors:
+            node = node.get_parent
+        return node
+
+    def _freeze(self, item: FileSystemItem) -> None:
+        item._frozen = item.freeze() if isinstance(item, Folder) else File(item.get_name)
+
+    def _displace(self, item: FileSystemItem, changes: _Changes) -> None:
+        """Notes that item is about to leave its parent or change name; call it before."""
+        if self._mvcc:
+            changes.displaced.append((item.get_parent, item.get_name, item._seq))
+
+    def _publish(self, changes: _Changes) -> None:
+        """
+        Path-copies the frozen tree from the changed folders up to the root and
+        publishes the new root. Untouched subtrees, and every untouched part of
+        a copied folder's child maps, are shared with the previous version, so
+        the cost is O(log n) per changed entry along the copied paths.
+        """
+        with self._publish_lock:
+            depths: Dict[Folder, int] = {}
+            for folder in changes.touched:
+                path = []
+                node: Optional[FileSystemItem] = folder
+                while node is not None and node not in depths:
+                    path.append(node)
+                    node = node.get_parent
+                base = depths[node] + 1 if node is not None else 0
+                for offset, ancestor in enumerate(reversed(path)):
+                    depths[ancestor] = base + offset
+            removed: Dict[Folder, List[Tuple[str, int]]] = {}
+            for parent, name, seq in changes.displaced:
+                removed.setdefault(parent, []).append((name, seq))
+            # every copied folder is also a changed entry of its parent
+            placed: Dict[Folder, Dict[FileSystemItem, None]] = {}
+            for item in chain(changes.created, changes.placed, depths):
+                if item.get_parent is not None:
+                    placed.setdefault(item.get_parent, {})[item] = None
+            # children before parents, so every parent sees its children's new copies
+            for folder in sorted(depths, key=depths.get, reverse=True):
+                folder._frozen = folder._frozen.refrozen(folder.get_name, removed.get(folder, ()),
+                                                         placed.get(folder, ()))
+            # a single reference assignment, so readers see either version whole
+            self._published = self.root._frozen
+
+    def snapshot(self) -> FileSystemSnapshot:
+        """
+        Returns a lock-free, read-only handle on the latest published version.
+        Needs the manager to be created with mvcc=True.
+        """
+        if not self._mvcc:
+            raise RuntimeError("snapshots need FileSystemManagerImpl(..., mvcc=True)")
+        return FileSystemSnapshot(self._published)
+
+    def _invalidate_rendered(self, folder: Optional[FileSystemItem]) -> None:
+        # a clean folder never sits above a dirty one, so stop at the first dirty ancestor
+        while folder is not None and folder._rendered is not None:
+            folder._rendered = None
+            folder = folder.get_parent
+
+    def _add_child(self, parent: Folder, name: str, is_folder: bool, changes: _Changes) -> None:
+        new_item = Folder(name) if is_folder else File(name, self._content_store)
+        if not parent.add_item(new_item):
+            return
+        with self._locks.index_writing():
+            self._label_item(new_item)
+            self._index_item(new_item)
+        changes.touched[parent] = None
+        changes.created[new_item] = None
+        if self._journal is not None:
+            changes.records.append((OP_ADD, self._path_of(parent), name, is_folder))
+        if changes.undo is not None:
+            changes.undo.append(lambda: self._undo_add(new_item, changes))
+
+    def _undo_add(self, item: FileSystemItem, changes: _Changes) -> None:
+        with self._locks.index_writing():
+            # later steps of the batch may have cached paths through the new node
+            self.path_cache.invalidate(item)
+            self._access.invalidate(item)
+            item.get_parent.remove_item(item)
+            self._unindex_item(item)
+            self._labels.unlink(item._enter, item._exit)
+        changes.created.pop(item, None)
+
+    def _move_item(self, source_item: FileSystemItem, final_folder: Folder, changes: _Changes) -> bool:
+        parent_of_source = source_item.get_parent
+        if not isinstance(parent_of_source, Folder):
+            return False
+        with self._locks.index_writing():
+            # refuse moves that would create a cycle or clobber a same-named sibling
+            if self._contains(source_item, final_folder):
+                return False
+            if final_folder.get_item(source_item.get_name) not in (None, source_item):
+                return False
+            if self._journal is not None:
+                changes.records.append((OP_MOVE, self._path_of(source_item), self._path_of(final_folder)))
+            if changes.undo is not None:
+                seq = source_item._seq
+                changes.undo.append(lambda: self._undo_move(source_item, parent_of_source, seq, changes))
+            self.path_cache.invalidate(source_item)
+            self._access.invalidate(source_item)
+            self._displace(source_item, changes)
+            parent_of_source.remove_item(source_item)
+            final_folder.add_item(source_item)
+            changes.placed[source_item] = None
+            self._labels.unlink(source_item._enter, source_item._exit)
+            self._labels.splice_after(final_folder._exit.prev, source_item._enter)
+        changes.touched[parent_of_source] = None
+        changes.touched[final_folder] = None
+        return True
+
+    def _undo_move(self, item: FileSystemItem, original_parent: Folder, seq: int, changes: _Changes) -> None:
+        with self._locks.index_writing():
+            self.path_cache.invalidate(item)
+            self._access.invalidate(item)
+            self._displace(item, changes)
+            item.get_parent.remove_item(item)
+            original_parent.insert_item(item, seq)
+            self._labels.unlink(item._enter, item._exit)
+            previous = original_parent.item_before(item)
+            self._labels.splice_after(original_parent._enter if previous is None else previous._exit, item._enter)
+
+    def _commit(self, changes: _Changes) -> None:
+        if changes.touched:
+            self._version += 1
+        if self._garbage:
+            self._reclaim(RECLAIM_BATCH)
+        if changes.records:
+            changes.lsn = self._journal.append(changes.records)
+        if self._trigram_index is not None:
+            with self._locks.index_writing():
+                for item in changes.created:
+                    if isinstance(item, File):
+                        self._trigram_index.add(item)
+        for folder in changes.touched:
+            self._invalidate_rendered(folder)
+        if self._mvcc:
+            for item in changes.created:
+                self._freeze(item)
+            self._publish(changes)
+
+    def _await_durable(self, changes: _Changes) -> None:
+        """Waits for the journal outside the locks, so concurrent writers share one fsync."""
+        if not changes.lsn:
+            return
+        self._journal.wait(changes.lsn)
+        if self._journal.needs_compaction and not self._checkpoint_lock.locked():
+            self.checkpoint(background=True)
+
+    def add_file_or_folder(self, parent_folder_name: str, name: str, is_folder: bool,
+                           user: Optional[str] = None) -> bool:
         """
         Adds a file or folder to the system.
 
         :param parent_folder_name: the name of the parent folder
         :param name:
         :param is_folder:
+        :param user: check this user's permissions, None to skip the checks
         """
-        parent_folder = self._find_folder(parent_folder_name)
-        if parent_folder:
-            if is_folder:
-                new_folder = Folder(name)
-                parent_folder.add_item(new_folder)
-            else:
-                new_file = File(name)
-                parent_folder.add_item(new_file)
-            return True
-        else:
+        if not is_valid_name(name):
             return False
 
-    def move_file_or_folder(self, source_name: str, destination_folder: str) -> bool:
+        def resolve():
+            parent = self._resolve_folder(parent_folder_name)
+            if parent is not None and not self._allowed(user, parent, WRITE):
+                parent = None
+            return parent, parent
+
+        with self._locks.writing(resolve) as parent_folder:
+            if not parent_folder:
+                return False
+            changes = _Changes()
+            self._add_child(parent_folder, name, is_folder, changes)
+            self._commit(changes)
+        self._await_durable(changes)
+        return True
+
+    def move_file_or_folder(self, source_name: str, destination_folder: str, user: Optional[str] = None) -> bool:
         """
         Moves a file or folder to a new location.
 
         :param source_name: the name of the file or folder to move
         :param destination_folder: the name of the destination folder
+        :param user: check this user's permissions, None to skip the checks
         """
-        final_folder = self._find_folder(destination_folder)
-        if final_folder:
-            parent_of_source, source_item = self._find_parent_folder_and_file_item_recursively(self.root, source_name)
-            if parent_of_source and source_item:
-                parent_of_source.remove_item(source_item)
-                final_folder.add_item(source_item)
-                return True
-            else:
+        def resolve():
+            final = self._resolve_folder(destination_folder)
+            source = self._resolve_item(source_name) if final else None
+            if source is None or source.get_parent is None or not self._may_move(user, source, final):
+                return None, (None, None)
+            # both parents change, so lock the subtree holding both of them
+            return self._common_ancestor(source.get_parent, final), (source, final)
+
+        with self._locks.writing(resolve) as (source_item, final_folder):
+            if not (final_folder and source_item):
                 return False
-        else:
+            changes = _Changes()
+            moved = self._move_item(source_item, final_folder, changes)
+            self._commit(changes)
+        self._await_durable(changes)
+        return moved
+
+    def _may_move(self, user: Optional[str], source: FileSystemItem, final: Folder) -> bool:
+        return self._allowed(user, source.get_parent, WRITE) and self._allowed(user, final, WRITE)
+
+    def add_many(self, items: Iterable[Tuple[str, str, bool]], atomic: bool = False,
+                 user: Optional[str] = None) -> List[bool]:
+        """
+        Adds many files or folders in one batch.
+
+        :param items: (parent_folder_name, name, is_folder) tuples, applied in order
+        :param atomic: if True, either every item is added or none is
+        :param user: check this user's permissions, None to skip the checks
+        :return: one result per item, as add_file_or_folder would return it
+        """
+        return self.apply_batch((AddOperation(*item) for item in items), atomic, user)
+
+    def move_many(self, moves: Iterable[Tuple[str, str]], atomic: bool = False,
+                  user: Optional[str] = None) -> List[bool]:
+        """
+        Moves many files or folders in one batch.
+
+        :param moves: (source_name, destination_folder) tuples, applied in order
+        :param atomic: if True, either every move happens or none does
+        :param user: check this user's permissions, None to skip the checks
+        :return: one result per move, as move_file_or_folder would return it
+        """
+        return self.apply_batch((MoveOperation(*move) for move in moves), atomic, user)
+
+    def apply_batch(self, operations: Iterable[Operation], atomic: bool = False,
+                    user: Optional[str] = None) -> List[bool]:
+        """
+        Applies a mixed sequence of AddOperation and MoveOperation in one batch.
+        The whole batch holds the write lock once, every distinct folder
+        reference is resolved once, and the trigram index, render cache and
+        frozen versions are updated once at the end.
+
+        :param operations: the operations, applied in order
+        :param atomic: if True, a failing operation rolls the whole batch back
+            and every result is False
+        :param user: check this user's permissions, None to skip the checks
+        :return: one result per operation
+        """
+        operations = list(operations)
+        with self._locks.writing(lambda: (self.root, None)):
+            changes = _Changes(atomic)
+            # reference -> folder; adds and moves can change what a reference
+            # resolves to, so the affected entries are dropped as we go
+            resolved: Dict[str, Folder] = {}
+
+            def folder_of(reference: str) -> Optional[Folder]:
+                folder = resolved.get(reference)
+                if folder is None:
+                    folder = self._resolve_folder(reference)
+                    if folder is not None:
+                        resolved[reference] = folder
+                return folder
+
+            results: List[bool] = []
+            for operation in operations:
+                if isinstance(operation, AddOperation):
+                    parent = folder_of(operation.parent_folder_name) if is_valid_name(operation.name) else None
+                    if parent is not None and not self._allowed(user, parent, WRITE):
+                        parent = None
+                    if parent is not None:
+                        self._add_child(parent, operation.name, operation.is_folder, changes)
+                        if operation.is_folder:
+                            resolved.pop(operation.name, None)
+                    results.append(parent is not None)
+                elif isinstance(operation, MoveOperation):
+                    final = folder_of(operation.destination_folder)
+                    source = self._resolve_item(operation.source_name) if final else None
+                    moved = (source is not None and source.get_parent is not None
+                             and self._may_move(user, source, final) and self._move_item(source, final, changes))
+                    if moved:
+                        resolved.clear()
+                    results.append(moved)
+                else:
+                    raise TypeError("unsupported batch operation: {!r}".format(operation))
+                if atomic and not results[-1]:
+                    for undo in reversed(changes.undo):
+                        undo()
+                    changes.records.clear()
+                    results = [False] * len(operations)
+                    break
+            self._commit(changes)
+        self._await_durable(changes)
+        return results
+
+    def _writing_item(self, item_name: str, user: Optional[str]):
+        def resolve():
+            item = self._resolve_item(item_name)
+            if item is None or item.get_parent is None or not self._allowed(user, item.get_parent, WRITE):
+                return None, None
+            return item.get_parent, item
+        return self._locks.writing(resolve)
+
+    def rename_item(self, item_name: str, new_name: str, user: Optional[str] = None) -> bool:
+        """
+        Renames a file or folder in O(1). The item keeps its place in the
+        listing, and nothing below a renamed folder is touched.
+
+        :param item_name: the name or absolute path of the file or folder
+        :param new_name: the new name
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if renamed, False if the item does not exist, the new name is empty or contains "/",
+            or a sibling already has the new name
+        """
+        if not is_valid_name(new_name):
             return False
+        with self._writing_item(item_name, user) as item:
+            if item is None:
+                return False
+            parent = item.get_parent
+            if parent.get_item(new_name) is not None:
+                return False
+            changes = _Changes()
+            if self._journal is not None:
+                changes.records.append((OP_RENAME, self._path_of(item), new_name))
+            with self._locks.index_writing():
+                # inside the index lock, so no resolve can cache the old path again before the rename
+                self.path_cache.invalidate(item)
+                self._displace(item, changes)
+                self._unindex_item(item)
+                parent.rename_item(item, new_name)
+                self._index_item(item)
+            if isinstance(item, File):
+                # re-added to the trigram index under its new name
+                changes.created[item] = None
+            else:
+                item._rendered = None
+                # its frozen copy is refrozen under the new name, sharing the child maps
+                changes.touched[item] = None
+            changes.placed[item] = None
+            changes.touched[parent] = None
+            self._commit(changes)
+        self._await_durable(changes)
+        return True
+
+    def delete_item(self, item_name: str, user: Optional[str] = None) -> bool:
+        """
+        Deletes a file, or a folder with everything below it. The subtree is
+        detached at once; the index entries of its nodes are reclaimed a batch
+        at a time by later mutations (or reclaim()), so deleting a huge folder
+        does not hold the locks for long.
+
+        :param item_name: the name or absolute path of the file or folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if deleted, otherwise False
+        """
+        with self._writing_item(item_name, user) as item:
+            if item is None:
+                return False
+            parent = item.get_parent
+            changes = _Changes()
+            if self._journal is not None:
+                changes.records.append((OP_DELETE, self._path_of(item)))
+            with self._locks.index_writing():
+                self.path_cache.invalidate(item)
+                self._access.invalidate(item)
+                self._displace(item, changes)
+                parent.remove_item(item)
+                self._labels.unlink(item._enter, item._exit)
+                self._garbage.append(item)
+            changes.touched[parent] = None
+            self._commit(changes)
+        self._await_durable(changes)
+        return True
+
+    def reclaim(self) -> int:
+        """
+        Drops every index entry, lock and content chunk still held by deleted
+        nodes, instead of waiting for later mutations to do it.
+
+        :return: the number of nodes reclaimed
+        """
+        with self._locks.writing(lambda: (self.root, None)):
+            return self._reclaim(None)
+
+    def _reclaim(self, budget: Optional[int]) -> int:
+        reclaimed = 0
+        with self._locks.index_writing():
+            while self._garbage and (budget is None or reclaimed < budget):
+                item = self._garbage.pop()
+                if isinstance(item, Folder):
+                    self._garbage.extend(item.get_items)
+                else:
+                    if isinstance(item._content, ChunkedContent):
+                        item._content.truncate(0)
+                self._unindex_item(item)
+                self._locks.forget(item)
+                self._access.forget(item)
+                reclaimed += 1
+        return reclaimed
 
-    def list_contents(self, folder_name: str) -> list:
+    def _writing_file(self, file_name: str, user: Optional[str]):
+        def resolve():
+            item = self._resolve_item(file_name)
+            if not isinstance(item, File) or not self._allowed(user, item, WRITE):
+                return None, None
+            return item.get_parent, item
+        return self._locks.writing(resolve)
+
+    def set_file_content(self, file_name: str, content: str, user: Optional[str] = None) -> bool:
+        """
+        Replaces the content of a file.
+
+        :param file_name: the name or absolute path of the file
+        :param content: the new content
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if the file exists, otherwise False
+        """
+        with self._writing_file(file_name, user) as file:
+            if file is None:
+                return False
+            file.set_content(content)
+            changes = _Changes()
+            if self._journal is not None:
+                changes.records.append((OP_SET_CONTENT, self._path_of(file), content.encode("utf-8")))
+            self._commit(changes)
+        self._await_durable(changes)
+        return True
+
+    def write_file(self, file_name: str, offset: int, data: bytes, user: Optional[str] = None) -> bool:
+        """
+        Overwrites part of a file's content, growing it when the write runs past the end.
+
+        :param file_name: the name or absolute path of the file
+        :param offset: the byte offset to write at, at most the current size
+        :param data: the bytes to write
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if the file exists, otherwise False
+        """
+        with self._writing_file(file_name, user) as file:
+            if file is None:
+                return False
+            file.write(offset, data)
+            changes = _Changes()
+            if self._journal is not None:
+                changes.records.append((OP_WRITE, self._path_of(file), offset, bytes(data)))
+            self._commit(changes)
+        self._await_durable(changes)
+        return True
+
+    def _reading_folder(self, folder_name: str, user: Optional[str] = None):
+        def resolve():
+            folder = self._resolve_folder(folder_name)
+            if folder is not None and not self._allowed(user, folder, READ):
+                folder = None
+            return folder, folder
+        return self._locks.reading(resolve)
+
+    def list_contents(self, folder_name: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                      user: Optional[str] = None) -> list:
         """
         Lists the contents of a specific folder.
 
         :param folder_name: the name of the folder
+        :param cursor: the last name of the previous page; listing resumes right after it
+        :param limit: the maximum number of names to return, None for all of them
+        :param user: check this user's permissions, None to skip the checks
         :return: a list of names of files and folders within the specified folder
         """
-        curr_folder = self._find_folder(folder_name)
-        if curr_folder:
-            return [item.get_name for item in curr_folder.get_items]
-        return []
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if curr_folder:
+                contents = list(islice(iter_children(curr_folder, cursor), limit))
+                self._visited(len(contents))
+                return contents
+            return []
+
+    def iter_contents(self, folder_name: str, cursor: Optional[str] = None, user: Optional[str] = None) -> Iterator[str]:
+        """
+        Lazily yields the contents of a specific folder. The iterator is not
+        synchronized: the folder must not be modified while it is consumed.
 
-    def list_directory_structure(self) -> list:
+        :param folder_name: the name of the folder
+        :param cursor: the name to resume after, None to start from the beginning
+        :param user: check this user's permissions, None to skip the checks
+        :return: an iterator over the names of files and folders within the folder
+        """
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if not curr_folder:
+                return iter(())
+            return iter_children(curr_folder, cursor)
+
+    def list_directory_structure(self, user: Optional[str] = None) -> list:
         """
         Returns the directory structure of each file and folder in the file system.
 
+        :param user: leave out the contents of folders this user cannot read, None to skip the checks
         :return: a list representing the directory structure
         """
-        return self._list_directory(self.root, 0) 
+        with self._locks.reading(lambda: (self.root, self.root)):
+            if user is not None:
+                if not self._allowed(user, self.root, READ):
+                    return []
+                return list(iter_directory(self.root, self._descend(user, self.root)))
+            if self._render_cache:
+                return list(iter_rendered(self._render(self.root)))
+            return list(iter_directory(self.root, self._descend(None, self.root)))
+
+    def iter_directory_structure(self, user: Optional[str] = None) -> Iterator[str]:
+        """
+        Lazily yields the directory structure, line by line, in the same format
+        as list_directory_structure. With the render cache on, the lines come
+        from a consistent snapshot; otherwise the iterator is not synchronized
+        and the tree must not change while it is consumed.
 
-    def search_file_exact_match(self, folder_name: str, file_name: str) -> Optional[str]:
+        :param user: leave out the contents of folders this user cannot read, None to skip the checks
+        :return: an iterator over the lines of the directory structure
+        """
+        if user is not None:
+            if not self._allowed(user, self.root, READ):
+                return iter(())
+            return iter_directory(self.root, self._descend(user, self.root))
+        if self._render_cache:
+            with self._locks.reading(lambda: (self.root, self.root)):
+                return iter_rendered(self._render(self.root))
+        return iter_directory(self.root, self._descend(None, self.root))
+
+    def search_file_exact_match(self, folder_name: str, file_name: str, user: Optional[str] = None) -> Optional[str]:
         """
         Searches for an exact file match within a specific folder.
 
         :param folder_name: the name of the folder to search within
         :param file_name: the exact name of the file to search for
+        :param user: check this user's permissions, None to skip the checks
         :return: the name of the file if found, null otherwise
         """
-        curr_folder = self._find_folder(folder_name)
-        if curr_folder:
-            item = self._find_exact_file_recursively(curr_folder, file_name)
-            if item:
-                return item.get_name
-        return None
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if curr_folder:
+                with self._locks.index_reading():
+                    item = self._find_exact_file_indexed(curr_folder, file_name, user)
+                if item:
+                    return item.get_name
+            return None
 
-    def search_file_like_match(self, folder_name: str, pattern: str) -> list:
+    def search_file_like_match(self, folder_name: str, pattern: str, user: Optional[str] = None) -> list:
         """
         Searches for files by pattern within a specific folder.
 
         :param folder_name: the name of the folder to search within
         :param pattern: the pattern must be part(Contains) of the file name.
+        :param user: check this user's permissions, None to skip the checks
         :return: a list of file names that match the pattern
         """
-        curr_folder = self._find_folder(folder_name)
-        if curr_folder:
-            all_items = self._find_match_file_recursively(curr_folder, pattern)
-            return all_items
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if curr_folder:
+                if self._trigram_index is not None:
+                    with self._locks.index_reading():
+                        return self._find_match_file_indexed(curr_folder, pattern, user)
+                parallel_search = self._parallel_search
+                if (parallel_search is not None and user is None
+                        and curr_folder.get_stats.file_count >= parallel_search.threshold):
+                    matched = parallel_search.find_match_files(self._version, curr_folder, pattern)
+                    if matched is not None:
+                        return matched
+                    if parallel_search.wants_rebuild(self._version):
+                        self._parallel_rebuild = threading.Thread(target=self._rebuild_flat_files, daemon=True)
+                        self._parallel_rebuild.start()
+                all_items = find_match_files(curr_folder, pattern, self._descend(user, curr_folder))
+                return all_items
+            else:
+                return []
+
+    def _rebuild_flat_files(self) -> None:
+        with self._locks.reading(lambda: (self.root, None)):
+            self._parallel_search.rebuild(self.root, self._version)
+
+    def search_files(self, folder_name: str, query: str, syntax: str = GLOB, limit: Optional[int] = None,
+                     ignore_case: bool = False, user: Optional[str] = None) -> Iterator[str]:
+        """
+        Lazily searches for files by glob, regular expression or prefix within
+        a specific folder. Compiled queries are cached, and the walk stops as
+        soon as limit matches are found. The iterator is not synchronized: the
+        folder must not be modified while it is consumed.
+
+        :param folder_name: the name of the folder to search within
+        :param query: e.g. "*.log" for "glob", "^report[0-9]+" for "regex", "rep" for "prefix"
+        :param syntax: "glob", "regex" or "prefix"
+        :param limit: stop after this many matches, None for all of them
+        :param ignore_case: whether to match regardless of case
+        :param user: check this user's permissions, None to skip the checks
+        :return: an iterator over the names of the matching files, breadth-first
+        """
+        matcher = compile_query(query, syntax, ignore_case)
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if not curr_folder:
+                return iter(())
+            files = iter_files(curr_folder, self._descend(user, curr_folder))
+            names = (item.get_name for item in files if matcher(item.get_name))
+            return islice(names, limit)
+
+    def list_matching_files(self, folder_name: str, query: str, syntax: str = GLOB, limit: Optional[int] = None,
+                            ignore_case: bool = False, user: Optional[str] = None) -> List[str]:
+        """
+        Same search as search_files, collected while the folder is locked, so
+        the tree may change as soon as it returns.
+
+        :param folder_name: the name of the folder to search within
+        :param query: e.g. "*.log" for "glob", "^report[0-9]+" for "regex", "rep" for "prefix"
+        :param syntax: "glob", "regex" or "prefix"
+        :param limit: stop after this many matches, None for all of them
+        :param ignore_case: whether to match regardless of case
+        :param user: check this user's permissions, None to skip the checks
+        :return: the names of the matching files, breadth-first
+        """
+        matcher = compile_query(query, syntax, ignore_case)
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if not curr_folder:
+                return []
+            files = iter_files(curr_folder, self._descend(user, curr_folder))
+            return list(islice((item.get_name for item in files if matcher(item.get_name)), limit))
+
+    def search_file_like_match_many(self, folder_name: str, patterns: Iterable[str],
+                                    user: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Runs several like-match searches in one pass over the folder: every
+        name is fed once through an Aho-Corasick automaton of all the patterns.
+
+        :param folder_name: the name of the folder to search within
+        :param patterns: the patterns, each must be part of the file name
+        :param user: check this user's permissions, None to skip the checks
+        :return: for every pattern, the names of the files that match it
+        """
+        matcher = compile_patterns(tuple(patterns))
+        results: Dict[str, List[str]] = {pattern: [] for pattern in matcher.patterns}
+        with self._reading_folder(folder_name, user) as curr_folder:
+            if curr_folder:
+                for item in iter_files(curr_folder, self._descend(user, curr_folder)):
+                    for index in matcher.matches(item.get_name):
+                        results[matcher.patterns[index]].append(item.get_name)
+        return results
+
+    def complete(self, prefix: str, folder: Optional[str] = None, limit: int = 10,
+                 ignore_case: bool = False, user: Optional[str] = None) -> List[str]:
+        """
+        Completes a partially typed file or folder name.
+
+        :param prefix: the beginning of the name
+        :param folder: only complete names found below this folder, None for the whole tree
+        :param limit: the maximum number of completions
+        :param ignore_case: whether the prefix matches regardless of case
+        :param user: only complete names this user can see, None to skip the checks
+        :return: up to limit distinct names starting with prefix, in sorted order
+
+        Names come from the sorted index, each checked for a node inside the
+        folder. Once those checks have looked at as many nodes as the folder
+        holds, its subtree is walked instead, so a scoped call never costs
+        much more than the size of that subtree.
+        """
+        if self._completion_index is None:
+            raise RuntimeError("completion needs FileSystemManagerImpl(..., completion_index=True)")
+
+        def resolve():
+            scope = self.root if folder is None else self._resolve_folder(folder)
+            if scope is not None and not self._allowed(user, scope, READ):
+                scope = None
+            return scope, scope
+
+        with self._locks.reading(resolve) as scope:
+            if scope is None:
+                return []
+            stats = scope.get_stats
+            budget = None if scope is self.root else stats.file_count + stats.folder_count
+            completions: List[str] = []
+            if limit <= 0:
+                return completions
+            with self._locks.index_reading():
+                for name in self._completion_index.iter_prefixed(prefix, ignore_case):
+                    nodes = self._name_index[name]
+                    self._visited(len(nodes))
+                    if budget is not None:
+                        budget -= len(nodes)
+                        if budget < 0:
+                            return self._complete_in(scope, prefix, limit, ignore_case, user)
+                    if any(node is not scope and self._contains(scope, node) and self._alive(node)
+                           and self._visible(user, node) for node in nodes):
+                        completions.append(name)
+                        if len(completions) == limit:
+                            break
+            return completions
+
+    def _complete_in(self, scope: Folder, prefix: str, limit: int, ignore_case: bool,
+                     user: Optional[str]) -> List[str]:
+        """complete() by a walk over scope's subtree, for when the index has too many candidates elsewhere."""
+        if ignore_case:
+            folded = prefix.casefold()
+            names = {item.get_name for item in iter_subtree(scope, self._descend(user, scope))
+                     if item.get_name.casefold().startswith(folded)}
+            return sorted(names, key=lambda name: (name.casefold(), name))[:max(limit, 0)]
+        names = {item.get_name for item in iter_subtree(scope, self._descend(user, scope))
+                 if item.get_name.startswith(prefix)}
+        return sorted(names)[:max(limit, 0)]
+
+    def get_stats(self, folder_name: str, user: Optional[str] = None) -> Optional[FolderStats]:
+        """
+        Returns the totals over a folder's whole subtree without walking it;
+        they are kept up to date by every add, move, delete and content change.
+
+        :param folder_name: the name or absolute path of the folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: (file_count, folder_count, total_size in bytes), None if the folder does not exist
+        """
+        with self._reading_folder(folder_name, user) as folder:
+            return None if folder is None else folder.get_stats
+
+    def set_permissions(self, folder_name: str, user: str, permissions: Optional[int]) -> bool:
+        """
+        Sets one entry of a folder's ACL; subfolders inherit it unless their
+        own ACL says otherwise.
+
+        :param folder_name: the name or absolute path of the folder
+        :param user: the user, or permissions.EVERYONE for everyone without an entry of their own
+        :param permissions: a combination of permissions.READ and permissions.WRITE,
+            or None to remove the entry
+        :return: True if the folder exists, otherwise False
+        """
+        def resolve():
+            folder = self._resolve_folder(folder_name)
+            return folder, folder
+
+        with self._locks.writing(resolve) as folder:
+            if folder is None:
+                return False
+            self._access.set_acl(folder, user, permissions)
+            return True
+
+    def get_permissions(self, item_name: str, user: str) -> int:
+        """
+        :param item_name: the name or absolute path of a file or folder
+        :param user: the user
+        :return: the user's effective permissions on the item, 0 if it does not exist
+        """
+        def resolve():
+            item = self.root if item_name in ("/", self.root.get_name) else self._resolve_item(item_name)
+            return item, item
+
+        with self._locks.reading(resolve) as item:
+            return 0 if item is None else self._access.effective(user, item)
+
+    def add(self, path: str, name: str, is_folder: bool, user: Optional[str] = None) -> bool:
+        """
+        Adds a file or folder under the folder at the given path.
+
+        :param path: the absolute path of the parent folder, e.g. "/a/b"
+        :param name: the name of the file or folder to add
+        :param is_folder: whether the new item is a folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if added successfully, otherwise False
+        """
+        if not is_path(path):
+            return False
+        return self.add_file_or_folder(path, name, is_folder, user)
+
+    def move(self, source_path: str, destination_path: str, user: Optional[str] = None) -> bool:
+        """
+        Moves the file or folder at source_path into the folder at destination_path.
+
+        :param source_path: the absolute path of the item to move, e.g. "/a/b/c"
+        :param destination_path: the absolute path of the destination folder
+        :param user: check this user's permissions, None to skip the checks
+        :return: True if moved successfully, otherwise False
+        """
+        if not (is_path(source_path) and is_path(destination_path)):
+            return False
+        return self.move_file_or_folder(source_path, destination_path, user)
+
+    def save_snapshot(self, path: str) -> int:
+        """
+        Writes the whole tree to path in the compact binary snapshot format.
+
+        :param path: the file to write
+        :return: the number of nodes written
+        """
+        with self._locks.reading(lambda: (self.root, None)):
+            return write_snapshot(path, self.root)
+
+    def load_snapshot(self, path: str) -> int:
+        """
+        Replaces the tree with the one saved at path. The file is read in one
+        go and the tree, name index, labels and optional indexes are built in
+        bulk, without going through add_file_or_folder per node.
+
+        :param path: a file written by save_snapshot
+        :return: the number of nodes loaded
+        """
+        data = read_snapshot(path)
+        with self._locks.writing(lambda: (self.root, None)):
+            self._build_from_snapshot(data)
+        return len(data.name_ids)
+
+    def _build_from_snapshot(self, data: SnapshotData) -> None:
+        strings, name_ids, parent_deltas, kinds = data.strings, data.name_ids, data.parent_deltas, data.kinds
+        store = self._content_store
+        count = len(name_ids)
+        nodes: List[FileSystemItem] = [None] * count
+        name_index: Dict[str, Dict[FileSystemItem, None]] = {}
+        for index in range(count):
+            name = strings[name_ids[index]]
+            node = Folder(name) if kinds[index] else File(name, store)
+            nodes[index] = node
+            bucket = name_index.get(name)
+            if bucket is None:
+                name_index[name] = {node: None}
+            else:
+                bucket[node] = None
+
+        for index, kind, length, payload in data.contents:
+            if kind == CONTENT_CHUNKED:
+                if store is None:
+                    raise ValueError("snapshot references chunked content but no content_store is configured")
+                nodes[index]._content = ChunkedContent.restore(store, payload, length)
+            else:
+                nodes[index].set_content(payload.decode("utf-8"))
+
+        # attach without per-add stats (O(depth) each), then sum the totals
+        # bottom-up: in reverse pre-order every subtree is complete before its parent
+        for index in range(1, count):
+            nodes[index - parent_deltas[index]]._attach(nodes[index])
+        for index in range(count - 1, 0, -1):
+            files, folders, size = Folder._stats_of(nodes[index])
+            parent = nodes[index - parent_deltas[index]]
+            parent._file_count += files
+            parent._folder_count += folders
+            parent._total_size += size
+
+        # pre-order is the Euler tour minus the exit tokens: emit a folder's
+        # exit once the walk leaves its subtree
+        labels = OrderList()
+        tokens = iter(labels.extend(labels.head, count + sum(kinds)))
+        open_folders: List[int] = []
+        for index in range(count):
+            parent = index - parent_deltas[index] if index else -1
+            while open_folders and open_folders[-1] != parent:
+                nodes[open_folders.pop()]._exit = next(tokens)
+            node = nodes[index]
+            node._enter = next(tokens)
+            if kinds[index]:
+                open_folders.append(index)
+            else:
+                node._exit = node._enter
+        while open_folders:
+            nodes[open_folders.pop()]._exit = next(tokens)
+
+        self.root = nodes[0]
+        self._version += 1
+        self._garbage = []
+        if store is not None:
+            # chunks of the replaced tree, or left over from an earlier run, are free again
+            store.release_unreferenced(self._chunk_ids())
+        self._access.clear()
+        self._name_index = name_index
+        self._labels = labels
+        self.path_cache.clear()
+        if self._completion_index is not None:
+            self._completion_index = CompletionIndex.from_names(name_index)
+        if self._trigram_index is not None:
+            self._trigram_index = TrigramIndex()
+            for index in range(count):
+                if not kinds[index]:
+                    self._trigram_index.add(nodes[index])
+        if self._mvcc:
+            # children before parents
+            for node in reversed(nodes):
+                self._freeze(node)
+            self._published = self.root._frozen
+
+    def recover(self) -> int:
+        """
+        Restores the state held by the journal: loads its newest snapshot,
+        if any, and replays the log written after it. Torn records at the end
+        of the log are ignored.
+
+        :return: the number of replayed operations
+        """
+        journal = self._journal
+        if journal is None:
+            raise RuntimeError("recovery needs FileSystemManagerImpl(..., journal=Journal(...))")
+        latest = journal.latest_snapshot()
+        if latest is not None:
+            self.load_snapshot(latest[1])
+            if self._content_store is not None:
+                # the snapshot stays the recovery base until the next checkpoint
+                self._content_store.pin(self._chunk_ids())
+                self._content_store.commit_pins()
+        replayed = 0
+        # replaying goes through the public operations, which must not log again
+        self._journal = None
+        try:
+            for segment in journal.segments_from(latest[0] if latest else 0):
+                for records in read_frames(segment)[0]:
+                    for record in records:
+                        self._replay(record)
+                        replayed += 1
+        finally:
+            self._journal = journal
+        return replayed
+
+    def _replay(self, record: Record) -> None:
+        op = record[0]
+        if op == OP_ADD:
+            self.add(record[1], record[2], record[3])
+        elif op == OP_MOVE:
+            self.move(record[1], record[2])
+        elif op == OP_SET_CONTENT:
+            self.set_file_content(record[1], record[2].decode("utf-8"))
+        elif op == OP_WRITE:
+            self.write_file(record[1], record[2], record[3])
+        elif op == OP_RENAME:
+            self.rename_item(record[1], record[2])
+        elif op == OP_DELETE:
+            self.delete_item(record[1])
         else:
-            return []
+            raise ValueError("unsupported journal record: {!r}".format(record))
+
+    def _chunk_ids(self) -> Iterator[int]:
+        """Every content chunk the tree refers to."""
+        for item in iter_files(self.root):
+            if isinstance(item._content, ChunkedContent):
+                yield from item._content.chunks
+
+    def checkpoint(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Compacts the journal: starts a new log segment, writes a snapshot of
+        the state at that point and deletes the log and snapshots it replaces.
+        Writers wait while the snapshot is written; readers do not.
+
+        :param background: run on a daemon thread and return it
+        """
+        if self._journal is None:
+            raise RuntimeError("checkpoints need FileSystemManagerImpl(..., journal=Journal(...))")
+        if background:
+            thread = threading.Thread(target=self.checkpoint, name="journal-checkpoint", daemon=True)
+            thread.start()
+            return thread
+        with self._checkpoint_lock:
+            with self._locks.reading(lambda: (self.root, None)):
+                number = self._journal.rotate()
+                if self._content_store is not None:
+                    self._content_store.flush()
+                    # from here on, writes copy the chunks the snapshot refers to
+                    self._content_store.pin(self._chunk_ids())
+                path = self._journal.snapshot_path(number)
+                write_snapshot(path + ".tmp", self.root)
+            with open(path + ".tmp", "rb") as handle:
+                os.fsync(handle.fileno())
+            os.replace(path + ".tmp", path)
+            if self._content_store is not None:
+                self._content_store.commit_pins()
+            self._journal.discard_before(number)
+        return None
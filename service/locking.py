@@ -0,0 +1,199 @@
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple, TypeVar
+from models.file_system_item import FileSystemItem
+
+T = TypeVar("T")
+# a resolver returns (node to lock, value handed to the caller); it is re-run
+# once the locks are held so the caller always sees the locked state
+Resolver = Callable[[], Tuple[Optional[FileSystemItem], T]]
+
+
+class ReadWriteLock:
+    """
+    Readers-writer lock. Any number of readers share it, writers get it
+    exclusively, and waiting writers block new readers so they cannot starve.
+    Not reentrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+# multiple-granularity lock modes
+IS, IX, S, X = "IS", "IX", "S", "X"
+_COMPATIBLE = {
+    IS: {IS, IX, S},
+    IX: {IS, IX},
+    S: {IS, S},
+    X: set(),
+}
+
+
+class IntentionLock:
+    """
+    Multiple-granularity lock (IS/IX/S/X). Holding S or X on a folder covers
+    its whole subtree; IS/IX on the ancestors announce what happens below.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._held: Dict[str, int] = {IS: 0, IX: 0, S: 0, X: 0}
+
+    def acquire(self, mode: str) -> None:
+        with self._cond:
+            while any(count and held not in _COMPATIBLE[mode] for held, count in self._held.items()):
+                self._cond.wait()
+            self._held[mode] += 1
+
+    def release(self, mode: str) -> None:
+        with self._cond:
+            self._held[mode] -= 1
+            if not self._held[mode]:
+                self._cond.notify_all()
+
+
+class GlobalLocking:
+    """A single readers-writer lock over the whole tree and its indexes."""
+
+    def __init__(self):
+        self._lock = ReadWriteLock()
+
+    @contextmanager
+    def reading(self, resolve: Resolver) -> Iterator[T]:
+        with self._lock.read_locked():
+            yield resolve()[1]
+
+    @contextmanager
+    def writing(self, resolve: Resolver) -> Iterator[T]:
+        with self._lock.write_locked():
+            yield resolve()[1]
+
+    def index_reading(self) -> ContextManager[None]:
+        return nullcontext()
+
+    def index_writing(self) -> ContextManager[None]:
+        return nullcontext()
+
+    def forget(self, node: FileSystemItem) -> None:
+        pass
+
+
+class SubtreeLocking:
+    """
+    Per-folder intention locks, always taken top-down from the root
+    (hierarchical ordering, so no deadlocks). Reading a subtree takes S on its
+    folder and IS on the ancestors; writing takes X and IX. Writes to disjoint
+    subtrees therefore only meet on the shared indexes, which sit behind a
+    separate readers-writer lock held for short sections.
+    """
+
+    def __init__(self):
+        self._index_lock = ReadWriteLock()
+        self._node_locks: Dict[FileSystemItem, IntentionLock] = {}
+        self._node_locks_guard = threading.Lock()
+
+    def reading(self, resolve: Resolver) -> ContextManager[T]:
+        return self._locked(resolve, IS, S)
+
+    def writing(self, resolve: Resolver) -> ContextManager[T]:
+        return self._locked(resolve, IX, X)
+
+    def index_reading(self) -> ContextManager[None]:
+        return self._index_lock.read_locked()
+
+    def index_writing(self) -> ContextManager[None]:
+        return self._index_lock.write_locked()
+
+    def forget(self, node: FileSystemItem) -> None:
+        """Drops the lock of a node that left the tree."""
+        with self._node_locks_guard:
+            self._node_locks.pop(node, None)
+
+    def _lock_of(self, node: FileSystemItem) -> IntentionLock:
+        lock = self._node_locks.get(node)
+        if lock is None:
+            with self._node_locks_guard:
+                lock = self._node_locks.setdefault(node, IntentionLock())
+        return lock
+
+    @contextmanager
+    def _locked(self, resolve: Resolver, intention: str, mode: str) -> Iterator[T]:
+        while True:
+            with self._index_lock.read_locked():
+                target, value = resolve()
+            if target is None:
+                yield value
+                return
+            chain = _path_from_root(target)
+            acquired = []
+            try:
+                for node in chain[:-1]:
+                    self._lock_of(node).acquire(intention)
+                    acquired.append((node, intention))
+                self._lock_of(target).acquire(mode)
+                acquired.append((target, mode))
+                # the target may have moved, or the name may now resolve
+                # elsewhere, between resolving and locking: check and retry
+                with self._index_lock.read_locked():
+                    current, value = resolve()
+                if current is target and _path_from_root(target) == chain:
+                    yield value
+                    return
+            finally:
+                for node, held in reversed(acquired):
+                    self._lock_of(node).release(held)
+
+
+def _path_from_root(node: FileSystemItem) -> List[FileSystemItem]:
+    chain = []
+    current: Optional[FileSystemItem] = node
+    while current is not None:
+        chain.append(current)
+        current = current.get_parent
+    chain.reverse()
+    return chain
@@ -0,0 +1,160 @@
+import functools
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from models.folder import Folder
+
+
+class MetricsSink:
+    """
+    Receives one sample per instrumented call. Samples arrive from whichever
+    thread made the call, so implementations must be thread-safe.
+    """
+
+    def record(self, operation: str, seconds: float, visited: int) -> None:
+        """
+        :param operation: the manager method that was called
+        :param seconds: wall time spent in it, including consuming a returned iterator
+        :param visited: nodes and index entries the call looked at
+        """
+        raise NotImplementedError
+
+
+class OperationStats(NamedTuple):
+    count: int
+    total_seconds: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+    mean_visited: float
+
+    @property
+    def throughput(self) -> float:
+        """Calls per second of time spent in the operation."""
+        return self.count / self.total_seconds if self.total_seconds else float("inf")
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not ordered:
+        return 0.0
+    rank = math.ceil(fraction * len(ordered)) - 1
+    return ordered[max(0, min(len(ordered) - 1, rank))]
+
+
+class InMemoryMetrics(MetricsSink):
+    """Keeps every sample, for benchmarks and tests."""
+
+    def __init__(self):
+        self._samples: Dict[str, List[Tuple[float, int]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, seconds: float, visited: int) -> None:
+        with self._lock:
+            self._samples.setdefault(operation, []).append((seconds, visited))
+
+    def summary(self) -> Dict[str, OperationStats]:
+        with self._lock:
+            samples = {operation: list(values) for operation, values in self._samples.items()}
+        stats = {}
+        for operation, values in sorted(samples.items()):
+            times = sorted(seconds for seconds, _ in values)
+            stats[operation] = OperationStats(len(values), sum(times), percentile(times, 0.5),
+                                              percentile(times, 0.9), percentile(times, 0.99), times[-1],
+                                              sum(visited for _, visited in values) / len(values))
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+class _Call:
+    __slots__ = ("operation", "seconds", "visited")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.seconds = 0.0
+        self.visited = 0
+
+
+class Instrumentation:
+    """
+    Times a manager's public operations and counts the nodes they visit,
+    reporting one sample per outermost call to a MetricsSink.
+
+    The call in progress is kept per thread; calls made from inside another
+    instrumented call are part of it. A returned iterator stays attributed to
+    its call and the sample is recorded once it is exhausted or closed.
+    """
+
+    def __init__(self, sink: MetricsSink):
+        self.sink = sink
+        self._local = threading.local()
+
+    def wrap(self, operation: str, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if getattr(self._local, "call", None) is not None:
+                return function(*args, **kwargs)
+            call = _Call(operation)
+            self._local.call = call
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                self._finish(call, start)
+                raise
+            if isinstance(result, Iterator):
+                call.seconds = time.perf_counter() - start
+                self._local.call = None
+                return self._consume(call, result)
+            self._finish(call, start)
+            return result
+
+        return timed
+
+    def _finish(self, call: _Call, start: float) -> None:
+        call.seconds += time.perf_counter() - start
+        self._local.call = None
+        self.sink.record(call.operation, call.seconds, call.visited)
+
+    def _consume(self, call: _Call, iterator: Iterator) -> Iterator:
+        # only the time spent producing items counts, not the consumer's
+        try:
+            while True:
+                outer = getattr(self._local, "call", None)
+                self._local.call = call
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    call.seconds += time.perf_counter() - start
+                    self._local.call = outer
+                yield item
+        finally:
+            self.sink.record(call.operation, call.seconds, call.visited)
+
+    def visit(self, count: int = 1) -> None:
+        call = getattr(self._local, "call", None)
+        if call is not None:
+            call.visited += count
+
+    def counting(self, start: Folder, descend: Optional[Callable[[Folder], bool]]) -> Callable[[Folder], bool]:
+        """
+        Wraps a traversal's descend callback so that every folder the walk
+        enters adds its children to the visit count, start included.
+        """
+        self.visit(len(start.get_items))
+
+        def counted(folder: Folder) -> bool:
+            if descend is not None and not descend(folder):
+                return False
+            self.visit(len(folder.get_items))
+            return True
+
+        return counted
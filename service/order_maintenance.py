@@ -0,0 +1,127 @@
+from typing import Iterator, List, Optional
+
+# spacing used when appending after the last token
+APPEND_STRIDE = 1 << 32
+# density threshold base, 1 < T < 2 (Bender et al., "Two simplified algorithms
+# for maintaining order in a list")
+DENSITY = 1.5
+
+
+class OrderToken:
+    __slots__ = ("label", "prev", "next")
+
+    def __init__(self):
+        self.label = 0
+        self.prev: Optional["OrderToken"] = None
+        self.next: Optional["OrderToken"] = None
+
+
+class OrderList:
+    """
+    Order-maintenance list: a linked list of tokens carrying integer labels
+    that increase along the list, so "does a come before b" is one comparison.
+
+    Inserting takes the midpoint between the neighbours' labels. When there is
+    no gap left, the smallest enclosing power-of-two label range that is sparse
+    enough is relabeled evenly, which keeps the amortized relabeling cost at
+    O(log n) per insert.
+    """
+
+    def __init__(self):
+        self.head = OrderToken()
+
+    def insert_after(self, anchor: OrderToken, token: Optional[OrderToken] = None) -> OrderToken:
+        """Links token (or a fresh one) directly after anchor and labels it."""
+        if token is None:
+            token = OrderToken()
+        if anchor.next is not None and anchor.next.label - anchor.label < 2:
+            self._relabel_around(anchor)
+        following = anchor.next
+        if following is None:
+            token.label = anchor.label + APPEND_STRIDE
+        else:
+            token.label = (anchor.label + following.label) // 2
+        token.prev, token.next = anchor, following
+        anchor.next = token
+        if following is not None:
+            following.prev = token
+        return token
+
+    def extend(self, anchor: OrderToken, count: int) -> List[OrderToken]:
+        """
+        Appends count evenly spaced tokens after anchor, which must be the last
+        token. Used to label a whole tree in one pass on bulk loads.
+        """
+        if anchor.next is not None:
+            raise ValueError("extend() appends after the last token only")
+        tokens = []
+        label = anchor.label
+        previous = anchor
+        for _ in range(count):
+            label += APPEND_STRIDE
+            token = OrderToken()
+            token.label = label
+            token.prev = previous
+            previous.next = token
+            tokens.append(token)
+            previous = token
+        return tokens
+
+    def unlink(self, first: OrderToken, last: OrderToken) -> None:
+        """Detaches the contiguous run first..last; the run keeps its own links."""
+        before, after = first.prev, last.next
+        before.next = after
+        if after is not None:
+            after.prev = before
+        first.prev = None
+        last.next = None
+
+    def splice_after(self, anchor: OrderToken, first: OrderToken) -> OrderToken:
+        """
+        Relinks a detached run starting at first after anchor, relabeling each
+        token on the way in. Returns the last token of the run.
+        """
+        token: Optional[OrderToken] = first
+        last = anchor
+        while token is not None:
+            following = token.next
+            token.prev = token.next = None
+            last = self.insert_after(last, token)
+            token = following
+        return last
+
+    def iter_run(self, first: OrderToken, last: OrderToken) -> Iterator[OrderToken]:
+        token: Optional[OrderToken] = first
+        while token is not None:
+            yield token
+            if token is last:
+                return
+            token = token.next
+
+    def _relabel_around(self, anchor: OrderToken) -> None:
+        lo = hi = anchor
+        count = 1
+        level = 0
+        while True:
+            level += 1
+            size = 1 << level
+            lo_label = anchor.label & ~(size - 1)
+            hi_label = lo_label + size
+            while lo.prev is not None and lo.prev.label >= lo_label:
+                lo = lo.prev
+                count += 1
+            while hi.next is not None and hi.next.label < hi_label:
+                hi = hi.next
+                count += 1
+            # room for the pending insert as well
+            if count + 1 <= size / DENSITY ** level:
+                break
+        gap = size // (count + 1)
+        label = lo_label
+        token: Optional[OrderToken] = lo
+        while True:
+            token.label = label
+            if token is hi:
+                break
+            label += gap
+            token = token.next
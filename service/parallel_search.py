@@ -0,0 +1,140 @@
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, List, Optional
+from models.folder import Folder
+
+# below this many files in the searched subtree the serial scan is faster
+# than shipping names to the workers
+DEFAULT_THRESHOLD = 200_000
+# partitions per worker, so a slow partition does not hold up the whole search
+PARTITIONS_PER_WORKER = 4
+
+
+def _scan(names: List[str], ranks: array, pattern: str) -> List[int]:
+    """Runs in a worker: returns the BFS ranks of the names containing pattern."""
+    return [rank for name, rank in zip(names, ranks) if pattern in name.lower()]
+
+
+class _FlatFiles:
+    """
+    Every file of the tree as plain columns, sorted by enter label (pre-order),
+    so the files of any subtree form one contiguous slice found by bisection.
+    ranks holds each file's breadth-first position, to restore BFS order.
+    """
+
+    def __init__(self, root: Folder):
+        found = []
+        folders: Deque[Folder] = deque([root])
+        while folders:
+            for item in folders.popleft().get_items:
+                if isinstance(item, Folder):
+                    folders.append(item)
+                else:
+                    found.append((item._enter.label, len(found), item.get_name))
+        found.sort()
+        self.labels = array("q", (label for label, _, _ in found))
+        self.ranks = array("I", (rank for _, rank, _ in found))
+        self.names = [name for _, _, name in found]
+        self.by_rank = [""] * len(found)
+        for rank, name in zip(self.ranks, self.names):
+            self.by_rank[rank] = name
+
+
+class ParallelSearch:
+    """
+    Scans large subtrees in a process pool.
+
+    Workers receive name lists and rank arrays, never node objects. They scan
+    a flattened copy of the tree, tagged with the version it was taken at
+    (the owner bumps its version on every mutation). A stale copy is never
+    rebuilt on the query path: the owner scans serially and, once the tree
+    has stayed unchanged across two large searches, rebuilds the copy in the
+    background, so bursts of reads go parallel and write-heavy use pays nothing.
+    """
+
+    def __init__(self, workers: Optional[int] = None, threshold: int = DEFAULT_THRESHOLD):
+        """
+        :param workers: worker processes, os.cpu_count() by default
+        :param threshold: the smallest number of files in the searched
+            subtree for which the pool is used
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._flat: Optional[_FlatFiles] = None
+        self._version = -1
+        # the version the last stale search saw, and whether a rebuild is under way
+        self._stale_seen = -1
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ParallelSearch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @staticmethod
+    def _subtree(flat: _FlatFiles, folder: Folder) -> range:
+        return range(bisect_left(flat.labels, folder._enter.label), bisect_right(flat.labels, folder._exit.label))
+
+    def wants_rebuild(self, version: int) -> bool:
+        """
+        Called after a large search found the copy stale. True when the tree
+        was already at this version for the previous stale search and no
+        rebuild is running; the caller should then run rebuild() off the
+        query path.
+        """
+        with self._lock:
+            if self._version == version or self._rebuilding:
+                return False
+            quiet = self._stale_seen == version
+            self._stale_seen = version
+            self._rebuilding = quiet
+            return quiet
+
+    def rebuild(self, root: Folder, version: int) -> None:
+        """Flattens the tree; the caller keeps it from changing meanwhile."""
+        try:
+            flat = _FlatFiles(root)
+            with self._lock:
+                self._flat = flat
+                self._version = version
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers)
+        finally:
+            self._rebuilding = False
+
+    def find_match_files(self, version: int, folder: Folder, pattern: str) -> Optional[List[str]]:
+        """
+        Same result as traversal.find_match_files(folder, pattern), or None
+        when the copy is stale or the subtree is below the threshold, and it
+        should be scanned serially.
+
+        :param version: changes whenever the tree does
+        """
+        with self._lock:
+            flat = self._flat if self._version == version else None
+            executor = self._executor
+        if flat is None:
+            return None
+        subtree = self._subtree(flat, folder)
+        lo, hi = subtree.start, subtree.stop
+        if hi - lo < self.threshold:
+            return None
+        pattern = pattern.lower()
+        step = -(-(hi - lo) // (self.workers * PARTITIONS_PER_WORKER))
+        futures = [executor.submit(_scan, flat.names[start:min(start + step, hi)],
+                                   flat.ranks[start:min(start + step, hi)], pattern)
+                   for start in range(lo, hi, step)]
+        ranks = sorted(rank for future in futures for rank in future.result())
+        return [flat.by_rank[rank] for rank in ranks]
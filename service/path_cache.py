@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from models.file_system_item import FileSystemItem
+
+
+class PathCache:
+    """
+    Bounded LRU cache of resolved path -> node.
+
+    Every entry remembers the nodes it was resolved through, so invalidating a
+    node drops exactly the cached paths that pass through it and nothing else.
+    Lookups reorder the LRU, so every operation takes an internal mutex.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        if capacity < 0:
+            raise ValueError("capacity must be >= 0")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[FileSystemItem, ...]]" = OrderedDict()
+        self._dependents: Dict[FileSystemItem, Set[str]] = {}
+        self._mutex = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: str) -> Optional[FileSystemItem]:
+        with self._mutex:
+            chain = self._entries.get(path)
+            if chain is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return chain[-1]
+
+    def put(self, path: str, chain: Sequence[FileSystemItem]) -> None:
+        """
+        Caches a resolved path.
+
+        :param path: the normalized path
+        :param chain: the nodes visited while resolving it, the target last
+        """
+        if self.capacity == 0 or not chain:
+            return
+        with self._mutex:
+            if path in self._entries:
+                self._discard(path)
+            self._entries[path] = tuple(chain)
+            for node in chain:
+                self._dependents.setdefault(node, set()).add(path)
+            while len(self._entries) > self.capacity:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def invalidate(self, node: FileSystemItem) -> None:
+        """Drops every cached path resolved through the given node."""
+        with self._mutex:
+            for path in list(self._dependents.get(node, ())):
+                self._discard(path)
+
+    def clear(self) -> None:
+        with self._mutex:
+            self._entries.clear()
+            self._dependents.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "capacity": self.capacity}
+
+    def _discard(self, path: str) -> None:
+        chain = self._entries.pop(path)
+        for node in chain:
+            paths = self._dependents.get(node)
+            if paths is None:
+                continue
+            paths.discard(path)
+            if not paths:
+                del self._dependents[node]
+
+
+def split_path(path: str) -> List[str]:
+    """Splits an absolute path such as "/a/b" into its segments; "/" is the root."""
+    return [segment for segment in path.split("/") if segment]
+
+
+def is_path(reference: str) -> bool:
+    return reference.startswith("/")
+
+
+def is_valid_name(name: str) -> bool:
+    """Names are path segments, so they must be non-empty and free of "/"."""
+    return bool(name) and "/" not in name
@@ -0,0 +1,116 @@
+import threading
+from typing import Dict, Optional
+from models.file_system_item import FileSystemItem
+from models.folder import Folder
+
+NONE = 0
+READ = 1
+WRITE = 2
+ALL = READ | WRITE
+# ACL entry that applies to every user without an entry of their own
+EVERYONE = "*"
+
+
+class AccessControl:
+    """
+    Per-folder ACLs that subfolders inherit.
+
+    A folder's ACL maps users (or EVERYONE) to READ/WRITE flags. A user's
+    permissions on a folder come from the nearest ACL entry for them on the
+    way up to the root, falling back to the default. Reaching a folder also
+    takes READ on its parent, as with directories on disk, so a folder below
+    an unreadable one grants nothing: tree walks can skip whole subtrees, and
+    index lookups see the same answer. Files have their folder's permissions.
+
+    Effective permissions are cached per folder and user. A folder is only
+    cached once its parent is, so the cached folders of a subtree hang off
+    the subtree's root and invalidating it (an ACL change, a move) walks just
+    those entries, never the whole cache.
+    """
+
+    def __init__(self, default: int = ALL):
+        """
+        :param default: permissions of every user where no ACL says otherwise
+        """
+        self.default = default
+        self._acls: Dict[Folder, Dict[str, int]] = {}
+        self._cache: Dict[Folder, Dict[str, int]] = {}
+        # cached folder -> its cached subfolders
+        self._below: Dict[Folder, Dict[Folder, None]] = {}
+        self._mutex = threading.Lock()
+
+    def get_acl(self, folder: Folder) -> Dict[str, int]:
+        return dict(self._acls.get(folder, {}))
+
+    def set_acl(self, folder: Folder, user: str, permissions: Optional[int]) -> None:
+        """Sets, or with None removes, one user's entry on folder."""
+        with self._mutex:
+            acl = self._acls.setdefault(folder, {})
+            if permissions is None:
+                acl.pop(user, None)
+            else:
+                acl[user] = permissions
+            if not acl:
+                del self._acls[folder]
+        self.invalidate(folder)
+
+    def effective(self, user: str, item: FileSystemItem) -> int:
+        folder = item if isinstance(item, Folder) else item.get_parent
+        entries = self._cache.get(folder)
+        cached = entries.get(user) if entries else None
+        if cached is not None:
+            return cached
+        with self._mutex:
+            # climb to the nearest cached ancestor (or above the root), then
+            # resolve back down, caching every folder on the way
+            chain = []
+            while folder is not None:
+                entries = self._cache.get(folder)
+                cached = entries.get(user) if entries else None
+                if cached is not None:
+                    break
+                chain.append(folder)
+                folder = folder.get_parent
+            permissions = self.default if cached is None else cached
+            for folder in reversed(chain):
+                reachable = folder.get_parent is None or permissions & READ
+                acl = self._acls.get(folder)
+                if acl:
+                    permissions = acl.get(user, acl.get(EVERYONE, permissions))
+                if not reachable:
+                    permissions = NONE
+                entries = self._cache.get(folder)
+                if entries is None:
+                    entries = self._cache[folder] = {}
+                    if folder.get_parent is not None:
+                        self._below.setdefault(folder.get_parent, {})[folder] = None
+                entries[user] = permissions
+        return permissions
+
+    def invalidate(self, folder: FileSystemItem) -> None:
+        """
+        Drops the cached permissions of every folder in folder's subtree.
+        Call it while folder is still under its current parent.
+        """
+        if not isinstance(folder, Folder):
+            return
+        with self._mutex:
+            siblings = self._below.get(folder.get_parent)
+            if siblings is not None:
+                siblings.pop(folder, None)
+            pending = [folder]
+            while pending:
+                current = pending.pop()
+                self._cache.pop(current, None)
+                pending.extend(self._below.pop(current, ()))
+
+    def forget(self, folder: FileSystemItem) -> None:
+        """Drops the ACL of a folder that left the tree."""
+        with self._mutex:
+            self._acls.pop(folder, None)
+
+    def clear(self) -> None:
+        with self._mutex:
+            self._acls.clear()
+            self._cache.clear()
+            self._below.clear()
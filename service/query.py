@@ -0,0 +1,92 @@
+import re
+from collections import deque
+from fnmatch import translate
+from functools import lru_cache
+from typing import Callable, Deque, Dict, List, Sequence, Set, Tuple
+
+GLOB = "glob"
+REGEX = "regex"
+PREFIX = "prefix"
+SYNTAXES = (GLOB, REGEX, PREFIX)
+
+# compiled queries kept around; UIs tend to repeat the same few queries
+QUERY_CACHE_SIZE = 256
+
+Matcher = Callable[[str], bool]
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_query(query: str, syntax: str = GLOB, ignore_case: bool = False) -> Matcher:
+    """
+    Compiles a name query into a predicate, once per distinct query.
+
+    Globs ("*.log", "report-??.txt") and prefixes match the whole name from
+    its start; regular expressions match anywhere in the name (re.search).
+    """
+    if syntax == PREFIX:
+        if ignore_case:
+            prefix = query.casefold()
+            return lambda name: name.casefold().startswith(prefix)
+        return lambda name: name.startswith(query)
+    flags = re.IGNORECASE if ignore_case else 0
+    if syntax == GLOB:
+        return re.compile(translate(query), flags).match
+    if syntax == REGEX:
+        return re.compile(query, flags).search
+    raise ValueError("syntax must be one of {}".format(", ".join(SYNTAXES)))
+
+
+class MultiPatternMatcher:
+    """
+    Aho-Corasick automaton over many substrings, so every pattern is checked
+    against a name in one pass over its characters. Matching is
+    case-insensitive, like search_file_like_match.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = tuple(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # indexes of the patterns ending at each state, including via fail links
+        self._output: List[Set[int]] = [set()]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern.lower():
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = len(self._goto)
+                    self._goto[state][char] = following
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                state = following
+            self._output[state].add(index)
+
+        pending: Deque[int] = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, following in self._goto[state].items():
+                pending.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[following] = target if target != following else 0
+                self._output[following] |= self._output[self._fail[following]]
+
+    def matches(self, name: str) -> Set[int]:
+        """The indexes of the patterns contained in name."""
+        found = set(self._output[0])
+        state = 0
+        for char in name.lower():
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_patterns(patterns: Tuple[str, ...]) -> MultiPatternMatcher:
+    return MultiPatternMatcher(patterns)
@@ -0,0 +1,67 @@
+from itertools import islice
+from typing import Iterator, Optional
+from models.folder import Folder
+from service.path_cache import is_path
+from service.traversal import find_exact_file, find_folder, find_match_files, iter_children, iter_directory, resolve_path
+
+
+class FileSystemSnapshot:
+    """
+    Read-only handle on one published version of the tree.
+
+    The version is immutable, so reads take no locks and never see a
+    half-applied change. Nothing is copied when the handle is taken; the
+    version is reclaimed as soon as the last handle referencing it is closed
+    or dropped. Bare folder names resolve breadth-first, shallowest first.
+    """
+
+    def __init__(self, root: Folder):
+        self._root: Optional[Folder] = root
+
+    def __enter__(self) -> "FileSystemSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._root = None
+
+    def _resolve_folder(self, reference: str) -> Optional[Folder]:
+        if self._root is None:
+            raise RuntimeError("snapshot is closed")
+        if is_path(reference):
+            folder = resolve_path(self._root, reference)
+            return folder if isinstance(folder, Folder) else None
+        return find_folder(self._root, reference)
+
+    def list_contents(self, folder_name: str, cursor: Optional[str] = None, limit: Optional[int] = None) -> list:
+        return list(islice(self.iter_contents(folder_name, cursor), limit))
+
+    def iter_contents(self, folder_name: str, cursor: Optional[str] = None) -> Iterator[str]:
+        folder = self._resolve_folder(folder_name)
+        if not folder:
+            return iter(())
+        return iter_children(folder, cursor)
+
+    def list_directory_structure(self) -> list:
+        return list(self.iter_directory_structure())
+
+    def iter_directory_structure(self) -> Iterator[str]:
+        if self._root is None:
+            raise RuntimeError("snapshot is closed")
+        return iter_directory(self._root)
+
+    def search_file_exact_match(self, folder_name: str, file_name: str) -> Optional[str]:
+        folder = self._resolve_folder(folder_name)
+        if folder:
+            item = find_exact_file(folder, file_name)
+            if item:
+                return item.get_name
+        return None
+
+    def search_file_like_match(self, folder_name: str, pattern: str) -> list:
+        folder = self._resolve_folder(folder_name)
+        if folder:
+            return find_match_files(folder, pattern)
+        return []
@@ -0,0 +1,145 @@
+from collections import deque
+from itertools import islice
+from operator import indexOf
+from typing import Callable, Deque, Iterator, Optional
+from models.file_system_item import FileSystemItem
+from models.folder import Folder
+from service.path_cache import split_path
+
+# Plain tree walks, shared by the live manager (when no index applies) and by
+# snapshots, which only have the frozen tree to work with. A descend callback,
+# where taken, decides which subfolders are walked into (e.g. permissions).
+
+Descend = Optional[Callable[[Folder], bool]]
+
+
+def iter_children(folder: Folder, cursor: Optional[str]) -> Iterator[str]:
+    items = folder.get_items
+    start = 0
+    if cursor is not None:
+        last = folder.get_item(cursor)
+        if last is None:
+            return iter(())
+        # indexOf walks the children in C, so resuming deep into a huge folder stays cheap
+        start = indexOf(items, last) + 1
+    return (item.get_name for item in islice(items, start, None))
+
+
+def iter_directory(folder: Folder, descend: Descend = None) -> Iterator[str]:
+    # explicit stack of child iterators instead of recursion, so deep trees
+    # neither copy sublists at every level nor hit the recursion limit
+    yield "+ " + folder.get_name
+    stack = [(iter(folder.get_items), "  ")]
+    while stack:
+        items, indent = stack[-1]
+        for item in items:
+            if isinstance(item, Folder):
+                yield indent + "+ " + item.get_name
+                if descend is not None and not descend(item):
+                    continue
+                stack.append((iter(item.get_items), indent + "  "))
+                break
+            yield indent + "- " + item.get_name
+        else:
+            stack.pop()
+
+
+def iter_rendered(fragment: list) -> Iterator[str]:
+    """
+    The lines of a rendered fragment: a folder's line, then its files' lines
+    and its subfolders' fragments, nested one level deeper. Lines are stored
+    without their indent, which is added here.
+    """
+    yield fragment[0]
+    stack = [(islice(fragment, 1, None), "  ")]
+    while stack:
+        parts, indent = stack[-1]
+        for part in parts:
+            if isinstance(part, list):
+                yield indent + part[0]
+                stack.append((islice(part, 1, None), indent + "  "))
+                break
+            yield indent + part
+        else:
+            stack.pop()
+
+
+def iter_files(current_folder: Folder, descend: Descend = None) -> Iterator[FileSystemItem]:
+    """Every file below current_folder, breadth-first, generated lazily."""
+    folders: Deque[Folder] = deque()
+    folders.append(current_folder)
+    while folders:
+        folder = folders.popleft()
+        for item in folder.get_items:
+            if isinstance(item, Folder):
+                if descend is None or descend(item):
+                    folders.append(item)
+            else:
+                yield item
+
+
+def iter_subtree(current_folder: Folder, descend: Descend = None) -> Iterator[FileSystemItem]:
+    """Every file and folder below current_folder, breadth-first, generated lazily."""
+    folders: Deque[Folder] = deque()
+    folders.append(current_folder)
+    while folders:
+        for item in folders.popleft().get_items:
+            yield item
+            if isinstance(item, Folder) and (descend is None or descend(item)):
+                folders.append(item)
+
+
+def find_match_files(current_folder: Folder, pattern: str, descend: Descend = None) -> list[str]:
+    pattern = pattern.lower()
+    folders: Deque[Folder] = deque()
+    folders.append(current_folder)
+    matched_items: list[str] = []
+    while folders:
+        folder = folders.popleft()
+        for item in folder.get_items:
+            if isinstance(item, Folder):
+                if descend is None or descend(item):
+                    folders.append(item)
+            elif pattern in item.get_name.lower():
+                matched_items.append(item.get_name)
+    return matched_items
+
+
+def find_exact_file(current_folder: Folder, searched_file: str, descend: Descend = None) -> Optional[FileSystemItem]:
+    folders: Deque[Folder] = deque()
+    folders.append(current_folder)
+    while folders:
+        folder = folders.popleft()
+        for item in folder.get_items:
+            if isinstance(item, Folder):
+                if descend is None or descend(item):
+                    folders.append(item)
+            elif searched_file == item.get_name:
+                return item
+    return None
+
+
+def find_folder(root: Folder, folder_name: str) -> Optional[Folder]:
+    """Breadth-first, so the shallowest folder with that name wins."""
+    if root.get_name == folder_name:
+        return root
+    folders: Deque[Folder] = deque()
+    folders.append(root)
+    while folders:
+        folder = folders.popleft()
+        found = folder.get_item(folder_name)
+        if isinstance(found, Folder):
+            return found
+        folders.extend(item for item in folder.get_items if isinstance(item, Folder))
+    return None
+
+
+def resolve_path(root: Folder, path: str) -> Optional[FileSystemItem]:
+    node: Optional[FileSystemItem] = root
+    for segment in split_path(path):
+        if not isinstance(node, Folder):
+            return None
+        node = node.get_item(segment)
+        if node is None:
+            return None
+    return node
@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, List, Set
+from models.file_system_item import FileSystemItem
+
+GRAM_SIZE = 3
+
+
+def _grams(text: str) -> Set[str]:
+    """Every substring of text up to GRAM_SIZE characters long."""
+    grams: Set[str] = set()
+    for size in range(1, GRAM_SIZE + 1):
+        for start in range(len(text) - size + 1):
+            grams.add(text[start:start + size])
+    return grams
+
+
+class TrigramIndex:
+    """
+    Case-insensitive substring index over file names.
+
+    Names are lower-cased once on insert and split into 1-, 2- and 3-grams.
+    A contains-query of up to three characters is a single posting lookup,
+    longer queries intersect the postings of their trigrams (smallest first)
+    and verify the survivors, so a query costs roughly the size of its
+    rarest trigram rather than the number of files.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[FileSystemItem]] = {}
+        self._lowered: Dict[FileSystemItem, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._lowered)
+
+    def add(self, item: FileSystemItem) -> None:
+        lowered = item.get_name.lower()
+        self._lowered[item] = lowered
+        for gram in _grams(lowered):
+            self._postings.setdefault(gram, set()).add(item)
+
+    def remove(self, item: FileSystemItem) -> None:
+        lowered = self._lowered.pop(item, None)
+        if lowered is None:
+            return
+        for gram in _grams(lowered):
+            items = self._postings.get(gram)
+            if items is None:
+                continue
+            items.discard(item)
+            if not items:
+                del self._postings[gram]
+
+    def search(self, pattern: str) -> Iterable[FileSystemItem]:
+        """Returns every indexed item whose name contains pattern, ignoring case."""
+        pattern = pattern.lower()
+        if not pattern:
+            return self._lowered.keys()
+        if len(pattern) <= GRAM_SIZE:
+            return self._postings.get(pattern, ())
+
+        postings: List[Set[FileSystemItem]] = []
+        for start in range(len(pattern) - GRAM_SIZE + 1):
+            items = self._postings.get(pattern[start:start + GRAM_SIZE])
+            if not items:
+                return ()
+            postings.append(items)
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return [item for item in candidates if pattern in self._lowered[item]]
@@ -0,0 +1,228 @@
+import mmap
+import os
+import threading
+from array import array
+from typing import Iterable, List, Optional, Set
+
+DEFAULT_CHUNK_SIZE = 4096
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+class ChunkStore:
+    """
+    Fixed-size chunks in one local blob file, memory-mapped.
+
+    The file grows in segments, each mapped separately, so growing never has
+    to resize a mapping that readers still hold views into. Chunk bytes stay
+    on disk until a view over them is touched; the OS pages them in lazily.
+
+    Chunks referenced by a durable snapshot are pinned: content writes copy
+    them instead of overwriting them, and freeing one only queues it until a
+    newer snapshot has replaced that one. Recovery can then always read the
+    snapshot's bytes back, whatever happened to the journal tail.
+    """
+
+    def __init__(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        if chunk_size <= 0 or segment_size % chunk_size:
+            raise ValueError("segment_size must be a positive multiple of chunk_size")
+        if segment_size % mmap.ALLOCATIONGRANULARITY:
+            raise ValueError("segment_size must be a multiple of mmap.ALLOCATIONGRANULARITY")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.segment_size = segment_size
+        self._chunks_per_segment = segment_size // chunk_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._segments: List[mmap.mmap] = []
+        self._lock = threading.Lock()
+        self._free: List[int] = []
+        # chunks of the latest durable snapshot, and of one still being written
+        self._pinned: Set[int] = set()
+        self._pending: Optional[Set[int]] = None
+        # freed while pinned, reusable once no snapshot references them
+        self._deferred: List[int] = []
+        # an existing blob is reopened as fully allocated; owners re-attach
+        # their chunk ids with ChunkedContent.restore, then hand back the
+        # rest with release_unreferenced
+        size = os.fstat(self._fd).st_size
+        for _ in range(-(-size // segment_size)):
+            self._map_segment()
+        self._high_water = size // chunk_size
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def chunk_count(self) -> int:
+        return self._high_water - len(self._free)
+
+    def _map_segment(self) -> None:
+        offset = len(self._segments) * self.segment_size
+        if os.fstat(self._fd).st_size < offset + self.segment_size:
+            os.ftruncate(self._fd, offset + self.segment_size)
+        self._segments.append(mmap.mmap(self._fd, self.segment_size, offset=offset))
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            chunk_id = self._high_water
+            if chunk_id // self._chunks_per_segment >= len(self._segments):
+                self._map_segment()
+            self._high_water += 1
+            return chunk_id
+
+    def free(self, chunk_id: int) -> None:
+        with self._lock:
+            if self.is_pinned(chunk_id):
+                self._deferred.append(chunk_id)
+            else:
+                self._free.append(chunk_id)
+
+    def is_pinned(self, chunk_id: int) -> bool:
+        return chunk_id in self._pinned or (self._pending is not None and chunk_id in self._pending)
+
+    def pin(self, chunk_ids: Iterable[int]) -> None:
+        """
+        Protects the chunks of a snapshot about to be written, on top of those
+        of the current one. Call it while the tree cannot change.
+        """
+        with self._lock:
+            self._pending = set(chunk_ids)
+
+    def commit_pins(self) -> None:
+        """The pinned snapshot is durable and replaces the previous one, whose chunks become reusable."""
+        with self._lock:
+            self._pinned = self._pending if self._pending is not None else set()
+            self._pending = None
+            deferred, self._deferred = self._deferred, []
+            for chunk_id in deferred:
+                (self._deferred if chunk_id in self._pinned else self._free).append(chunk_id)
+
+    def release_unreferenced(self, referenced: Iterable[int]) -> None:
+        """
+        Rebuilds the free list once a loaded tree has re-attached its chunks:
+        every other chunk of the blob is reusable, after the next checkpoint
+        if a snapshot still pins it. Lowest ids are handed out first.
+        """
+        with self._lock:
+            used = set(referenced)
+            free: List[int] = []
+            deferred: List[int] = []
+            for chunk_id in range(self._high_water - 1, -1, -1):
+                if chunk_id not in used:
+                    (deferred if self.is_pinned(chunk_id) else free).append(chunk_id)
+            self._free, self._deferred = free, deferred
+
+    def view(self, chunk_id: int) -> memoryview:
+        """A writable, zero-copy view of one whole chunk."""
+        segment, index = divmod(chunk_id, self._chunks_per_segment)
+        start = index * self.chunk_size
+        return memoryview(self._segments[segment])[start:start + self.chunk_size]
+
+    def flush(self) -> None:
+        for segment in self._segments:
+            segment.flush()
+
+    def close(self) -> None:
+        """Unmaps the blob. Views handed out earlier must be released first."""
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+        os.close(self._fd)
+
+
+class ChunkedContent:
+    """
+    The bytes of one file, spread over chunks of a ChunkStore.
+
+    Reads hand out memoryviews straight into the mapping. They stay valid
+    until the next write to this content, since freed chunks are reused.
+    Writes to a chunk pinned by a snapshot go to a fresh copy of it.
+    """
+
+    __slots__ = ("_store", "_chunks", "_length")
+
+    def __init__(self, store: ChunkStore):
+        self._store = store
+        self._chunks = array("Q")
+        self._length = 0
+
+    @classmethod
+    def restore(cls, store: ChunkStore, chunks: List[int], length: int) -> "ChunkedContent":
+        content = cls(store)
+        content._chunks.extend(chunks)
+        content._length = length
+        return content
+
+    @property
+    def chunks(self) -> array:
+        return self._chunks
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> List[memoryview]:
+        """
+        Returns the requested byte range as zero-copy views, one per chunk touched.
+
+        :param offset: the first byte to read
+        :param length: how many bytes to read, None for everything up to the end
+        """
+        end = self._length if length is None else min(self._length, offset + length)
+        size = self._store.chunk_size
+        views = []
+        position = offset
+        while position < end:
+            index, start = divmod(position, size)
+            stop = min(size, start + end - position)
+            views.append(self._store.view(self._chunks[index])[start:stop])
+            position += stop - start
+        return views
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.read())
+
+    def write(self, offset: int, data: bytes) -> None:
+        """Overwrites bytes from offset on, growing the content if it runs past the end."""
+        if not 0 <= offset <= self._length:
+            raise ValueError("offset must be within the content (0..{})".format(self._length))
+        data = memoryview(data).cast("B")
+        size = self._store.chunk_size
+        end = offset + len(data)
+        while len(self._chunks) * size < end:
+            self._chunks.append(self._store.allocate())
+        position = offset
+        written = 0
+        while position < end:
+            index, start = divmod(position, size)
+            stop = min(size, start + end - position)
+            chunk_id = self._chunks[index]
+            if self._store.is_pinned(chunk_id):
+                fresh = self._store.allocate()
+                if start or stop < size:
+                    self._store.view(fresh)[:] = self._store.view(chunk_id)
+                self._chunks[index] = fresh
+                self._store.free(chunk_id)
+                chunk_id = fresh
+            self._store.view(chunk_id)[start:stop] = data[written:written + stop - start]
+            written += stop - start
+            position += stop - start
+        self._length = max(self._length, end)
+
+    def append(self, data: bytes) -> None:
+        self.write(self._length, data)
+
+    def truncate(self, length: int = 0) -> None:
+        if length >= self._length:
+            return
+        keep = -(-length // self._store.chunk_size)
+        while len(self._chunks) > keep:
+            self._store.free(self._chunks.pop())
+        self._length = length
+
+    def replace(self, data: bytes) -> None:
+        self.truncate(0)
+        self.append(data)
@@ -0,0 +1,274 @@
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+# Operation codes. Every record is (op, *fields), paths are absolute.
+OP_ADD = 1          # parent path, name, is_folder
+OP_MOVE = 2         # source path, destination folder path
+OP_SET_CONTENT = 3  # file path, utf-8 content
+OP_WRITE = 4        # file path, offset, bytes
+OP_RENAME = 5       # item path, new name
+OP_DELETE = 6       # item path
+
+# field layout per op: s = utf-8 string, y = bytes, b = bool, q = u64
+_FIELDS = {
+    OP_ADD: "ssb",
+    OP_MOVE: "ss",
+    OP_SET_CONTENT: "sy",
+    OP_WRITE: "sqy",
+    OP_RENAME: "ss",
+    OP_DELETE: "s",
+}
+
+# A frame holds the records of one operation or batch, so a batch is replayed
+# whole or not at all: u32 payload length, u32 crc32 of the payload, payload.
+FRAME = struct.Struct("<II")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+SYNC_ALWAYS = "always"  # fsync before a mutation returns
+SYNC_GROUP = "group"    # fsync every group_commit_ms; mutations wait for it
+SYNC_OS = "os"          # hand records to the OS, never fsync
+
+Record = Tuple
+
+_SEGMENT = re.compile(r"^wal\.(\d+)$")
+_SNAPSHOT = re.compile(r"^snapshot\.(\d+)$")
+
+
+def encode_frame(records: Sequence[Record]) -> bytes:
+    parts = []
+    for record in records:
+        op = record[0]
+        parts.append(bytes((op,)))
+        for kind, value in zip(_FIELDS[op], record[1:]):
+            if kind == "b":
+                parts.append(b"\x01" if value else b"\x00")
+            elif kind == "q":
+                parts.append(_U64.pack(value))
+            else:
+                data = value.encode("utf-8") if kind == "s" else bytes(value)
+                parts.append(_U32.pack(len(data)))
+                parts.append(data)
+    payload = b"".join(parts)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_payload(payload: memoryview) -> List[Record]:
+    records = []
+    offset = 0
+    while offset < len(payload):
+        op = payload[offset]
+        offset += 1
+        record = [op]
+        for kind in _FIELDS[op]:
+            if kind == "b":
+                record.append(bool(payload[offset]))
+                offset += 1
+            elif kind == "q":
+                record.append(_U64.unpack_from(payload, offset)[0])
+                offset += _U64.size
+            else:
+                (length,) = _U32.unpack_from(payload, offset)
+                offset += _U32.size
+                data = bytes(payload[offset:offset + length])
+                record.append(data.decode("utf-8") if kind == "s" else data)
+                offset += length
+        records.append(tuple(record))
+    return records
+
+
+def read_frames(path: str) -> Tuple[List[List[Record]], int]:
+    """
+    Decodes every complete frame of a segment. Reading stops at the first
+    short or corrupt frame, which is what a crash mid-append leaves behind.
+
+    :return: the frames, and the byte length of the valid prefix
+    """
+    with open(path, "rb") as handle:
+        data = memoryview(handle.read())
+    frames = []
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        frames.append(decode_payload(payload))
+        offset += FRAME.size + length
+    return frames, offset
+
+
+class Journal:
+    """
+    Append-only operation log kept in a directory, next to the snapshots it
+    is compacted into.
+
+    The log is split into numbered segments (wal.N). A checkpoint rotates to
+    a new segment N+1 and writes snapshot.(N+1), the state just before that
+    segment starts; afterwards every older segment and snapshot can go.
+    Recovery loads the newest snapshot and replays the segments from its
+    number on, so a crash at any point of a checkpoint is harmless.
+
+    Appends only copy the encoded frame into a buffer and return a log
+    sequence number; wait(lsn) then blocks according to the sync policy.
+    Callers append while holding their write lock, which fixes the log order,
+    and wait after releasing it, so concurrent writers share one fsync.
+    """
+
+    def __init__(self, directory: str, sync: str = SYNC_ALWAYS, group_commit_ms: float = 5.0,
+                 compact_bytes: int = 64 * 1024 * 1024):
+        """
+        :param sync: SYNC_ALWAYS, SYNC_GROUP or SYNC_OS
+        :param group_commit_ms: how often the group commit thread fsyncs
+        :param compact_bytes: log size after which needs_compaction turns True
+        """
+        if sync not in (SYNC_ALWAYS, SYNC_GROUP, SYNC_OS):
+            raise ValueError("sync must be one of 'always', 'group' or 'os'")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync = sync
+        self.compact_bytes = compact_bytes
+        self._cond = threading.Condition(threading.Lock())
+        self._flush_lock = threading.Lock()
+        self._buffer = bytearray()
+        self._next_lsn = 1
+        self._durable_lsn = 0
+        self._closed = False
+
+        latest = self.latest_snapshot()
+        segments = self._numbered(_SEGMENT)
+        self._segment = max(segments[-1] if segments else 1, latest[0] if latest else 1)
+        path = self.segment_path(self._segment)
+        if os.path.exists(path):
+            # drop a torn tail, or frames appended now would never be reached
+            _, valid = read_frames(path)
+            with open(path, "r+b") as handle:
+                handle.truncate(valid)
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+        self._flusher: Optional[threading.Thread] = None
+        if sync == SYNC_GROUP:
+            self._interval = group_commit_ms / 1000.0
+            self._flusher = threading.Thread(target=self._group_commit, name="journal-group-commit", daemon=True)
+            self._flusher.start()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, "wal.{:08d}".format(number))
+
+    def snapshot_path(self, number: int) -> str:
+        return os.path.join(self.directory, "snapshot.{:08d}".format(number))
+
+    def _numbered(self, pattern) -> List[int]:
+        numbers = []
+        for entry in os.listdir(self.directory):
+            match = pattern.match(entry)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def latest_snapshot(self) -> Optional[Tuple[int, str]]:
+        """The newest complete snapshot as (number, path), or None."""
+        numbers = self._numbered(_SNAPSHOT)
+        return (numbers[-1], self.snapshot_path(numbers[-1])) if numbers else None
+
+    def segments_from(self, number: int) -> List[str]:
+        return [self.segment_path(segment) for segment in self._numbered(_SEGMENT) if segment >= number]
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self._size >= self.compact_bytes
+
+    def append(self, records: Sequence[Record]) -> int:
+        """Buffers the records as one frame and returns its sequence number."""
+        frame = encode_frame(records)
+        with self._cond:
+            if self._closed:
+                raise ValueError("journal is closed")
+            self._buffer += frame
+            self._size += len(frame)
+            lsn = self._next_lsn
+            self._next_lsn += 1
+        return lsn
+
+    def wait(self, lsn: int) -> None:
+        """Returns once the frame lsn is as durable as the sync policy asks for."""
+        if self.sync == SYNC_GROUP:
+            with self._cond:
+                while self._durable_lsn < lsn and not self._closed:
+                    self._cond.wait()
+        else:
+            self._flush(lsn, fsync=self.sync == SYNC_ALWAYS)
+
+    def _flush(self, lsn: int, fsync: bool) -> None:
+        with self._flush_lock:
+            # a writer that queued behind another one's fsync is usually covered by it
+            if self._durable_lsn >= lsn:
+                return
+            with self._cond:
+                data, self._buffer = self._buffer, bytearray()
+                last = self._next_lsn - 1
+            if data:
+                self._file.write(data)
+                self._file.flush()
+            if fsync:
+                os.fsync(self._file.fileno())
+            with self._cond:
+                self._durable_lsn = max(self._durable_lsn, last)
+                self._cond.notify_all()
+
+    def _group_commit(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(self._interval)
+                pending = self._next_lsn - 1
+            if pending > self._durable_lsn:
+                self._flush(pending, fsync=True)
+
+    def rotate(self) -> int:
+        """
+        Makes everything buffered durable and starts a new segment. The caller
+        must keep writers out while rotating, so that the new segment's number
+        names a consistent state.
+
+        :return: the number of the new segment
+        """
+        self._flush(self._next_lsn - 1, fsync=True)
+        with self._flush_lock:
+            self._file.close()
+            self._segment += 1
+            self._file = open(self.segment_path(self._segment), "ab")
+            self._size = 0
+        return self._segment
+
+    def discard_before(self, number: int) -> None:
+        """Deletes the segments and snapshots made obsolete by snapshot number."""
+        for segment in self._numbered(_SEGMENT):
+            if segment < number:
+                os.remove(self.segment_path(segment))
+        for snapshot in self._numbered(_SNAPSHOT):
+            if snapshot < number:
+                os.remove(self.snapshot_path(snapshot))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._flush(self._next_lsn - 1, fsync=self.sync != SYNC_OS)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._file.close()
@@ -0,0 +1,142 @@
+import struct
+import sys
+from array import array
+from typing import Dict, Iterator, List, Tuple
+from models.file_system_item import FileSystemItem
+from models.folder import Folder
+from storage.chunk_store import ChunkedContent
+
+# Layout, all little-endian:
+#   header
+#   string table: every distinct name, utf-8, joined with NUL
+#   name ids:      u32 per node, pre-order
+#   parent deltas: u32 per node, own index minus parent index (0 for the root)
+#   kinds:         u8 per node, 1 for folders
+#   content:       per file with content: u32 node, u8 kind, u64 byte length,
+#                  then the bytes (inline) or u32 count + u64 chunk ids (chunked)
+MAGIC = b"FSMSNAP\x01"
+HEADER = struct.Struct("<8sIIIQ")
+CONTENT_ENTRY = struct.Struct("<IBQ")
+CONTENT_INLINE = 0
+CONTENT_CHUNKED = 1
+
+
+class SnapshotData:
+    """The decoded columns of a snapshot file."""
+
+    def __init__(self, strings: List[str], name_ids: array, parent_deltas: array, kinds: bytes,
+                 contents: List[Tuple[int, int, int, object]]):
+        self.strings = strings
+        self.name_ids = name_ids
+        self.parent_deltas = parent_deltas
+        self.kinds = kinds
+        # (node index, kind, byte length, bytes or chunk ids)
+        self.contents = contents
+
+
+def _little_endian(column: array) -> array:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+def _preorder(root: Folder) -> Iterator[Tuple[FileSystemItem, int]]:
+    """Yields (node, parent index) in pre-order, iteratively."""
+    yield root, -1
+    index = 0
+    stack = [(iter(root.get_items), 0)]
+    while stack:
+        items, parent = stack[-1]
+        for item in items:
+            index += 1
+            yield item, parent
+            if isinstance(item, Folder):
+                stack.append((iter(item.get_items), index))
+                break
+        else:
+            stack.pop()
+
+
+def write_snapshot(path: str, root: Folder) -> int:
+    """Writes the tree under root to path and returns the node count."""
+    string_ids: Dict[str, int] = {}
+    name_ids = array("I")
+    parent_deltas = array("I")
+    kinds = bytearray()
+    contents = []
+    content_count = 0
+    for index, (item, parent) in enumerate(_preorder(root)):
+        name = item.get_name
+        if "\0" in name:
+            raise ValueError("names containing NUL cannot be saved: {!r}".format(name))
+        name_id = string_ids.setdefault(name, len(string_ids))
+        name_ids.append(name_id)
+        parent_deltas.append(index - parent if parent >= 0 else 0)
+        is_folder = isinstance(item, Folder)
+        kinds.append(1 if is_folder else 0)
+        if not is_folder:
+            content = item._content
+            if isinstance(content, ChunkedContent):
+                if len(content):
+                    content_count += 1
+                    contents.append(CONTENT_ENTRY.pack(index, CONTENT_CHUNKED, len(content)))
+                    contents.append(struct.pack("<I", len(content.chunks)))
+                    contents.append(_little_endian(array("Q", content.chunks)).tobytes())
+            elif content:
+                encoded = content.encode("utf-8")
+                content_count += 1
+                contents.append(CONTENT_ENTRY.pack(index, CONTENT_INLINE, len(encoded)))
+                contents.append(encoded)
+
+    strings = "\0".join(string_ids).encode("utf-8")
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, len(string_ids), len(name_ids), content_count, len(strings)))
+        handle.write(strings)
+        handle.write(_little_endian(name_ids).tobytes())
+        handle.write(_little_endian(parent_deltas).tobytes())
+        handle.write(kinds)
+        for part in contents:
+            handle.write(part)
+    return len(name_ids)
+
+
+def read_snapshot(path: str) -> SnapshotData:
+    """Reads a snapshot with one sequential read and decodes its columns in bulk."""
+    with open(path, "rb") as handle:
+        data = memoryview(handle.read())
+    magic, string_count, node_count, content_count, strings_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("{} is not a file system snapshot".format(path))
+    offset = HEADER.size
+    strings = str(data[offset:offset + strings_size], "utf-8").split("\0") if string_count else []
+    offset += strings_size
+
+    columns = []
+    for _ in range(2):
+        column = array("I")
+        column.frombytes(data[offset:offset + 4 * node_count])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        offset += 4 * node_count
+    kinds = bytes(data[offset:offset + node_count])
+    offset += node_count
+
+    contents = []
+    for _ in range(content_count):
+        node, kind, length = CONTENT_ENTRY.unpack_from(data, offset)
+        offset += CONTENT_ENTRY.size
+        if kind == CONTENT_INLINE:
+            contents.append((node, kind, length, bytes(data[offset:offset + length])))
+            offset += length
+        else:
+            (count,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            chunks = array("Q")
+            chunks.frombytes(data[offset:offset + 8 * count])
+            if sys.byteorder == "big":
+                chunks.byteswap()
+            contents.append((node, kind, length, chunks))
+            offset += 8 * count
+    return SnapshotData(strings, columns[0], columns[1], kinds, contents)
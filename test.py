@@ -1,8 +1,27 @@
 import unittest
+import asyncio
 import logging
+import mmap
+import os
+import random
+import tempfile
 import threading
+import time
+import weakref
 
 from service.file_system_manager_imp import FileSystemManagerImpl
+from service.async_file_system_manager import AsyncFileSystemManager
+from models.columnar import ColumnarTree
+from models.folder import Folder
+from service.batch import AddOperation, MoveOperation
+from service.snapshot import FileSystemSnapshot
+from storage.chunk_store import ChunkStore
+from storage.journal import SYNC_GROUP, Journal
+from service.order_maintenance import OrderList
+from service.parallel_search import ParallelSearch
+from service.metrics import InMemoryMetrics
+from service.permissions import EVERYONE, READ, WRITE
+from service.traversal import find_exact_file
 
 logging.basicConfig(level=logging.DEBUG)  # Set to DEBUG to see all log messages
 logger = logging.getLogger(__name__)
@@ -235,6 +254,614 @@ class FileSystemManagerTest(unittest.TestCase):
         self.assertNotIn("FOLDER2", like_match_results)
 
 
+    # Listing keeps insertion order, including after items are moved in and out
+    def test_list_contents_keeps_insertion_order(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        for name in ["c", "a", "b"]:
+            file_system_manager.add_file_or_folder("root", name, False)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.move_file_or_folder("a", "folder1")
+        file_system_manager.move_file_or_folder("a", "root")
+
+        self.assertEqual(["c", "b", "folder1", "a"], file_system_manager.list_contents("root"))
+
+    # Folders sharing a name at different levels resolve to the shallowest one
+    def test_duplicate_folder_names_at_different_levels(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "shared", True)
+        file_system_manager.add_file_or_folder("root", "shared", True)
+        file_system_manager.add_file_or_folder("shared", "file1.txt", False)
+
+        self.assertIn("file1.txt", file_system_manager.list_contents("shared"))
+        self.assertEqual(["shared"], file_system_manager.list_contents("folder1"))
+        self.assertIn("    - file1.txt", file_system_manager.list_directory_structure())
+        self.assertNotIn("      - file1.txt", file_system_manager.list_directory_structure())
+
+    # A folder cannot be moved into itself or one of its descendants
+    def test_moving_folder_into_own_subtree_is_rejected(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "folder2", True)
+
+        self.assertFalse(file_system_manager.move_file_or_folder("folder1", "folder2"))
+        self.assertFalse(file_system_manager.move_file_or_folder("folder1", "folder1"))
+        self.assertEqual(["folder1"], file_system_manager.list_contents("root"))
+        self.assertEqual(["folder2"], file_system_manager.list_contents("folder1"))
+
+    # Moving onto a same-named sibling keeps both items
+    def test_moving_onto_existing_name_is_rejected(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("root", "folder2", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        file_system_manager.add_file_or_folder("folder2", "file1.txt", False)
+
+        self.assertFalse(file_system_manager.move_file_or_folder("file1.txt", "folder2"))
+        self.assertEqual(["file1.txt"], file_system_manager.list_contents("folder1"))
+        self.assertEqual(["file1.txt"], file_system_manager.list_contents("folder2"))
+
+    # Path-addressed operations resolve segment by segment from the root
+    def test_path_addressed_operations(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        self.assertTrue(file_system_manager.add("/", "a", True))
+        self.assertTrue(file_system_manager.add("/a", "b", True))
+        self.assertTrue(file_system_manager.add("/", "b", True))
+        self.assertTrue(file_system_manager.add("/a/b", "file1.txt", False))
+        self.assertFalse(file_system_manager.add("/a/missing", "file2.txt", False))
+        self.assertFalse(file_system_manager.add("a", "file2.txt", False))
+
+        self.assertEqual(["file1.txt"], file_system_manager.list_contents("/a/b"))
+        self.assertEqual([], file_system_manager.list_contents("/b"))
+        self.assertEqual(["file1.txt"], file_system_manager.search_file_like_match("/a", "file"))
+
+        self.assertTrue(file_system_manager.move("/a/b/file1.txt", "/b"))
+        self.assertEqual([], file_system_manager.list_contents("/a/b"))
+        self.assertEqual(["file1.txt"], file_system_manager.list_contents("/b"))
+
+    # The path cache counts hits and misses and forgets moved subtrees
+    def test_path_cache_invalidation_on_move(self):
+        file_system_manager = FileSystemManagerImpl("root", path_cache_size=8)
+        file_system_manager.add("/", "a", True)
+        file_system_manager.add("/a", "b", True)
+        file_system_manager.add("/", "x", True)
+        file_system_manager.add("/a/b", "file1.txt", False)
+        cache = file_system_manager.path_cache
+
+        file_system_manager.list_contents("/a/b")
+        hits = cache.hits
+        file_system_manager.list_contents("/a/b")
+        self.assertEqual(hits + 1, cache.hits)
+
+        file_system_manager.move("/a/b", "/x")
+        self.assertEqual([], file_system_manager.list_contents("/a/b"))
+        self.assertEqual(["file1.txt"], file_system_manager.list_contents("/x/b"))
+        self.assertIsNotNone(cache.get("/a"))
+
+    # The path cache never grows past its capacity
+    def test_path_cache_is_bounded(self):
+        file_system_manager = FileSystemManagerImpl("root", path_cache_size=2)
+        for i in range(5):
+            file_system_manager.add("/", "folder{}".format(i), True)
+            file_system_manager.list_contents("/folder{}".format(i))
+
+        self.assertEqual(2, len(file_system_manager.path_cache))
+        self.assertIsNone(file_system_manager.path_cache.get("/folder0"))
+        self.assertIsNotNone(file_system_manager.path_cache.get("/folder4"))
+
+    # The trigram index returns the same matches, in the same order, as the tree scan
+    def test_trigram_index_matches_tree_scan(self):
+        rng = random.Random(4)
+        managers = [FileSystemManagerImpl("root"), FileSystemManagerImpl("root", trigram_index=True)]
+        folders = ["root"]
+        for i in range(300):
+            parent = rng.choice(folders)
+            name = "{}{}{}".format(rng.choice(["Log", "data", "img"]), i, rng.choice([".txt", ".LOG", ""]))
+            is_folder = rng.random() < 0.2
+            for manager in managers:
+                manager.add_file_or_folder(parent, name, is_folder)
+            if is_folder:
+                folders.append(name)
+        for _ in range(20):
+            source, destination = rng.choice(folders[1:]), rng.choice(folders)
+            for manager in managers:
+                manager.move_file_or_folder(source, destination)
+
+        for folder in rng.sample(folders, 10):
+            for pattern in ["", "l", "lo", "log", ".log", "TA1", "g1.t", "missing"]:
+                self.assertEqual(managers[0].search_file_like_match(folder, pattern),
+                                 managers[1].search_file_like_match(folder, pattern))
+
+    # Exact search through interval labels agrees with the tree scan after moves
+    def test_exact_search_respects_subtree_after_moves(self):
+        rng = random.Random(5)
+        file_system_manager = FileSystemManagerImpl("root")
+        folders = ["root"]
+        for i in range(200):
+            parent = rng.choice(folders)
+            if rng.random() < 0.3:
+                file_system_manager.add_file_or_folder(parent, "folder{}".format(i), True)
+                folders.append("folder{}".format(i))
+            else:
+                file_system_manager.add_file_or_folder(parent, "file{}.txt".format(i % 40), False)
+        for _ in range(30):
+            file_system_manager.move_file_or_folder(rng.choice(folders[1:]), rng.choice(folders))
+
+        for folder_name in folders:
+            folder = file_system_manager._find_folder(folder_name)
+            for i in range(40):
+                expected = find_exact_file(folder, "file{}.txt".format(i))
+                actual = file_system_manager.search_file_exact_match(folder_name, "file{}.txt".format(i))
+                self.assertEqual(expected.get_name if expected else None, actual)
+
+    # Listing a hierarchy deeper than the recursion limit works lazily and iteratively
+    def test_directory_structure_of_very_deep_tree(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        parent = "root"
+        for i in range(3000):
+            file_system_manager.add_file_or_folder(parent, "folder{}".format(i), True)
+            parent = "folder{}".format(i)
+        file_system_manager.add_file_or_folder(parent, "file1.txt", False)
+
+        lines = file_system_manager.iter_directory_structure()
+        self.assertEqual("+ root", next(lines))
+        self.assertEqual("  + folder0", next(lines))
+        structure = file_system_manager.list_directory_structure()
+        self.assertEqual(3002, len(structure))
+        self.assertEqual(" " * 6002 + "- file1.txt", structure[-1])
+
+    # list_contents pages through a folder with a cursor and a limit
+    def test_list_contents_pagination(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        for i in range(10):
+            file_system_manager.add_file_or_folder("root", "file{}.txt".format(i), False)
+
+        pages = []
+        cursor = None
+        while True:
+            page = file_system_manager.list_contents("root", cursor=cursor, limit=4)
+            if not page:
+                break
+            pages.append(page)
+            cursor = page[-1]
+
+        self.assertEqual([4, 4, 2], [len(page) for page in pages])
+        self.assertEqual(file_system_manager.list_contents("root"), sum(pages, []))
+        self.assertEqual([], file_system_manager.list_contents("root", cursor="missing"))
+        self.assertEqual(["file0.txt", "file1.txt"], list(file_system_manager.iter_contents("root"))[:2])
+
+    # The render cache produces the same structure as a fresh render after every change
+    def test_render_cache_matches_fresh_render(self):
+        rng = random.Random(7)
+        managers = [FileSystemManagerImpl("root"), FileSystemManagerImpl("root", render_cache=True)]
+        folders = ["root"]
+        for i in range(150):
+            parent = rng.choice(folders)
+            if rng.random() < 0.15 and len(folders) > 1:
+                source, destination = rng.choice(folders[1:]), rng.choice(folders)
+                for manager in managers:
+                    manager.move_file_or_folder(source, destination)
+            else:
+                is_folder = rng.random() < 0.3
+                for manager in managers:
+                    manager.add_file_or_folder(parent, "item{}".format(i), is_folder)
+                if is_folder:
+                    folders.append("item{}".format(i))
+            self.assertEqual(managers[0].list_directory_structure(), managers[1].list_directory_structure())
+
+    # Only folders on the path to the root are re-rendered after a change
+    def test_render_cache_reuses_clean_subtrees(self):
+        file_system_manager = FileSystemManagerImpl("root", render_cache=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("root", "folder2", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        file_system_manager.list_directory_structure()
+        folder1 = file_system_manager._find_folder("folder1")
+        fragment = folder1._rendered
+
+        file_system_manager.add_file_or_folder("folder2", "file2.txt", False)
+        structure = file_system_manager.list_directory_structure()
+
+        self.assertIs(fragment, folder1._rendered)
+        # clean fragments are referenced by their parent's, not copied into it
+        self.assertIs(fragment, file_system_manager.root._rendered[1])
+        self.assertEqual(["+ root", "  + folder1", "    - file1.txt", "  + folder2", "    - file2.txt"], structure)
+
+        # a moved subtree keeps its fragment at its new depth
+        file_system_manager.move_file_or_folder("folder1", "folder2")
+        self.assertEqual(["+ root", "  + folder2", "    - file2.txt", "    + folder1", "      - file1.txt"],
+                         file_system_manager.list_directory_structure())
+        self.assertIs(fragment, folder1._rendered)
+
+    # Batch adds resolve parents created earlier in the same batch
+    def test_add_many_returns_per_item_results(self):
+        file_system_manager = FileSystemManagerImpl("root", trigram_index=True)
+        results = file_system_manager.add_many([
+            ("root", "folder1", True),
+            ("folder1", "file1.txt", False),
+            ("missing", "file2.txt", False),
+            ("/folder1", "file3.txt", False),
+        ])
+
+        self.assertEqual([True, True, False, True], results)
+        self.assertEqual(["file1.txt", "file3.txt"], file_system_manager.list_contents("folder1"))
+        self.assertEqual(["file1.txt", "file3.txt"], file_system_manager.search_file_like_match("root", "file"))
+
+    # A batch gives the same tree as the equivalent single operations
+    def test_apply_batch_matches_single_operations(self):
+        operations = [AddOperation("root", "folder{}".format(i), True) for i in range(5)]
+        operations += [AddOperation("folder{}".format(i % 5), "file{}.txt".format(i), False) for i in range(20)]
+        operations += [MoveOperation("folder{}".format(i), "folder{}".format(i + 1)) for i in range(4)]
+        operations += [MoveOperation("folder0", "folder3")]
+        single = FileSystemManagerImpl("root")
+        expected = [single.add_file_or_folder(*operation) if isinstance(operation, AddOperation)
+                    else single.move_file_or_folder(*operation) for operation in operations]
+        batched = FileSystemManagerImpl("root", render_cache=True, mvcc=True)
+
+        self.assertEqual(expected, batched.apply_batch(operations))
+        self.assertEqual(single.list_directory_structure(), batched.list_directory_structure())
+        self.assertEqual(single.list_directory_structure(), batched.snapshot().list_directory_structure())
+
+    # An atomic batch that fails part-way leaves the tree exactly as it was
+    def test_atomic_batch_rolls_back(self):
+        file_system_manager = FileSystemManagerImpl("root", trigram_index=True)
+        file_system_manager.add_many([("root", "folder1", True), ("root", "folder2", True),
+                                      ("folder1", "a.txt", False), ("folder1", "b.txt", False),
+                                      ("folder1", "c.txt", False)])
+        before = file_system_manager.list_directory_structure()
+
+        results = file_system_manager.apply_batch([
+            MoveOperation("b.txt", "folder2"),
+            AddOperation("folder2", "new.txt", False),
+            MoveOperation("folder2", "root"),
+            MoveOperation("missing", "folder2"),
+        ], atomic=True)
+
+        self.assertEqual([False] * 4, results)
+        self.assertEqual(before, file_system_manager.list_directory_structure())
+        self.assertEqual([], file_system_manager.search_file_like_match("root", "new"))
+        self.assertEqual("b.txt", file_system_manager.search_file_exact_match("folder1", "b.txt"))
+        self.assertIsNone(file_system_manager.search_file_exact_match("folder2", "b.txt"))
+
+    # Same-named folders at the same depth resolve to the first in tree order, as in snapshots
+    def test_lookup_ties_follow_tree_order(self):
+        file_system_manager = FileSystemManagerImpl("root", mvcc=True)
+        file_system_manager.add_file_or_folder("root", "A", True)
+        file_system_manager.add_file_or_folder("root", "B", True)
+        file_system_manager.add_file_or_folder("B", "X", True)
+        file_system_manager.add_file_or_folder("A", "X", True)
+        file_system_manager.add_file_or_folder("/A/X", "in_a.txt", False)
+        file_system_manager.add_file_or_folder("/B/X", "in_b.txt", False)
+
+        self.assertEqual(["in_a.txt"], file_system_manager.list_contents("X"))
+        self.assertEqual(file_system_manager.snapshot().list_contents("X"), file_system_manager.list_contents("X"))
+
+    # Paths cached through a folder the rolled-back batch added do not outlive it
+    def test_atomic_rollback_drops_cached_paths(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        results = file_system_manager.apply_batch([
+            AddOperation("/", "new", True),
+            AddOperation("/new", "f", False),
+            AddOperation("/missing", "x", False),
+        ], atomic=True)
+
+        self.assertEqual([False] * 3, results)
+        self.assertFalse(file_system_manager.add_file_or_folder("/new", "g", False))
+        self.assertEqual([], file_system_manager.list_contents("/new"))
+        self.assertIsNone(file_system_manager.search_file_exact_match("root", "g"))
+        self.assertEqual(["+ root"], file_system_manager.list_directory_structure())
+
+    # The process-pool scan returns exactly what the serial scan does, in BFS order
+    def test_parallel_like_match_matches_serial(self):
+        random.seed(7)
+        with ParallelSearch(workers=2, threshold=50) as parallel_search:
+            parallel = FileSystemManagerImpl("root", parallel_search=parallel_search)
+            serial = FileSystemManagerImpl("root")
+            folders = ["root"]
+            for i in range(400):
+                parent = random.choice(folders)
+                is_folder = random.random() < 0.15
+                name = "dir{}".format(i) if is_folder else "File{}_{}.txt".format(i % 7, i)
+                for file_system_manager in (parallel, serial):
+                    file_system_manager.add_file_or_folder(parent, name, is_folder)
+                if is_folder:
+                    folders.append(name)
+            for file_system_manager in (parallel, serial):
+                file_system_manager.move_file_or_folder(folders[5], folders[1])
+
+            # stale copies are never rebuilt on the query path: the first search
+            # scans serially, the second one (no write in between) starts a rebuild
+            self.assertIsNone(parallel_search.find_match_files(parallel._version, parallel.root, "f"))
+            self.assertEqual(serial.search_file_like_match("root", "f"), parallel.search_file_like_match("root", "f"))
+            self.assertIsNone(parallel._parallel_rebuild)
+            parallel.search_file_like_match("root", "f")
+            parallel._parallel_rebuild.join()
+
+            for folder in ("root", folders[1], folders[-1]):
+                for pattern in ("file3", "_1", "nothing"):
+                    self.assertEqual(serial.search_file_like_match(folder, pattern),
+                                     parallel.search_file_like_match(folder, pattern))
+            self.assertIsNotNone(parallel_search.find_match_files(parallel._version, parallel.root, "f"))
+
+            # a write makes the copy stale again, and searches go serial
+            parallel.add_file_or_folder("root", "file3_new.txt", False)
+            serial.add_file_or_folder("root", "file3_new.txt", False)
+            self.assertIsNone(parallel_search.find_match_files(parallel._version, parallel.root, "f"))
+            self.assertEqual(serial.search_file_like_match("root", "file3"),
+                             parallel.search_file_like_match("root", "file3"))
+
+    # Glob, regex and prefix queries, lazily and with a limit
+    def test_search_files_query_syntaxes(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_file_or_folder("root", "logs", True)
+        file_system_manager.add_file_or_folder("root", "app.log", False)
+        file_system_manager.add_file_or_folder("logs", "Report-1.txt", False)
+        file_system_manager.add_file_or_folder("logs", "report-22.txt", False)
+        file_system_manager.add_file_or_folder("logs", "error.log", False)
+
+        self.assertEqual(["app.log", "error.log"], list(file_system_manager.search_files("root", "*.log")))
+        self.assertEqual(["report-22.txt"], list(file_system_manager.search_files("root", "report-??.txt")))
+        self.assertEqual(["Report-1.txt", "report-22.txt"],
+                         list(file_system_manager.search_files("logs", "^report-[0-9]+", "regex", ignore_case=True)))
+        self.assertEqual(["Report-1.txt"], list(file_system_manager.search_files("/logs", "Rep", "prefix")))
+        self.assertEqual(["app.log"], list(file_system_manager.search_files("root", "*", limit=1)))
+        self.assertEqual([], list(file_system_manager.search_files("nowhere", "*")))
+        self.assertEqual(["Report-1.txt", "report-22.txt"],
+                         file_system_manager.list_matching_files("root", "report-*", ignore_case=True))
+        self.assertEqual(["app.log"], file_system_manager.list_matching_files("root", "*", limit=1))
+        with self.assertRaises(ValueError):
+            file_system_manager.search_files("root", "*", "fuzzy")
+
+    # Many like-match patterns in one pass give the same answers as one search each
+    def test_search_file_like_match_many(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        for name in ("file1.txt", "File2.TXT", "notes.md", "filed.md"):
+            file_system_manager.add_file_or_folder("root", name, False)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "archive.txt", False)
+
+        patterns = ["file", "txt", "le", "es.m", "", "zzz"]
+        results = file_system_manager.search_file_like_match_many("root", patterns)
+        for pattern in patterns:
+            self.assertEqual(file_system_manager.search_file_like_match("root", pattern), results[pattern])
+
+    # Completion returns sorted distinct names, optionally scoped to a folder and ignoring case
+    def test_complete_names(self):
+        file_system_manager = FileSystemManagerImpl("root", completion_index=True)
+        file_system_manager.add_file_or_folder("root", "reports", True)
+        file_system_manager.add_file_or_folder("reports", "report-b.txt", False)
+        file_system_manager.add_file_or_folder("reports", "Report-a.txt", False)
+        file_system_manager.add_file_or_folder("root", "report-b.txt", False)
+        file_system_manager.add_file_or_folder("root", "readme.md", False)
+        file_system_manager.add_file_or_folder("root", "archive", True)
+
+        self.assertEqual(["readme.md", "report-b.txt", "reports"], file_system_manager.complete("re"))
+        self.assertEqual(["readme.md", "report-b.txt"], file_system_manager.complete("re", limit=2))
+        self.assertEqual(["Report-a.txt", "report-b.txt", "reports"], file_system_manager.complete("REP", ignore_case=True))
+        self.assertEqual(["report-b.txt"], file_system_manager.complete("rep", folder="reports"))
+        self.assertEqual([], file_system_manager.complete("ro"))
+        self.assertEqual([], file_system_manager.complete("re", folder="missing"))
+
+        file_system_manager.move_file_or_folder("/report-b.txt", "archive")
+        file_system_manager.move_file_or_folder("/reports/report-b.txt", "root")
+        self.assertEqual(["report-b.txt"], file_system_manager.complete("re", folder="archive"))
+        with self.assertRaises(RuntimeError):
+            FileSystemManagerImpl("root").complete("re")
+
+    # A small folder is completed by walking it, with the same answers as the index
+    def test_complete_in_small_folder_walks_it(self):
+        file_system_manager = FileSystemManagerImpl("root", completion_index=True)
+        file_system_manager.add_many([("root", "big", True), ("root", "small", True)])
+        file_system_manager.add_many(("big", "file{}.txt".format(i), False) for i in range(200))
+        file_system_manager.add_many([("small", "file7.txt", False), ("small", "File1.txt", False),
+                                      ("small", "sub", True), ("sub", "file10.txt", False)])
+
+        self.assertEqual(["file10.txt", "file7.txt"], file_system_manager.complete("file", folder="/small"))
+        self.assertEqual(["File1.txt", "file10.txt"],
+                         file_system_manager.complete("FILE1", folder="/small", ignore_case=True))
+        self.assertEqual(["file10.txt"], file_system_manager.complete("file", folder="/small", limit=1))
+        self.assertEqual(["file0.txt", "file1.txt"], file_system_manager.complete("file", folder="/big", limit=2))
+
+    # Renaming keeps the listing position and updates every way of finding the item
+    def test_rename_item(self):
+        file_system_manager = FileSystemManagerImpl("root", trigram_index=True, render_cache=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        file_system_manager.add_file_or_folder("root", "file2.txt", False)
+        self.assertEqual(["file1.txt"], file_system_manager.list_contents("/folder1"))
+        file_system_manager.list_directory_structure()
+
+        self.assertTrue(file_system_manager.rename_item("folder1", "docs"))
+        self.assertTrue(file_system_manager.rename_item("/docs/file1.txt", "notes.md"))
+        self.assertFalse(file_system_manager.rename_item("file2.txt", "docs"))
+        self.assertFalse(file_system_manager.rename_item("missing", "x"))
+
+        self.assertEqual(["docs", "file2.txt"], file_system_manager.list_contents("root"))
+        self.assertEqual([], file_system_manager.list_contents("/folder1"))
+        self.assertEqual(["notes.md"], file_system_manager.list_contents("/docs"))
+        self.assertEqual(["notes.md"], file_system_manager.search_file_like_match("docs", "note"))
+        self.assertEqual([], file_system_manager.search_file_like_match("root", "file1"))
+        self.assertEqual(["+ root", "  + docs", "    - notes.md", "  - file2.txt"],
+                         file_system_manager.list_directory_structure())
+
+    # Paging through a folder is not thrown off by renames between pages
+    def test_rename_between_pages(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_many(("root", f"file{index}.txt", False) for index in range(6))
+        first = file_system_manager.list_contents("root", limit=3)
+        self.assertTrue(file_system_manager.rename_item("file1.txt", "renamed.txt"))
+        self.assertTrue(file_system_manager.rename_item("file4.txt", "other.txt"))
+        self.assertEqual(["file0.txt", "file1.txt", "file2.txt"], first)
+        self.assertEqual(["file3.txt", "other.txt", "file5.txt"],
+                         file_system_manager.list_contents("root", "file2.txt"))
+
+    # Indexed results follow the listing order after a rename, like the serial scan
+    def test_rename_keeps_indexed_order_in_step(self):
+        indexed = FileSystemManagerImpl("root", trigram_index=True)
+        serial = FileSystemManagerImpl("root")
+        for file_system_manager in (indexed, serial):
+            file_system_manager.add_many([("root", "a", True), ("root", "b", True),
+                                          ("a", "log1.txt", False), ("b", "log2.txt", False)])
+            self.assertTrue(file_system_manager.rename_item("a", "c"))
+        self.assertEqual(["c", "b"], serial.list_contents("root"))
+        self.assertEqual(["log1.txt", "log2.txt"], serial.search_file_like_match("root", "log"))
+        self.assertEqual(serial.search_file_like_match("root", "log"), indexed.search_file_like_match("root", "log"))
+        self.assertEqual("log2.txt", indexed.search_file_exact_match("root", "log2.txt"))
+
+    # Deleting detaches the subtree at once; index entries are reclaimed later, a batch at a time
+    def test_delete_item(self):
+        file_system_manager = FileSystemManagerImpl("root", trigram_index=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "folder2", True)
+        file_system_manager.add_many(("folder2", "file{}.txt".format(i), False) for i in range(1500))
+        file_system_manager.add_file_or_folder("root", "file2.txt", False)
+
+        self.assertTrue(file_system_manager.delete_item("folder1"))
+        self.assertFalse(file_system_manager.delete_item("folder2"))
+        self.assertEqual(["file2.txt"], file_system_manager.list_contents("root"))
+        self.assertEqual([], file_system_manager.list_contents("folder2"))
+        self.assertIsNone(file_system_manager.search_file_exact_match("root", "file1.txt"))
+        self.assertEqual(["file2.txt"], file_system_manager.search_file_like_match("root", "file"))
+        self.assertGreater(file_system_manager.reclaim(), 0)
+        self.assertEqual(0, file_system_manager.reclaim())
+        self.assertNotIn("file1.txt", file_system_manager._name_index)
+
+        # the names are free again
+        file_system_manager.add_file_or_folder("root", "folder2", True)
+        self.assertTrue(file_system_manager.add_file_or_folder("folder2", "file1.txt", False))
+        self.assertEqual("file1.txt", file_system_manager.search_file_exact_match("folder2", "file1.txt"))
+        self.assertTrue(file_system_manager.delete_item("/file2.txt"))
+        self.assertEqual(["folder2"], file_system_manager.list_contents("root"))
+
+    # A resolve racing a delete cannot cache the path of the deleted folder again
+    def test_delete_racing_a_resolve_leaves_no_stale_path(self):
+        file_system_manager = FileSystemManagerImpl("root", locking="subtree")
+        file_system_manager.add("/", "a", True)
+        file_system_manager.add("/a", "b", True)
+        invalidate = file_system_manager.path_cache.invalidate
+        racers = []
+
+        def resolve():
+            with file_system_manager._locks.index_reading():
+                file_system_manager._resolve_path("/a/b")
+
+        def invalidate_then_race(node):
+            invalidate(node)
+            racer = threading.Thread(target=resolve)
+            racer.start()
+            racer.join(0.1)
+            racers.append(racer)
+
+        file_system_manager.path_cache.invalidate = invalidate_then_race
+        self.assertTrue(file_system_manager.delete_item("/a/b"))
+        file_system_manager.path_cache.invalidate = invalidate
+        for racer in racers:
+            racer.join()
+        self.assertFalse(file_system_manager.add_file_or_folder("/a/b", "ghost.txt", False))
+        self.assertEqual([], file_system_manager.list_contents("/a/b"))
+
+    # Folder ACLs are inherited; reads and searches skip what the user cannot see
+    def test_permissions_filter_operations(self):
+        file_system_manager = FileSystemManagerImpl("root", trigram_index=True)
+        file_system_manager.add_file_or_folder("root", "public", True)
+        file_system_manager.add_file_or_folder("public", "readme.txt", False)
+        file_system_manager.add_file_or_folder("root", "private", True)
+        file_system_manager.add_file_or_folder("private", "shared", True)
+        file_system_manager.add_file_or_folder("shared", "secret.txt", False)
+        file_system_manager.set_permissions("root", EVERYONE, READ)
+        file_system_manager.set_permissions("private", EVERYONE, 0)
+        file_system_manager.set_permissions("private", "alice", READ | WRITE)
+        # a grant below an unreadable folder gives nothing
+        file_system_manager.set_permissions("shared", "bob", READ)
+
+        self.assertEqual(READ, file_system_manager.get_permissions("readme.txt", "bob"))
+        self.assertEqual(0, file_system_manager.get_permissions("shared", "bob"))
+        self.assertEqual(READ | WRITE, file_system_manager.get_permissions("secret.txt", "alice"))
+        self.assertEqual([], file_system_manager.list_contents("private", user="bob"))
+        self.assertEqual(["shared"], file_system_manager.list_contents("private", user="alice"))
+        self.assertEqual(["readme.txt"], file_system_manager.search_file_like_match("root", ".txt", user="bob"))
+        self.assertEqual(["readme.txt", "secret.txt"],
+                         file_system_manager.search_file_like_match("root", ".txt", user="alice"))
+        self.assertIsNone(file_system_manager.search_file_exact_match("root", "secret.txt", user="bob"))
+        self.assertEqual(["readme.txt"], list(file_system_manager.search_files("root", "*.txt", user="bob")))
+        self.assertEqual(["+ root", "  + public", "    - readme.txt", "  + private"],
+                         file_system_manager.list_directory_structure(user="bob"))
+
+        self.assertFalse(file_system_manager.add_file_or_folder("public", "x.txt", False, user="bob"))
+        self.assertTrue(file_system_manager.add_file_or_folder("shared", "y.txt", False, user="alice"))
+        self.assertFalse(file_system_manager.move_file_or_folder("secret.txt", "public", user="alice"))
+        self.assertFalse(file_system_manager.delete_item("readme.txt", user="alice"))
+
+        # moving a folder out from under the ACL changes what it inherits
+        file_system_manager.move_file_or_folder("shared", "public")
+        self.assertEqual(READ, file_system_manager.get_permissions("secret.txt", "bob"))
+        self.assertEqual("secret.txt", file_system_manager.search_file_exact_match("root", "secret.txt", user="bob"))
+        file_system_manager.set_permissions("public", "bob", None)
+        file_system_manager.set_permissions("root", EVERYONE, None)
+        self.assertEqual(READ | WRITE, file_system_manager.get_permissions("public", "bob"))
+
+    # Invalidating a subtree drops its cached permissions and leaves the rest cached
+    def test_permission_invalidation_stays_in_subtree(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_many([("root", "a", True), ("a", "a1", True), ("root", "b", True)])
+        for folder in ("a1", "b"):
+            file_system_manager.get_permissions(folder, "bob")
+        access = file_system_manager._access
+        a = file_system_manager._find_folder("a")
+        a1 = file_system_manager._find_folder("a1")
+        b = file_system_manager._find_folder("b")
+
+        access.invalidate(a)
+        self.assertNotIn(a, access._cache)
+        self.assertNotIn(a1, access._cache)
+        self.assertIn(b, access._cache)
+        self.assertIn(file_system_manager.root, access._cache)
+
+    # Subtree totals follow adds, moves, deletes and content changes without a walk
+    def test_folder_stats(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "folder2", True)
+        file_system_manager.add_file_or_folder("folder2", "file1.txt", False)
+        file_system_manager.add_file_or_folder("root", "file2.txt", False)
+        file_system_manager.set_file_content("file1.txt", "héllo")
+        file_system_manager.root.get_item("file2.txt").set_content("abc")
+
+        self.assertEqual((2, 2, 9), file_system_manager.get_stats("root"))
+        self.assertEqual((1, 1, 6), file_system_manager.get_stats("folder1"))
+        file_system_manager.write_file("file1.txt", 6, b"!!")
+        self.assertEqual((1, 0, 8), file_system_manager.get_stats("/folder1/folder2"))
+
+        file_system_manager.move_file_or_folder("folder2", "root")
+        self.assertEqual((0, 0, 0), file_system_manager.get_stats("folder1"))
+        self.assertEqual((2, 2, 11), file_system_manager.get_stats("root"))
+        file_system_manager.delete_item("folder2")
+        self.assertEqual((1, 1, 3), file_system_manager.get_stats("root"))
+        self.assertIsNone(file_system_manager.get_stats("folder2"))
+
+    # Content is encoded once when set; sizes and moves reuse the cached length
+    def test_file_size_is_not_recomputed(self):
+        class Counted(str):
+            encodes = 0
+
+            def encode(self, *args):
+                Counted.encodes += 1
+                return super().encode(*args)
+
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("root", "file1.txt", False)
+        file_system_manager.set_file_content("file1.txt", Counted("héllo"))
+        file_system_manager.move_file_or_folder("file1.txt", "folder1")
+        file_system_manager.move_file_or_folder("file1.txt", "root")
+        file1 = file_system_manager.root.get_item("file1.txt")
+        self.assertEqual(6, file1.size())
+        self.assertEqual(1, Counted.encodes)
+
+        file1.append("wörld".encode("utf-8"))
+        self.assertEqual(12, file1.size())
+        self.assertEqual((1, 1, 12), file_system_manager.get_stats("root"))
+
     def test_concurrent_folder_access(self):
         file_system_manager = FileSystemManagerImpl("root")
         file_system_manager.add_file_or_folder("root", "folder1", True)
@@ -271,6 +898,585 @@ class FileSystemManagerTest(unittest.TestCase):
         contents = file_system_manager.list_contents("root")
         self.assertEqual(len(contents), 100)
 
+class SnapshotTest(unittest.TestCase):
+
+    # A snapshot keeps seeing the version it was taken from
+    def test_snapshot_is_isolated_from_later_changes(self):
+        file_system_manager = FileSystemManagerImpl("root", mvcc=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        file_system_manager.add_file_or_folder("root", "folder2", True)
+        snapshot = file_system_manager.snapshot()
+
+        file_system_manager.move_file_or_folder("file1.txt", "folder2")
+        file_system_manager.add_file_or_folder("folder2", "file2.txt", False)
+
+        self.assertEqual(["file1.txt"], snapshot.list_contents("folder1"))
+        self.assertEqual([], snapshot.list_contents("/folder2"))
+        self.assertEqual(["file1.txt"], snapshot.search_file_like_match("root", "file"))
+        self.assertIsNone(snapshot.search_file_exact_match("root", "file2.txt"))
+        self.assertEqual(file_system_manager.list_directory_structure(),
+                         file_system_manager.snapshot().list_directory_structure())
+
+    # Mutations copy only the path to the root and share everything else
+    def test_snapshot_versions_share_untouched_subtrees(self):
+        file_system_manager = FileSystemManagerImpl("root", mvcc=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("root", "folder2", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        before = file_system_manager.snapshot()
+
+        file_system_manager.add_file_or_folder("folder2", "file2.txt", False)
+        after = file_system_manager.snapshot()
+
+        self.assertIsNot(before._root, after._root)
+        self.assertIs(before._root.get_item("folder1"), after._root.get_item("folder1"))
+        self.assertIsNot(before._root.get_item("folder2"), after._root.get_item("folder2"))
+
+    # A huge folder's copy shares all but the changed entries; renames, deletes and rollbacks show up in order
+    def test_large_folder_versions_share_child_maps(self):
+        file_system_manager = FileSystemManagerImpl("root", mvcc=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_many(("folder1", f"file{index}.txt", False) for index in range(1000))
+        before = file_system_manager.snapshot()
+
+        file_system_manager.rename_item("file10.txt", "renamed.txt")
+        file_system_manager.delete_item("file20.txt")
+        file_system_manager.rename_item("folder1", "docs")
+        self.assertEqual([False, False], file_system_manager.apply_batch([
+            MoveOperation("file30.txt", "root"), AddOperation("missing", "x.txt", False)], atomic=True))
+        after = file_system_manager.snapshot()
+
+        self.assertEqual(file_system_manager.list_contents("docs"), after.list_contents("docs"))
+        self.assertEqual("renamed.txt", after.list_contents("/docs", "file9.txt", 1)[0])
+        self.assertEqual(1000, len(before.list_contents("folder1")))
+        self.assertEqual([], before.list_contents("docs"))
+        self.assertEqual(file_system_manager.list_directory_structure(), after.list_directory_structure())
+        old_leaf = before._root.get_item("folder1")._Folder__order._root.children[-1]
+        self.assertIs(old_leaf, after._root.get_item("docs")._Folder__order._root.children[-1])
+
+    # Versions nobody holds a handle on are reclaimed
+    def test_old_versions_are_reclaimed(self):
+        file_system_manager = FileSystemManagerImpl("root", mvcc=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        snapshot = file_system_manager.snapshot()
+        old_root = weakref.ref(snapshot._root)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+
+        self.assertIsNotNone(old_root())
+        snapshot.close()
+        self.assertIsNone(old_root())
+        with self.assertRaises(RuntimeError):
+            snapshot.list_contents("root")
+
+    # Snapshots need the manager to run in mvcc mode
+    def test_snapshot_requires_mvcc(self):
+        with self.assertRaises(RuntimeError):
+            FileSystemManagerImpl("root").snapshot()
+
+class ColumnarTreeTest(unittest.TestCase):
+
+    def _build(self):
+        file_system_manager = FileSystemManagerImpl("root")
+        file_system_manager.add_many([("root", "folder1", True), ("folder1", "file1.txt", False),
+                                      ("root", "folder2", True), ("folder2", "file2.jpg", False),
+                                      ("folder1", "subfolder", True), ("subfolder", "file3.txt", False)])
+        return file_system_manager
+
+    # Handles over the columns answer the same reads as the object tree
+    def test_columnar_tree_matches_object_tree(self):
+        file_system_manager = self._build()
+        snapshot = FileSystemSnapshot(ColumnarTree.from_tree(file_system_manager.root).root())
+
+        self.assertEqual(file_system_manager.list_directory_structure(), snapshot.list_directory_structure())
+        self.assertEqual(["file1.txt", "subfolder"], snapshot.list_contents("folder1"))
+        self.assertEqual(["subfolder"], snapshot.list_contents("/folder1", cursor="file1.txt"))
+        self.assertEqual(["file1.txt", "file3.txt"], snapshot.search_file_like_match("root", ".TXT"))
+        self.assertEqual("file3.txt", snapshot.search_file_exact_match("folder1", "file3.txt"))
+
+    # Children sit in one contiguous id range and handles are cheap value objects
+    def test_columnar_handles(self):
+        tree = ColumnarTree.from_tree(self._build().root)
+        root = tree.root()
+        folder1 = root.get_item("folder1")
+
+        self.assertIsInstance(folder1, Folder)
+        self.assertEqual(folder1, root.get_item("folder1"))
+        self.assertEqual(root, folder1.get_parent)
+        self.assertEqual(["folder1", "folder2"], [item.get_name for item in root.get_items])
+        self.assertIsNone(root.get_item("file1.txt"))
+        with self.assertRaises(TypeError):
+            folder1.add_item(Folder("x"))
+
+    # Nodes have no per-instance __dict__
+    def test_nodes_use_slots(self):
+        file_system_manager = self._build()
+        self.assertFalse(hasattr(file_system_manager.root, "__dict__"))
+        self.assertFalse(hasattr(file_system_manager.root.get_item("folder1").get_item("file1.txt"), "__dict__"))
+
+class ChunkStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ChunkStore(os.path.join(self.directory.name, "blob"), chunk_size=16, segment_size=4096)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    # get_content/set_content keep working on chunk-backed files
+    def test_file_content_round_trips_through_chunks(self):
+        file_system_manager = FileSystemManagerImpl("root", content_store=self.store)
+        file_system_manager.add_file_or_folder("root", "file1.txt", False)
+        file1 = file_system_manager.root.get_item("file1.txt")
+
+        file1.set_content("héllo wörld, spread over several chunks")
+        self.assertEqual("héllo wörld, spread over several chunks", file1.get_content())
+        self.assertEqual(3, len(file1._content.chunks))
+        file1.set_content("short")
+        self.assertEqual("short", file1.content)
+        self.assertEqual(1, self.store.chunk_count)
+
+    # Deleted files give their chunks back once reclaimed
+    def test_delete_frees_chunks(self):
+        file_system_manager = FileSystemManagerImpl("root", content_store=self.store)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        file_system_manager.set_file_content("file1.txt", "x" * 40)
+        self.assertEqual(3, self.store.chunk_count)
+
+        file_system_manager.delete_item("folder1")
+        file_system_manager.reclaim()
+        self.assertEqual(0, self.store.chunk_count)
+
+    # Ranged reads are zero-copy views into the mapping; writes and appends patch in place
+    def test_ranged_read_write_append(self):
+        file_system_manager = FileSystemManagerImpl("root", content_store=self.store)
+        file_system_manager.add_file_or_folder("root", "data.bin", False)
+        data = file_system_manager.root.get_item("data.bin")
+        data.append(bytes(range(40)))
+        data.write(14, b"XXXX")
+        data.append(b"tail")
+
+        views = data.read(10, 12)
+        self.assertTrue(all(isinstance(view, memoryview) for view in views))
+        self.assertEqual(bytes(range(10, 14)) + b"XXXX" + bytes(range(18, 22)), b"".join(views))
+        self.assertEqual(b"tail", b"".join(data.read(40)))
+        self.assertEqual(44, data.size())
+        with self.assertRaises(ValueError):
+            data.write(100, b"gap")
+
+    # The blob grows segment by segment without invalidating earlier views
+    def test_store_grows_past_first_segment(self):
+        file_system_manager = FileSystemManagerImpl("root", content_store=self.store)
+        file_system_manager.add_file_or_folder("root", "big.bin", False)
+        big = file_system_manager.root.get_item("big.bin")
+        big.append(b"a" * 4096)
+        first = big.read(0, 4)
+        big.append(b"b" * 4096)
+
+        self.assertEqual(b"aaaa", bytes(first[0]))
+        self.assertEqual(b"b" * 16, b"".join(big.read(8176, 16)))
+        for view in first:
+            view.release()
+
+class PersistenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tree.snap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # The loaded tree has the same shape, order, content and indexes as the saved one
+    def test_snapshot_round_trip(self):
+        file_system_manager = FileSystemManagerImpl("root", trigram_index=True)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "folder2", True)
+        file_system_manager.add_file_or_folder("folder2", "file1.txt", False)
+        file_system_manager.add_file_or_folder("root", "file1.txt", False)
+        file_system_manager.add_file_or_folder("folder1", "notes.md", False)
+        file_system_manager.root.get_item("file1.txt").set_content("héllo")
+        expected = file_system_manager.list_directory_structure()
+        self.assertEqual(6, file_system_manager.save_snapshot(self.path))
+
+        loaded = FileSystemManagerImpl("other", trigram_index=True)
+        self.assertEqual(6, loaded.load_snapshot(self.path))
+        self.assertEqual(expected, loaded.list_directory_structure())
+        self.assertEqual("héllo", loaded.root.get_item("file1.txt").get_content())
+        self.assertEqual(file_system_manager.get_stats("root"), loaded.get_stats("root"))
+        self.assertEqual(file_system_manager.get_stats("folder1"), loaded.get_stats("folder1"))
+        self.assertEqual("file1.txt", loaded.search_file_exact_match("folder1", "file1.txt"))
+        self.assertEqual(["notes.md"], loaded.search_file_like_match("root", "note"))
+        self.assertEqual(["file1.txt"], loaded.list_contents("/folder1/folder2"))
+
+        # the rebuilt labels and indexes keep working for further edits
+        loaded.move_file_or_folder("folder2", "root")
+        self.assertEqual(["folder1", "file1.txt", "folder2"], loaded.list_contents("root"))
+        loaded.move_file_or_folder("folder2", "folder1")
+        self.assertFalse(loaded.move_file_or_folder("folder1", "folder2"))
+
+    def test_load_rejects_foreign_files(self):
+        with open(self.path, "wb") as handle:
+            handle.write(b"not a snapshot at all, definitely")
+        with self.assertRaises(ValueError):
+            FileSystemManagerImpl("root").load_snapshot(self.path)
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _populate(self, file_system_manager):
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        file_system_manager.add_file_or_folder("folder1", "file1.txt", False)
+        file_system_manager.add_many([("root", "folder2", True), ("folder2", "file1.txt", False)])
+        file_system_manager.set_file_content("/folder1/file1.txt", "héllo")
+        file_system_manager.write_file("/folder1/file1.txt", 6, b" world")
+        file_system_manager.move_file_or_folder("folder2", "folder1")
+        file_system_manager.add_file_or_folder("root", "tmp", True)
+        file_system_manager.rename_item("/folder1/folder2", "folder3")
+        file_system_manager.delete_item("tmp")
+
+    def _recovered(self, **kwargs):
+        journal = Journal(self.directory.name, **kwargs)
+        self.addCleanup(journal.close)
+        file_system_manager = FileSystemManagerImpl("root", journal=journal)
+        file_system_manager.recover()
+        return file_system_manager
+
+    # Recovery replays the logged mutations, including content writes
+    def test_recover_replays_log(self):
+        with Journal(self.directory.name) as journal:
+            file_system_manager = FileSystemManagerImpl("root", journal=journal)
+            self._populate(file_system_manager)
+            expected = file_system_manager.list_directory_structure()
+
+        recovered = self._recovered()
+        self.assertEqual(expected, recovered.list_directory_structure())
+        self.assertEqual("héllo world", recovered.root.get_item("folder1").get_item("file1.txt").get_content())
+
+    # Names that would not survive the journal's paths are refused up front
+    def test_names_must_be_path_segments(self):
+        with Journal(self.directory.name) as journal:
+            file_system_manager = FileSystemManagerImpl("root", journal=journal)
+            file_system_manager.add_file_or_folder("root", "folder1", True)
+            self.assertFalse(file_system_manager.add_file_or_folder("root", "a/b", True))
+            self.assertFalse(file_system_manager.add("/folder1", "", False))
+            self.assertEqual([False, True], file_system_manager.add_many([("root", "x/y.txt", False),
+                                                                           ("folder1", "x.txt", False)]))
+            self.assertFalse(file_system_manager.rename_item("/folder1/x.txt", "sub/x.txt"))
+            self.assertFalse(file_system_manager.rename_item("folder1", ""))
+            expected = file_system_manager.list_directory_structure()
+
+        self.assertEqual(["+ root", "  + folder1", "    - x.txt"], expected)
+        self.assertEqual(expected, self._recovered().list_directory_structure())
+
+    # A checkpoint folds the log into a snapshot; later mutations land in the new segment
+    def test_checkpoint_compacts_log(self):
+        with Journal(self.directory.name, sync=SYNC_GROUP, group_commit_ms=1) as journal:
+            file_system_manager = FileSystemManagerImpl("root", journal=journal)
+            self._populate(file_system_manager)
+            file_system_manager.checkpoint(background=True).join()
+            file_system_manager.add_file_or_folder("folder2", "late.txt", False)
+            expected = file_system_manager.list_directory_structure()
+            self.assertEqual(1, len(journal.segments_from(0)))
+
+        recovered = self._recovered()
+        self.assertEqual(expected, recovered.list_directory_structure())
+
+    # Chunks the snapshot refers to are neither reused nor overwritten before the next checkpoint
+    def test_lost_log_tail_recovers_snapshot_content(self):
+        blob = os.path.join(self.directory.name, "blob")
+        with ChunkStore(blob, chunk_size=16, segment_size=mmap.ALLOCATIONGRANULARITY) as store, \
+                Journal(self.directory.name, sync=SYNC_GROUP, group_commit_ms=1) as journal:
+            file_system_manager = FileSystemManagerImpl("root", content_store=store, journal=journal)
+            file_system_manager.add_file_or_folder("root", "F", False)
+            file_system_manager.add_file_or_folder("root", "H", False)
+            file_system_manager.set_file_content("F", "hello")
+            file_system_manager.set_file_content("H", "0123456789abcdefXYZ")
+            file_system_manager.checkpoint()
+            file_system_manager.set_file_content("F", "")
+            file_system_manager.add_file_or_folder("root", "G", False)
+            file_system_manager.set_file_content("G", "WORLD")
+            file_system_manager.write_file("H", 2, b"__")
+            self.assertEqual("01__456789abcdefXYZ", file_system_manager.root.get_item("H").get_content())
+            segments = journal.segments_from(0)
+        # the crash loses everything logged after the checkpoint
+        for segment in segments:
+            open(segment, "wb").close()
+
+        with ChunkStore(blob, chunk_size=16, segment_size=mmap.ALLOCATIONGRANULARITY) as store, \
+                Journal(self.directory.name) as journal:
+            recovered = FileSystemManagerImpl("root", content_store=store, journal=journal)
+            recovered.recover()
+            self.assertEqual(["F", "H"], recovered.list_contents("root"))
+            self.assertEqual("hello", recovered.root.get_item("F").get_content())
+            self.assertEqual("0123456789abcdefXYZ", recovered.root.get_item("H").get_content())
+
+    # Restarting on the same blob reuses the chunks the recovered tree does not refer to
+    def test_reopened_blob_reuses_free_chunks(self):
+        blob = os.path.join(self.directory.name, "blob")
+        with ChunkStore(blob, chunk_size=16, segment_size=mmap.ALLOCATIONGRANULARITY) as store, \
+                Journal(self.directory.name) as journal:
+            file_system_manager = FileSystemManagerImpl("root", content_store=store, journal=journal)
+            file_system_manager.add_file_or_folder("root", "F", False)
+            file_system_manager.set_file_content("F", "x" * 40)
+            file_system_manager.checkpoint()
+        size = os.path.getsize(blob)
+
+        for restart in range(3):
+            with ChunkStore(blob, chunk_size=16, segment_size=mmap.ALLOCATIONGRANULARITY) as store, \
+                    Journal(self.directory.name) as journal:
+                recovered = FileSystemManagerImpl("root", content_store=store, journal=journal)
+                recovered.recover()
+                # F and the G files of earlier runs
+                self.assertEqual(3 * (restart + 1), store.chunk_count)
+                recovered.add_file_or_folder("root", f"G{restart}", False)
+                recovered.set_file_content(f"G{restart}", "y" * 40)
+                recovered.checkpoint()
+                self.assertEqual("x" * 40, recovered.root.get_item("F").get_content())
+        self.assertEqual(size, os.path.getsize(blob))
+
+    # A torn frame at the end of the log is dropped, everything before it survives
+    def test_torn_tail_is_ignored(self):
+        with Journal(self.directory.name) as journal:
+            file_system_manager = FileSystemManagerImpl("root", journal=journal)
+            file_system_manager.add_file_or_folder("root", "folder1", True)
+            segment = journal.segments_from(0)[-1]
+        with open(segment, "ab") as handle:
+            handle.write(b"\x40\x00\x00\x00garbage")
+
+        recovered = self._recovered()
+        self.assertEqual(["folder1"], recovered.list_contents("root"))
+        recovered.add_file_or_folder("folder1", "file1.txt", False)
+        self.assertEqual(["file1.txt"], self._recovered().list_contents("folder1"))
+
+
+class AsyncFileSystemManagerTest(unittest.TestCase):
+
+    # Offloaded calls give the same answers as the manager
+    def test_mirrors_manager(self):
+        async def scenario():
+            async with AsyncFileSystemManager(FileSystemManagerImpl("root"), page_size=2) as file_system_manager:
+                return await calls(file_system_manager)
+
+        async def calls(file_system_manager):
+            self.assertTrue(await file_system_manager.add_file_or_folder("root", "folder1", True))
+            for index in range(5):
+                self.assertTrue(await file_system_manager.add_file_or_folder("folder1", f"file{index}.txt", False))
+            self.assertEqual("file3.txt", await file_system_manager.search_file_exact_match("root", "file3.txt"))
+            self.assertEqual(5, len(await file_system_manager.search_file_like_match("root", "file")))
+            contents = [name async for name in file_system_manager.iter_contents("folder1")]
+            found = [name async for name in file_system_manager.search_files("root", "file[0-2].txt")]
+            return contents, found, await file_system_manager.get_stats("root")
+
+        contents, found, stats = asyncio.run(scenario())
+        self.assertEqual([f"file{index}.txt" for index in range(5)], contents)
+        self.assertEqual(["file0.txt", "file1.txt", "file2.txt"], found)
+        self.assertEqual(5, stats.file_count)
+
+    # Streamed bulk input is applied in order, batch by batch
+    def test_add_many_streams_in_batches(self):
+        async def items():
+            yield "root", "folder1", True
+            for index in range(10):
+                yield "folder1", f"file{index}.txt", False
+
+        async def scenario():
+            manager = FileSystemManagerImpl("root")
+            file_system_manager = AsyncFileSystemManager(manager, max_concurrency=1, batch_size=3)
+            results = await file_system_manager.add_many(items())
+            return manager, results
+
+        manager, results = asyncio.run(scenario())
+        self.assertEqual([True] * 11, results)
+        self.assertEqual(10, len(manager.list_contents("folder1")))
+
+    # Searches racing writes see a consistent tree and never a changing dict
+    def test_search_files_while_adding(self):
+        async def scenario():
+            manager = FileSystemManagerImpl("root")
+            manager.add_many([("root", "folder1", True)] + [("folder1", f"file{index}.txt", False)
+                                                             for index in range(2000)])
+            async with AsyncFileSystemManager(manager, page_size=64) as file_system_manager:
+                adds = [file_system_manager.add_file_or_folder("folder1", f"new{index}.txt", False)
+                        for index in range(200)]
+                searches = [self._collect(file_system_manager.search_files("folder1", "*.txt")) for _ in range(20)]
+                results = await asyncio.gather(*adds, *searches)
+            return manager, results[:200], results[200:]
+
+        manager, added, found = asyncio.run(scenario())
+        self.assertEqual([True] * 200, added)
+        self.assertEqual(2200, len(manager.list_contents("folder1")))
+        for names in found:
+            self.assertTrue(2000 <= len(names) <= 2200)
+            self.assertEqual(len(names), len(set(names)))
+
+    # A call waiting on the manager's lock leaves the event loop free
+    def test_waiting_on_lock_does_not_block_loop(self):
+        async def scenario():
+            manager = FileSystemManagerImpl("root")
+            manager.add_file_or_folder("root", "folder1", True)
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(None)
+                    await asyncio.sleep(0.001)
+
+            async with AsyncFileSystemManager(manager) as file_system_manager:
+                with manager._locks._lock.write_locked():
+                    call = asyncio.ensure_future(file_system_manager.get_stats("folder1"))
+                    background = asyncio.ensure_future(ticker())
+                    await asyncio.sleep(0.05)
+                    self.assertFalse(call.done())
+                # released from the loop's thread; the offloaded call finishes now
+                stats = await call
+                background.cancel()
+            return stats, len(ticks)
+
+        stats, ticks = asyncio.run(scenario())
+        self.assertEqual(0, stats.file_count)
+        self.assertGreater(ticks, 5)
+
+    # Leaving the context waits for queued writes without stalling the loop
+    def test_closing_does_not_block_loop(self):
+        async def scenario():
+            manager = FileSystemManagerImpl("root")
+            ticks = []
+            held = threading.Event()
+
+            def hold_lock():
+                with manager._locks._lock.write_locked():
+                    held.set()
+                    time.sleep(0.1)
+
+            async def ticker():
+                while True:
+                    ticks.append(None)
+                    await asyncio.sleep(0.001)
+
+            holder = threading.Thread(target=hold_lock)
+            holder.start()
+            held.wait()
+            background = asyncio.ensure_future(ticker())
+            async with AsyncFileSystemManager(manager) as file_system_manager:
+                write = asyncio.ensure_future(file_system_manager.add_file_or_folder("root", "folder1", True))
+                await asyncio.sleep(0)
+            background.cancel()
+            holder.join()
+            return await write, manager.list_contents("root"), len(ticks)
+
+        added, contents, ticks = asyncio.run(scenario())
+        self.assertTrue(added)
+        self.assertEqual(["folder1"], contents)
+        self.assertGreater(ticks, 5)
+
+    @staticmethod
+    async def _collect(names):
+        return [name async for name in names]
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    # Every outermost call leaves one sample, walks report the nodes they visited
+    def test_records_timings_and_visits(self):
+        metrics = InMemoryMetrics()
+        file_system_manager = FileSystemManagerImpl("root", metrics=metrics)
+        file_system_manager.add_file_or_folder("root", "folder1", True)
+        for index in range(10):
+            file_system_manager.add_file_or_folder("folder1", f"file{index}.txt", False)
+        file_system_manager.add("/folder1", "folder2", True)
+        self.assertEqual(10, len(file_system_manager.search_file_like_match("root", "file")))
+
+        summary = metrics.summary()
+        self.assertEqual(11, summary["add_file_or_folder"].count)
+        # add() delegates to add_file_or_folder, which is not counted again
+        self.assertEqual(1, summary["add"].count)
+        self.assertEqual(12, summary["search_file_like_match"].mean_visited)
+        self.assertLessEqual(summary["search_file_like_match"].p50, summary["search_file_like_match"].max)
+
+    # Lazy results are recorded once consumed, with the nodes visited meanwhile
+    def test_lazy_results_are_recorded_when_consumed(self):
+        metrics = InMemoryMetrics()
+        file_system_manager = FileSystemManagerImpl("root", metrics=metrics)
+        for index in range(5):
+            file_system_manager.add_file_or_folder("root", f"file{index}.txt", False)
+        files = file_system_manager.search_files("root", "*.txt")
+        self.assertNotIn("search_files", metrics.summary())
+        self.assertEqual(5, len(list(files)))
+        self.assertEqual(1, metrics.summary()["search_files"].count)
+        self.assertEqual(5, metrics.summary()["search_files"].mean_visited)
+
+
+class OrderListTest(unittest.TestCase):
+
+    # Labels stay strictly increasing under adversarial inserts into one gap
+    def test_labels_stay_ordered_when_gap_runs_out(self):
+        order = OrderList()
+        first = order.insert_after(order.head)
+        last = order.insert_after(first)
+        expected = [first, last]
+        for _ in range(2000):
+            expected.insert(1, order.insert_after(first))
+
+        labels = [token.label for token in order.iter_run(first, last)]
+        self.assertEqual(len(expected), len(labels))
+        self.assertEqual(sorted(labels), labels)
+        self.assertEqual(len(set(labels)), len(labels))
+        self.assertEqual([token.label for token in expected], labels)
+
+class ConcurrencyTest(unittest.TestCase):
+
+    def _hammer(self, file_system_manager):
+        for i in range(20):
+            file_system_manager.add_file_or_folder("root", "folder{}".format(i), True)
+            file_system_manager.add_file_or_folder("folder{}".format(i), "file{}.txt".format(i), False)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for step in range(200):
+                choice = rng.random()
+                if choice < 0.4:
+                    file_system_manager.move_file_or_folder("folder{}".format(rng.randrange(20)),
+                                                            rng.choice(["root", "folder{}".format(rng.randrange(20))]))
+                elif choice < 0.6:
+                    file_system_manager.add_file_or_folder("folder{}".format(rng.randrange(20)),
+                                                           "extra{}_{}.txt".format(seed, step), False)
+                elif choice < 0.8:
+                    file_system_manager.search_file_like_match("folder{}".format(rng.randrange(20)), "file")
+                else:
+                    file_system_manager.list_directory_structure()
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        structure = file_system_manager.list_directory_structure()
+        names = [line.strip()[2:] for line in structure]
+        self.assertEqual(len(names), len(set(names)))
+        for i in range(20):
+            self.assertIn("folder{}".format(i), names)
+            self.assertIn("file{}.txt".format(i), names)
+        extras = [name for name in names if name.startswith("extra")]
+        self.assertEqual(len(extras), len(file_system_manager.search_file_like_match("root", "extra")))
+
+    # Concurrent moves, adds and reads neither lose nor duplicate nodes
+    def test_concurrent_mutations_with_global_lock(self):
+        self._hammer(FileSystemManagerImpl("root", trigram_index=True, render_cache=True))
+
+    # The same holds with per-subtree intention locks
+    def test_concurrent_mutations_with_subtree_locks(self):
+        self._hammer(FileSystemManagerImpl("root", trigram_index=True, render_cache=True, locking="subtree"))
+
 if __name__ == "__main__":
     logger.info("Starting unit tests")
     unittest.main(testRunner=LoggingTestRunner())